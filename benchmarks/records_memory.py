@@ -0,0 +1,60 @@
+"""
+Compares the memory held by documents as dicts and as records (see pdmodels.extensions.records)
+
+    python -m benchmarks.records_memory [count]
+"""
+import datetime
+import sys
+import time
+import tracemalloc
+
+import pdmodels
+from pdmodels.extensions.records import RecordMixin
+
+
+class Address(pdmodels.DefinedDict):
+    street = pdmodels.StringField()
+    city = pdmodels.StringField()
+    zip_code = pdmodels.StringField()
+
+
+class Customer(RecordMixin, pdmodels.DefinedDict):
+    id = pdmodels.IntField(is_required=True)
+    name = pdmodels.StringField()
+    email = pdmodels.StringField()
+    active = pdmodels.BoolField(default=True)
+    score = pdmodels.FloatField()
+    created = pdmodels.DateTimeField()
+    tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+    address = pdmodels.DefinedDictField(model=Address)
+
+
+def make_document(i):
+    return Customer.clean_document({"id": i, "name": "customer", "email": "customer@example.com", "score": 1.5,
+        "created": datetime.datetime(2017, 5, 1), "tags": ["a"],
+        "address": {"street": "street", "city": "city", "zip_code": "00000"}})
+
+
+def measure(count, convert):
+    """returns (bytes held, seconds) to hold count documents made by convert
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        values = [ convert(make_document(i)) for i in range(count) ]
+        elapsed = time.perf_counter() - start
+        return tracemalloc.get_traced_memory()[0], elapsed
+    finally:
+        tracemalloc.stop()
+
+
+def main(count=100000):
+    dict_bytes, dict_seconds = measure(count, lambda document: document)
+    record_bytes, record_seconds = measure(count, Customer.to_record)
+    print("dicts   : {0:>12,} bytes {1:>7.3f}s".format(dict_bytes, dict_seconds))
+    print("records : {0:>12,} bytes {1:>7.3f}s".format(record_bytes, record_seconds))
+    print("records use {0:.0%} of the memory of dicts".format(record_bytes / dict_bytes))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
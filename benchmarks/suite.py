@@ -0,0 +1,343 @@
+"""
+Benchmarks of the operations of a model over synthetic schemas of different shapes
+
+    python -m benchmarks.suite [--output results.json] [--compare baseline.json] [--threshold 1.2]
+                               [--schema NAME ...] [--operation NAME ...] [--number N] [--repeat N]
+
+Each operation is timed over `number` documents, `repeat` times, the best and median time per document
+are reported in microseconds, with the peak memory allocated during one run (measured with tracemalloc,
+in a separate run so it does not slow down the timing). The documents an operation modifies are copied
+before the timing starts.
+
+The results are printed as a table and written as JSON with --output. With --compare, the operations
+slower than the baseline by more than --threshold (on the best time) are listed and the exit code is 1.
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pdmodels
+from pdmodels.extensions.binary import BinaryMixin
+from pdmodels.extensions.labels import LabelMixin
+from pdmodels.extensions.storage import JsonStorageMixin
+
+
+WHEN = datetime.datetime(2017, 5, 1, 10, 30, 15, 123456)
+
+
+class Base(LabelMixin, JsonStorageMixin, BinaryMixin, pdmodels.DefinedDict):
+    pass
+
+
+#################################### Schemas ####################################
+def flat_wide():
+    """a single model with 60 fields of the common types
+    """
+    fields = {}
+    for i in range(10):
+        fields["s{0}".format(i)] = pdmodels.StringField(is_required=i == 0)
+        fields["i{0}".format(i)] = pdmodels.IntField(min=0, max=1000)
+        fields["f{0}".format(i)] = pdmodels.FloatField()
+        fields["b{0}".format(i)] = pdmodels.BoolField(default=False)
+        fields["d{0}".format(i)] = pdmodels.DateTimeField()
+        fields["c{0}".format(i)] = pdmodels.StringField(choices={"low": 0, "high": 1}, labels="internal")
+    model = type("FlatWide", (Base, ), fields)
+
+    def make(rng):
+        document = {}
+        for i in range(10):
+            document["s{0}".format(i)] = "value {0}".format(rng.randrange(1000))
+            document["i{0}".format(i)] = rng.randrange(1000)
+            document["f{0}".format(i)] = rng.random()
+            document["b{0}".format(i)] = rng.random() < 0.5
+            document["d{0}".format(i)] = WHEN + datetime.timedelta(seconds=rng.randrange(10 ** 6))
+            document["c{0}".format(i)] = rng.choice(["low", "high"])
+        return document
+    return model, make, {"s1": "updated", "i1": 1, "d1": WHEN}
+
+
+def deep_nested(depth=6):
+    """a chain of depth models, each one nesting the next one
+    """
+    model = None
+    for level in reversed(range(depth)):
+        fields = {
+            "name": pdmodels.StringField(is_required=True),
+            "count": pdmodels.IntField(),
+            "at": pdmodels.DateTimeField(),
+            "secret": pdmodels.StringField(labels="internal"),
+        }
+        if model is not None:
+            fields["child"] = pdmodels.DefinedDictField(model=model)
+        model = type("DeepNested{0}".format(level), (Base, ), fields)
+
+    def make(rng, level=0):
+        document = {"name": "level {0}".format(level), "count": rng.randrange(100), "at": WHEN, "secret": "s"}
+        if level < depth - 1:
+            document["child"] = make(rng, level + 1)
+        return document
+
+    update = {"child": {"child": {"child": {"name": "updated", "count": 1}}}}
+    return model, make, update
+
+
+def list_heavy(size=50):
+    """lists of values and lists of nested models
+    """
+    class Item(Base):
+        sku = pdmodels.StringField(is_required=True)
+        quantity = pdmodels.IntField(min=0)
+        price = pdmodels.FloatField()
+        added = pdmodels.DateTimeField()
+
+    class ListHeavy(Base):
+        id = pdmodels.StringField(store_field="_id")
+        tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+        scores = pdmodels.ListField(inner_type=pdmodels.IntField())
+        flags = pdmodels.ListField(inner_type=pdmodels.StringField(choices=["new", "hot", "sale"]))
+        items = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Item))
+
+    def make(rng):
+        return {
+            "id": str(rng.randrange(10 ** 6)),
+            "tags": ["tag{0}".format(rng.randrange(100)) for _ in range(size)],
+            "scores": [rng.randrange(1000) for _ in range(size)],
+            "flags": [rng.choice(["new", "hot", "sale"]) for _ in range(size)],
+            "items": [{"sku": "sku{0}".format(i), "quantity": rng.randrange(10), "price": rng.random(), "added": WHEN}
+                      for i in range(size)],
+        }
+    return ListHeavy, make, {"tags": ["a", "b"]}
+
+
+def map_heavy(size=50):
+    """maps of values and maps of nested models
+    """
+    class Stat(Base):
+        count = pdmodels.IntField()
+        mean = pdmodels.FloatField()
+
+    class MapHeavy(Base):
+        id = pdmodels.StringField()
+        counts = pdmodels.MapField(inner_type=pdmodels.IntField())
+        names = pdmodels.MapField(inner_type=pdmodels.StringField())
+        stats = pdmodels.MapField(inner_type=pdmodels.DefinedDictField(model=Stat))
+
+    def make(rng):
+        return {
+            "id": str(rng.randrange(10 ** 6)),
+            "counts": {"k{0}".format(i): rng.randrange(1000) for i in range(size)},
+            "names": {"k{0}".format(i): "name{0}".format(i) for i in range(size)},
+            "stats": {"k{0}".format(i): {"count": rng.randrange(100), "mean": rng.random()} for i in range(size)},
+        }
+    return MapHeavy, make, {"counts": {"k1": 1, "new": 2}, "stats": {"k2": {"count": 3}}}
+
+
+def polymorphic(size=20):
+    """a list of VariableDefinedDictField of three models
+    """
+    class Text(Base):
+        type = pdmodels.StringField(fixed_value="text")
+        body = pdmodels.StringField()
+
+    class Image(Base):
+        type = pdmodels.StringField(fixed_value="image")
+        url = pdmodels.StringField()
+        width = pdmodels.IntField()
+        height = pdmodels.IntField()
+
+    class Event(Base):
+        type = pdmodels.StringField(fixed_value="event")
+        at = pdmodels.DateTimeField()
+        where = pdmodels.StringField(labels="internal")
+
+    models = {"text": Text, "image": Image, "event": Event}
+
+    class Polymorphic(Base):
+        id = pdmodels.StringField()
+        main = pdmodels.VariableDefinedDictField("type", models)
+        blocks = pdmodels.ListField(inner_type=pdmodels.VariableDefinedDictField("type", models))
+
+    def block(rng):
+        kind = rng.choice(sorted(models))
+        if kind == "text":
+            return {"type": "text", "body": "lorem ipsum"}
+        if kind == "image":
+            return {"type": "image", "url": "http://example.com/a.png", "width": 640, "height": 480}
+        return {"type": "event", "at": WHEN, "where": "here"}
+
+    def make(rng):
+        return {"id": str(rng.randrange(10 ** 6)), "main": block(rng), "blocks": [block(rng) for _ in range(size)]}
+    return Polymorphic, make, {"main": {"type": "text", "body": "updated"}}
+
+
+SCHEMAS = {
+    "flat_wide": flat_wide,
+    "deep_nested": deep_nested,
+    "list_heavy": list_heavy,
+    "map_heavy": map_heavy,
+    "polymorphic": polymorphic,
+}
+
+
+#################################### Operations ####################################
+# each operation is (prepare, call): prepare(model, documents, update) returns the arguments of each
+# call(model, *arguments), it is not timed
+def _copies(model, documents, update):
+    return [ (copy.deepcopy(document), ) for document in documents ]
+
+
+def _same(model, documents, update):
+    return [ (document, ) for document in documents ]
+
+
+def _stored(model, documents, update):
+    stored = [ copy.deepcopy(document) for document in documents ]
+    for document in stored:
+        model.dumps_json(document)
+    return [ (document, ) for document in stored ]
+
+
+def _json_bytes(model, documents, update):
+    return [ (model.dumps_bytes(document, default=str), ) for document in documents ]
+
+
+def _binary(model, documents, update):
+    return [ (model.dumps_binary(document), ) for document in documents ]
+
+
+def _deepcopy_dumps_json_bytes(model, document):
+    stored = copy.deepcopy(document)
+    model.dumps_json(stored)
+    return json.dumps(stored, default=str).encode("utf-8")
+
+
+OPERATIONS = {
+    "get_document_errors": (_same, lambda model, document: model.get_document_errors(document)),
+    "is_document_valid": (_same, lambda model, document: model.is_document_valid(document)),
+    "clean_document": (_copies, lambda model, document: model.clean_document(document)),
+    "update": (lambda model, documents, update: [ (copy.deepcopy(document), copy.deepcopy(update)) for document in documents ],
+               lambda model, document, update: model.update(document, update)),
+    "make_default": (lambda model, documents, update: [ () for _ in documents ], lambda model: model.make_default()),
+    "clean_labels": (_copies, lambda model, document: model.clean_labels(document, "internal")),
+    "dumps_json": (_copies, lambda model, document: model.dumps_json(document)),
+    "loads_json": (_stored, lambda model, document: model.loads_json(document)),
+    "dumps_bytes": (_same, lambda model, document: model.dumps_bytes(document, default=str)),
+    # what dumps_bytes replaces, encoding the stored form without modifying the document
+    "deepcopy_dumps_json_bytes": (_same, lambda model, document: _deepcopy_dumps_json_bytes(model, document)),
+    "from_json_bytes": (_json_bytes, lambda model, data: model.from_json_bytes(data, clean=False)),
+    "dumps_binary": (_same, lambda model, document: model.dumps_binary(document)),
+    "loads_binary": (_binary, lambda model, data: model.loads_binary(data)),
+}
+
+
+#################################### Runner ####################################
+def bench(model, documents, update, operation, repeat):
+    """returns the result of an operation over documents
+    """
+    prepare, call = OPERATIONS[operation]
+    times = []
+    for _ in range(repeat):
+        calls = prepare(model, documents, update)
+        start = time.perf_counter()
+        for arguments in calls:
+            call(model, *arguments)
+        times.append((time.perf_counter() - start) / len(calls))
+
+    calls = prepare(model, documents, update)
+    tracemalloc.start()
+    try:
+        for arguments in calls:
+            call(model, *arguments)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "best_us": min(times) * 1e6,
+        "median_us": statistics.median(times) * 1e6,
+        "peak_bytes": peak,
+    }
+
+
+def run(schemas=None, operations=None, number=200, repeat=5, seed=0):
+    """returns the results of the operations over the schemas, as written to the JSON output
+    """
+    results = []
+    for schema in schemas or SCHEMAS:
+        model, make, update = SCHEMAS[schema]()
+        rng = random.Random(seed)
+        documents = [ model.clean_document(make(rng)) for _ in range(number) ]
+        for operation in operations or OPERATIONS:
+            result = { "schema": schema, "operation": operation, "number": number, "repeat": repeat }
+            result.update(bench(model, documents, update, operation, repeat))
+            results.append(result)
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "pdmodels": _version(),
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """returns the list of (schema, operation, baseline best_us, current best_us) slower than threshold
+    """
+    previous = { (r["schema"], r["operation"]): r for r in baseline["results"] }
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["schema"], result["operation"]))
+        if before is not None and result["best_us"] > before["best_us"] * threshold:
+            regressions.append((result["schema"], result["operation"], before["best_us"], result["best_us"]))
+    return regressions
+
+
+def _version():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "VERSION")
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pdmodels benchmarks")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="a JSON output of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2, help="the slowdown ratio reported by --compare")
+    parser.add_argument("--schema", action="append", choices=sorted(SCHEMAS), help="the schemas to run (default: all)")
+    parser.add_argument("--operation", action="append", choices=sorted(OPERATIONS), help="the operations to run (default: all)")
+    parser.add_argument("--number", type=int, default=200, help="the number of documents of each run")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of runs of each operation")
+    args = parser.parse_args(argv)
+
+    current = run(args.schema, args.operation, number=args.number, repeat=args.repeat)
+    print("{0:<14} {1:<22} {2:>12} {3:>12} {4:>12}".format("schema", "operation", "best us", "median us", "peak KiB"))
+    for r in current["results"]:
+        print("{0:<14} {1:<22} {2:>12.2f} {3:>12.2f} {4:>12.1f}".format(
+            r["schema"], r["operation"], r["best_us"], r["median_us"], r["peak_bytes"] / 1024))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for schema, operation, before, after in regressions:
+            print("regression: {0} {1} {2:.2f}us -> {3:.2f}us ({4:.2f}x)".format(schema, operation, before, after, after / before))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,20 +23,121 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 import re
+import copy
+import json
 import datetime
 import logging
+import collections
+import importlib
+import itertools
+import operator
+import threading
+import time
+import weakref
+
+TIMEZONE_LOCAL = "local"
+TIMEZONE_UTC = "utc"
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_UTC = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECONDS = 1000000
+_ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+def _to_microseconds(value, precision):
+    """convert an int number of 1/precision seconds to microseconds using int arithmetic only
+    """
+    precision = int(precision)
+    if precision == _MICROSECONDS:
+        return int(value)
+    return int(value) * _MICROSECONDS // precision
 
-def int_to_datetime(microsecond, precision):
+def int_to_datetime(microsecond, precision, timezone=TIMEZONE_LOCAL):
     """convert microsecond to datetime properly.
     datetime.datetime.fromtimestamp(1432550134353845/1e6)
     datetime.datetime(2015, 5, 25, 10, 35, 34, 353844)
-    need to deal with cases like this
+    need to deal with cases like this, so only int arithmetic is used.
 
-    TODO: need to test if this is still a problem in later python version
+    microsecond             the number of 1/precision seconds since the epoch
+    precision               the number of units in a second, i.e. 1e6 for microsecond
+    timezone                TIMEZONE_LOCAL returns a naive local datetime (as datetime.fromtimestamp)
+                            TIMEZONE_UTC returns a naive UTC datetime, without any timezone lookup
+                            a tzinfo returns an aware datetime in that timezone
+    """
+    microseconds = _to_microseconds(microsecond, precision)
+    if timezone == TIMEZONE_UTC:
+        return _EPOCH + datetime.timedelta(microseconds=microseconds)
+    if timezone == TIMEZONE_LOCAL:
+        seconds_part, microseconds_part = divmod(microseconds, _MICROSECONDS)
+        return datetime.datetime.fromtimestamp(seconds_part).replace(microsecond=microseconds_part)
+    return (_EPOCH_UTC + datetime.timedelta(microseconds=microseconds)).astimezone(timezone)
+
+def _int_to_datetime_expr(src, value, precision, timezone):
+    """returns an expression of generated code that evaluates to int_to_datetime(value, precision, timezone)
+
+    src                     the _SourceBuilder of the generated code
+    value                   the local name of an int value
+    """
+    if int(precision) == _MICROSECONDS:
+        if timezone == TIMEZONE_UTC:
+            return "{0} + {1}(microseconds={2})".format(src.const(_EPOCH, "e"), src.const(datetime.timedelta, "td"), value)
+        if timezone == TIMEZONE_LOCAL:
+            return "{0}({1} // {2}).replace(microsecond={1} % {2})".format(
+                src.const(datetime.datetime.fromtimestamp, "ts"), value, _MICROSECONDS)
+    return "{0}({1}, {2}, {3})".format(src.const(int_to_datetime, "convert"), value,
+        src.const(precision, "p"), src.const(timezone, "z"))
+
+def datetime_to_int(value, precision, timezone=TIMEZONE_UTC):
+    """convert a datetime to an int number of 1/precision seconds since the epoch, exactly.
+
+    timezone                how a naive datetime is interpreted, TIMEZONE_UTC, TIMEZONE_LOCAL or a tzinfo.
+                            aware datetime are converted with their own tzinfo.
+    """
+    if value.tzinfo is None:
+        if timezone == TIMEZONE_UTC:
+            delta = value - _EPOCH
+        elif timezone == TIMEZONE_LOCAL:
+            delta = value.astimezone(datetime.timezone.utc) - _EPOCH_UTC
+        else:
+            delta = value.replace(tzinfo=timezone) - _EPOCH_UTC
+    else:
+        delta = value - _EPOCH_UTC
+    microseconds = delta // _ONE_MICROSECOND
+    precision = int(precision)
+    if precision == _MICROSECONDS:
+        return microseconds
+    return microseconds * precision // _MICROSECONDS
+
+def ints_to_datetimes(values, precision, timezone=TIMEZONE_LOCAL, use_numpy=False):
+    """convert a sequence of int to a list of datetime, see int_to_datetime
+
+    use_numpy               True to convert through numpy datetime64, only used with TIMEZONE_UTC
     """
-    seconds_part = int(microsecond//precision)
-    microseconds_part = int(microsecond%precision)
-    return datetime.datetime.fromtimestamp(seconds_part).replace(microsecond=microseconds_part)
+    if timezone == TIMEZONE_UTC:
+        if use_numpy:
+            import numpy
+            microseconds = numpy.asarray(values, dtype=numpy.int64)
+            if int(precision) != _MICROSECONDS:
+                microseconds = microseconds * _MICROSECONDS // int(precision)
+            return microseconds.astype("datetime64[us]").astype(object).tolist()
+        timedelta = datetime.timedelta
+        if int(precision) == _MICROSECONDS:
+            return [_EPOCH + timedelta(microseconds=int(v)) for v in values]
+        return [_EPOCH + timedelta(microseconds=_to_microseconds(v, precision)) for v in values]
+    return [int_to_datetime(v, precision, timezone) for v in values]
+
+def datetimes_to_ints(values, precision, timezone=TIMEZONE_UTC, use_numpy=False):
+    """convert a sequence of datetime to a list of int, see datetime_to_int
+
+    use_numpy               True to convert through numpy datetime64, only used with TIMEZONE_UTC
+                            and naive datetime
+    """
+    if use_numpy and timezone == TIMEZONE_UTC and all(v.tzinfo is None for v in values):
+        import numpy
+        microseconds = numpy.array(values, dtype="datetime64[us]").astype(numpy.int64)
+        if int(precision) != _MICROSECONDS:
+            microseconds = microseconds * int(precision) // _MICROSECONDS
+        return microseconds.tolist()
+    return [datetime_to_int(v, precision, timezone) for v in values]
 
 """
 Note:
@@ -108,7 +209,7 @@ class Field(object):
 
         if isinstance(choices, dict):
             self.reversed_choices = { v : k for k, v in choices.items() }
-            if len(self.reversed_choices != self.choices):
+            if len(self.reversed_choices) != len(self.choices):
                 raise DictFieldError("choices is not unique")
 
         for k, v in kwargs.items():
@@ -145,11 +246,7 @@ class Field(object):
     def is_valid_value(self, value):
         """return True if this is a valid value, False otherwise
         """
-        try:
-            next(self.errors(value))
-            return False
-        except StopIteration:
-            return True
+        return _get_compiled(self, "checker", lambda: _CheckerCompiler(None).compile_field(self))(value)
 
     def make_default(self):
         """return a default value for this field
@@ -174,15 +271,27 @@ class Field(object):
             if set_default:
                 document[key] = self.make_default()
 
-    def update(self, document, key, value):
+    def update(self, document, key, value, touched=None, path=()):
         """update the key in this document with the value
 
         document                the dictionary to update
         key                     the key of the field
         value                   the value to update it to
+        touched                 if provided, a set where the path of each modified field is added to,
+                                before it is modified
+        path                    the path of document, the prefix of the paths added to touched
         """
+        if touched is not None:
+            touched.add(path + (key, ))
         document[key] = value
 
+    def _validate_tree(self, value, tree, with_key, errors):
+        """validate only the parts of value in tree, see DefinedDict.validate_paths
+
+        returns False if this field cannot be partially validated, the whole value is then validated.
+        """
+        return False
+
 
 class TypedField(Field):
 
@@ -289,7 +398,7 @@ class FloatField(NumberField):
     def __init__(self, **kwargs):
         super().__init__(allowed_type=(float, int), **kwargs)
 
-    def update(self, document, key, value):
+    def update(self, document, key, value, touched=None, path=()):
         """override the original update to cast int to float
         """
         if isinstance(value, int):
@@ -300,7 +409,7 @@ class FloatField(NumberField):
                 value = float(value)
             except Exception as e:
                 pass
-        super().update(document, key, value)
+        super().update(document, key, value, touched=touched, path=path)
 
 
 class BoolField(TypedField):
@@ -336,7 +445,7 @@ class ListField(TypedField):
         """override the original errors with additional checks
         """
         yield from super().errors(value, with_key)
-        if self.inner_type is not None and isinstance(value, list):
+        if self.inner_type is not None and isinstance(value, list) and not _scan_primitives(self.inner_type, value):
             if with_key is not None:
                 for ind, inner in enumerate(value):
                     yield from self.inner_type.errors(inner, ".".join([with_key, str(ind)]))
@@ -354,7 +463,7 @@ class ListField(TypedField):
             document[key] = []
         # find and remove None if enabled
         if (self.remove_none_value and document.get(key) is not None and
-                isinstance(document.get(key), list)):
+                isinstance(document.get(key), list) and _has_none(document[key])):
             document[key] = [ item for item in document.get(key) if item is not None ]
         # if list is a dictionary, inform the inner definition to also clean
         if self.inner_type is not None and document.get(key):
@@ -368,12 +477,14 @@ class DateTimeField(Field):
     """Field used to store datetime object.
     """
 
-    def __init__(self, precision=1e6, **kwargs):
+    def __init__(self, precision=1e6, timezone=TIMEZONE_LOCAL, **kwargs):
         """
         precision               the precision to use in storing/converting the value
+        timezone                the timezone of the datetime converted from int, see int_to_datetime
         """
         super().__init__(**kwargs)
         self.precision = precision
+        self.timezone = timezone
 
     def errors(self, value, with_key=None):
         """override the original errors with various checks
@@ -390,8 +501,8 @@ class DateTimeField(Field):
         will convert int to datetime
         """
         super().clean(document, key, **kwargs)
-        if isinstance(document[key], int):
-            document[key] = int_to_datetime(document[key], self.precision)
+        if isinstance(document.get(key), int):
+            document[key] = int_to_datetime(document[key], self.precision, self.timezone)
 
 
 class DictField(TypedField):
@@ -404,14 +515,18 @@ class DictField(TypedField):
         super().__init__(allowed_type=(dict, ), **kwargs)
 
 
-    def update(self, document, key, value):
+    def update(self, document, key, value, touched=None, path=()):
         """override update to do update all keys
         does not recursively update.
         """
         if isinstance(value, dict):
             if document.get(key) is None:
+                if touched is not None:
+                    touched.add(path + (key, ))
                 document[key] = value
             elif isinstance(document.get(key), dict):
+                if touched is not None:
+                    touched.add(path + (key, ))
                 document[key].update(value)
 
 
@@ -431,7 +546,7 @@ class MapField(DictField):
         """override the original errors with various checks
         """
         yield from super().errors(value, with_key)
-        if isinstance(value, dict):
+        if isinstance(value, dict) and not _scan_primitives(self.inner_type, value.values()):
             if with_key is not None:
                 for k, v in value.items():
                     yield from self.inner_type.errors(v, ".".join([with_key, k]))
@@ -439,25 +554,55 @@ class MapField(DictField):
                 for k, v in value:
                     yield from self.inner_type.errors(v, None)
 
-    def update(self, document, key, value):
+    def update(self, document, key, value, touched=None, path=()):
         """override the original update to recursively update
         """
         if isinstance(value, dict):
             if document.get(key) is None:
+                if touched is not None:
+                    touched.add(path + (key, ))
                 document[key] = {}
         if isinstance(value, dict):
+            inner_path = path + (key, )
             if isinstance(self.inner_type, DefinedDictField):
                 for k, v in value.items():
                     if document[key].get(k) is None or v is None:
+                        if touched is not None:
+                            touched.add(inner_path + (k, ))
                         document[key][k] = v
                     else:
-                        self.inner_type.model.update(document[key][k], v)
+                        self.inner_type.model.update(document[key][k], v, touched=touched, path=inner_path + (k, ))
             else:
                 for k, v in value.items():
                     if document[key].get(k) is None:
+                        if touched is not None:
+                            touched.add(inner_path + (k, ))
                         document[key][k] = v
                     else:
-                        self.inner_type.update(document[key], k, v)
+                        _update_field(self.inner_type, document[key], k, v, touched, inner_path)
+
+    def _validate_tree(self, value, tree, with_key, errors):
+        """override to only validate the values in tree
+        """
+        if not isinstance(value, dict):
+            return False
+        found = []
+        for k, subtree in tree.items():
+            if k in value:
+                v = value[k]
+                item_key = ".".join([with_key, k])
+                item_errors = []
+                if subtree is None or not self.inner_type._validate_tree(v, subtree, item_key, item_errors):
+                    item_errors.extend(self.inner_type.errors(v, item_key))
+                if item_errors:
+                    found.append((k, item_errors))
+        if len(found) > 1:
+            # in the order of the map, as get_document_errors
+            order = { k: i for i, k in enumerate(value) }
+            found.sort(key=lambda item: order[item[0]])
+        for _, item_errors in found:
+            errors.extend(item_errors)
+        return True
 
     def clean(self, document, key, **kwargs):
         """override the original clean to recursively clean
@@ -466,7 +611,7 @@ class MapField(DictField):
         if self.ensure_dict and document.get(key) is None:
             document[key] = {}
         if document.get(key) is not None:
-            if self.remove_none_value:
+            if self.remove_none_value and _has_none(document[key].values()):
                 none_keys = []
                 for k, v in document[key].items():
                     if v is None:
@@ -502,14 +647,24 @@ class DefinedDictField(DictField):
         else:
             return super().make_default()
 
-    def update(self, document, key, value):
+    def update(self, document, key, value, touched=None, path=()):
         """override the original update to use the models' update
         """
         if isinstance(value, dict):
             if document.get(key) is None:
+                if touched is not None:
+                    touched.add(path + (key, ))
                 document[key] = value
             else:
-                self.model.update(document[key], value)
+                self.model.update(document[key], value, touched=touched, path=path + (key, ))
+
+    def _validate_tree(self, value, tree, with_key, errors):
+        """override to only validate the fields in tree
+        """
+        if not isinstance(value, dict):
+            return False
+        self.model._validate_tree(value, tree, with_key, errors)
+        return True
 
     def clean(self, document, key, set_default=True, **kwargs):
         """override the original clean to use the models' clean
@@ -563,18 +718,22 @@ class VariableDefinedDictField(DictField):
         """
         return None
 
-    def update(self, document, key, value):
+    def update(self, document, key, value, touched=None, path=()):
         """override update to use the correct model to update
 
         document            the parent dict containing this key
         key                 the key that we are writing to
         value               the value we are updating, a dict
+        touched             see Field.update
+        path                see Field.update
         """
         if isinstance(value, dict):
             # keep the original dictionary value
             doc = document.get(key)
             # if either is None, then there is no merging, we just set it and we are done
             if value is None or doc is None:
+                if touched is not None:
+                    touched.add(path + (key, ))
                 document[key] = value
                 return
 
@@ -591,7 +750,7 @@ class VariableDefinedDictField(DictField):
                     raise ValueError("Invalid {0}: {1}".format(self.check_field, doc_type or value_type))
 
                 # tell the model to update the value
-                model.update(doc, value)
+                model.update(doc, value, touched=touched, path=path + (key, ))
 
             # this only happens if doc_type and value_type is not None, and they are not the same value
             # thus we just overwrite it
@@ -599,8 +758,19 @@ class VariableDefinedDictField(DictField):
                 # if above doesn't work, the other case that we need to care is
                 # we overwrite the original doc with value
                 # TODO: do we need to deepcopy?
+                if touched is not None:
+                    touched.add(path + (key, ))
                 document[key] = value
 
+    def _validate_tree(self, value, tree, with_key, errors):
+        """override to only validate the fields in tree of the correct model
+        """
+        model = self._get_model(value) if isinstance(value, dict) else None
+        if model is None:
+            return False
+        model._validate_tree(value, tree, with_key, errors)
+        return True
+
     def errors(self, value, with_key=None):
         """override the original errors to call the correct model's errors
         """
@@ -636,6 +806,118 @@ class VariableDefinedDictField(DictField):
             model = self._get_model(value)
             model.clean_document(value, set_default=set_default, **kwargs)
 
+_NONE_TYPE = type(None)
+
+def _has_none(values):
+    """returns True if one of values is None
+
+    "in" tests the identity before the equality, it can only be wrong for values with an __eq__ that
+    is True for None (the values are then filtered for None anyway) or that raises.
+    """
+    try:
+        return None in values
+    except Exception:
+        # i.e. numpy arrays, that can not be compared to None
+        return any(map(operator.is_, values, itertools.repeat(None)))
+
+def _primitive_scanner(definition):
+    """returns a function that returns True if all the values (a list or the values of a dict) are valid
+    for definition, checked in a single pass without formatting any key, None if definition is not a
+    field of primitive values.
+
+    The function returns False if a value fails a check or if it has a type that is not exactly one of
+    the allowed types, the values should then be checked one by one for their errors.
+    """
+    errors = type(definition).errors
+    if errors is Field.errors:
+        types = None
+    elif errors is DateTimeField.errors:
+        types = { datetime.datetime }
+    elif errors in (TypedField.errors, StringField.errors, NumberField.errors):
+        allowed_type = definition.allowed_type
+        if isinstance(allowed_type, type):
+            types = { allowed_type }
+        elif isinstance(allowed_type, tuple):
+            types = set(allowed_type)
+        else:
+            return None
+        if int in types:
+            types.add(bool)
+    else:
+        return None
+    required = definition.is_required
+    if types is not None and not required:
+        types.add(_NONE_TYPE)
+    choices = None
+    if definition.choices is not None:
+        choices = _frozen_choices(definition.choices)
+        if choices is None:
+            return None
+    minimum = maximum = match = None
+    if errors is NumberField.errors:
+        minimum, maximum = definition.min, definition.max
+    if errors is StringField.errors and definition.regex is not None:
+        match = definition.regex.match
+    repeat, lt, gt = itertools.repeat, operator.lt, operator.gt
+
+    def scan(values):
+        present = set(map(type, values))
+        if types is not None and not present <= types:
+            return False
+        if _NONE_TYPE in present:
+            if required:
+                return False
+            if choices is None and minimum is None and maximum is None and match is None:
+                return True
+            values = [ value for value in values if value is not None ]
+        if choices is not None:
+            try:
+                if not choices.issuperset(values):
+                    return False
+            except TypeError:
+                return False # an unhashable value, the field reports it
+        if float in present:
+            # min and max can not be used with nan, compare each value as the field does
+            if minimum is not None and any(map(lt, values, repeat(minimum))):
+                return False
+            if maximum is not None and any(map(gt, values, repeat(maximum))):
+                return False
+        elif values:
+            if minimum is not None and min(values) < minimum:
+                return False
+            if maximum is not None and max(values) > maximum:
+                return False
+        if match is not None and not all(map(match, values)):
+            return False
+        return True
+    return scan
+
+def _never_valid(values):
+    return False
+
+def _scan_primitives(definition, values):
+    """returns True if values are known to be valid for definition, see _primitive_scanner
+    """
+    return _get_compiled(definition, "primitive_scanner", lambda: _primitive_scanner(definition) or _never_valid)(values)
+
+_PATH_UPDATES = {
+    Field.update, FloatField.update, DictField.update, MapField.update,
+    DefinedDictField.update, VariableDefinedDictField.update,
+}
+
+def _update_field(definition, document, key, value, touched, path):
+    """call definition.update, passing touched and path only if its update is known to support them.
+
+    fields with their own update are considered to modify the whole key.
+    """
+    if touched is None:
+        definition.update(document, key, value)
+    elif type(definition).update in _PATH_UPDATES:
+        definition.update(document, key, value, touched=touched, path=path)
+    else:
+        touched.add(path + (key, ))
+        definition.update(document, key, value)
+
 #################################### Mixin ####################################
 class Mixin(object):
     """Parent class for mixins
@@ -659,7 +941,1030 @@ class Mixin(object):
         """
         pass
 
+#################################### Compiler ####################################
+class _SourceBuilder(object):
+    """Accumulates the source and the namespace of a generated function
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.namespace = {}
+        self._counter = 0
+
+    def name(self, prefix):
+        """return a new unique local name
+        """
+        self._counter += 1
+        return "{0}{1}".format(prefix, self._counter)
+
+    def const(self, value, prefix="c"):
+        """store value in the namespace of the generated function and return its name
+        """
+        name = self.name(prefix)
+        self.namespace[name] = value
+        return name
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def build(self, name, args, filename):
+        """compile the accumulated lines as the body of the function name(*args)
+        """
+        body = "\n".join(self.lines) if self.lines else "    pass"
+        source = "def {0}({1}):\n{2}\n".format(name, ", ".join(args), body)
+        exec(compile(source, filename, "exec"), self.namespace)
+        function = self.namespace[name]
+        function._source = source
+        return function
+
+
+class _ValidatorCompiler(object):
+    """Generates a single flat validator function for a model.
+
+    The generated function has the signature validator(document, parent, errors) and appends
+    the same (key, error_type, value) tuples, in the same order, as DefinedDict._yield_errors.
+
+    The checks of the known fields are inlined, nested DefinedDict are called through their own
+    compiled validator. Fields with an errors method that is not known to the compiler (i.e. user
+    defined fields) are called through their errors generator.
+
+    The key of an error is only formatted when the error is produced or when it is needed as
+    the parent of a nested model.
+    """
+
+    NAME = "validator"
+    ARGS = ("document", "parent", "errors")
+
+    def __init__(self, model, fields=None):
+        """
+        model               the model to compile
+        fields              the (key, definition) pairs to compile, all the fields of the model by default
+        """
+        self.model = model
+        self.fields = fields
+        self.src = _SourceBuilder()
+
+    def compile(self):
+        src = self.src
+        if self.fields is None:
+            fields = [(entry.key, entry.definition) for entry in self.model._field_table]
+        else:
+            fields = self.fields
+        for key, definition in fields:
+            if _profiler is not None:
+                counter = src.const(_profiler.counter(self.model, key, "errors"), "p")
+                src.emit(1, "{0}_start, {0}_errors = {1}(), len(errors)".format(counter, src.const(time.perf_counter, "clock")))
+            value = src.name("v")
+            src.emit(1, "{0} = document.get({1!r})".format(value, key))
+            key_expr = "({0!r} if parent is None else parent + {1!r})".format(key, "." + key)
+            self.emit_field(definition, value, key_expr, 1)
+            if _profiler is not None:
+                src.emit(1, "{0}.add({1}() - {0}_start, len(errors) - {0}_errors)".format(counter, src.const(time.perf_counter, "clock")))
+        return self.src.build("validate", self.ARGS, "<pdmodels {0} {1}>".format(self.NAME, self.model.__name__))
+
+    def emit_field(self, definition, value, key, indent):
+        """emit the checks for definition
+
+        value           the local name holding the value
+        key             an expression that evaluates to the key of the value
+        """
+        emitter = self.EMITTERS.get(type(definition).errors)
+        if emitter is None:
+            self.emit_unknown_field(definition, value, key, indent)
+        else:
+            emitter(self, definition, value, key, indent)
+
+    def emit_unknown_field(self, definition, value, key, indent):
+        field = self.src.const(definition, "f")
+        self.src.emit(indent, "errors.extend({0}.errors({1}, {2}))".format(field, value, key))
+
+    def emit_error(self, indent, key, error_type, value):
+        self.src.emit(indent, "errors.append(({0}, {1!r}, {2}))".format(key, error_type, value))
+
+    def nested(self, model):
+        """return the compiled function of a nested model
+        """
+        return model._get_validator()
+
+    def emit_nested(self, indent, function, value, key):
+        """emit the call to the compiled function of a nested model
+        """
+        self.src.emit(indent, "{0}({1}, {2}, errors)".format(function, value, key))
+
+    def emit_list_loop(self, indent, value, key):
+        """emit a loop over the list value, returns the local name of the item and its key
+        """
+        index = self.src.name("i")
+        item = self.src.name("v")
+        self.src.emit(indent, "for {0}, {1} in enumerate({2}):".format(index, item, value))
+        return item, "({0} + '.' + str({1}))".format(key, index)
+
+    def emit_map_loop(self, indent, value, key):
+        """emit a loop over the dict value, returns the local name of the item and its key
+        """
+        map_key = self.src.name("k")
+        item = self.src.name("v")
+        self.src.emit(indent, "for {0}, {1} in {2}.items():".format(map_key, item, value))
+        return item, "'.'.join(({0}, {1}))".format(key, map_key)
+
+    def emit_common(self, definition, value, key, indent, allowed_type=None):
+        """emit the checks of Field.errors and TypedField.errors.
+
+        returns the indent where further checks on a not None value can be emitted.
+        """
+        src = self.src
+        if definition.is_required:
+            src.emit(indent, "if {0} is None:".format(value))
+            self.emit_error(indent + 1, key, Field.ERROR_IS_REQUIRED, "None")
+            src.emit(indent, "else:")
+        else:
+            src.emit(indent, "if {0} is not None:".format(value))
+        indent += 1
+        src.emit(indent, "pass")
+        if definition.choices is not None:
+            choices = _frozen_choices(definition.choices)
+            if choices is None or isinstance(definition.choices, (set, frozenset, dict)):
+                src.emit(indent, "if {0} not in {1}:".format(value, src.const(definition.choices)))
+            else:
+                # the frozenset cannot test unhashable values as the original sequence can
+                choices, sequence = src.const(choices), src.const(definition.choices)
+                src.emit(indent, "try:")
+                src.emit(indent + 1, "{0}_bad = {0} not in {1}".format(value, choices))
+                src.emit(indent, "except TypeError:")
+                src.emit(indent + 1, "{0}_bad = {0} not in {1}".format(value, sequence))
+                src.emit(indent, "if {0}_bad:".format(value))
+            self.emit_error(indent + 1, key, Field.ERROR_VALUE, value)
+        if allowed_type is not None:
+            src.emit(indent, "if not isinstance({0}, {1}):".format(value, src.const(allowed_type, "t")))
+            self.emit_error(indent + 1, key, Field.ERROR_TYPE, value)
+        return indent
+
+    def emit_base_field(self, definition, value, key, indent):
+        self.emit_common(definition, value, key, indent)
+
+    def emit_typed_field(self, definition, value, key, indent):
+        self.emit_common(definition, value, key, indent, definition.allowed_type)
+
+    def emit_string_field(self, definition, value, key, indent):
+        indent = self.emit_common(definition, value, key, indent, definition.allowed_type)
+        if definition.regex is not None:
+            match = self.src.const(definition.regex.match, "r")
+            self.src.emit(indent, "if not {0}({1}):".format(match, value))
+            self.emit_error(indent + 1, key, Field.ERROR_VALUE, value)
+
+    def emit_number_field(self, definition, value, key, indent):
+        indent = self.emit_common(definition, value, key, indent, definition.allowed_type)
+        checks = []
+        if definition.min is not None:
+            checks.append("{0} < {1}".format(value, self.src.const(definition.min)))
+        if definition.max is not None:
+            checks.append("{0} > {1}".format(value, self.src.const(definition.max)))
+        if checks:
+            self.src.emit(indent, "if {0}:".format(" or ".join(checks)))
+            self.emit_error(indent + 1, key, Field.ERROR_VALUE, value)
+
+    def emit_datetime_field(self, definition, value, key, indent):
+        self.emit_common(definition, value, key, indent, (datetime.datetime, ))
+
+    def emit_scan(self, definition, values, indent):
+        """emit the single pass check of primitive values, see _primitive_scanner
+
+        returns the indent where the values are checked one by one
+        """
+        scanner = _primitive_scanner(definition)
+        if scanner is None:
+            return indent
+        self.src.emit(indent, "if not {0}({1}):".format(self.src.const(scanner, "scan"), values))
+        return indent + 1
+
+    def emit_list_field(self, definition, value, key, indent):
+        indent = self.emit_common(definition, value, key, indent, definition.allowed_type)
+        if definition.inner_type is not None:
+            self.src.emit(indent, "if isinstance({0}, list):".format(value))
+            indent = self.emit_scan(definition.inner_type, value, indent + 1)
+            item, item_key = self.emit_list_loop(indent, value, key)
+            self.emit_field(definition.inner_type, item, item_key, indent + 1)
+
+    def emit_map_field(self, definition, value, key, indent):
+        indent = self.emit_common(definition, value, key, indent, definition.allowed_type)
+        self.src.emit(indent, "if isinstance({0}, dict):".format(value))
+        indent = self.emit_scan(definition.inner_type, "{0}.values()".format(value), indent + 1)
+        item, item_key = self.emit_map_loop(indent, value, key)
+        self.emit_field(definition.inner_type, item, item_key, indent + 1)
+
+    def emit_defined_dict_field(self, definition, value, key, indent):
+        indent = self.emit_common(definition, value, key, indent, definition.allowed_type)
+        function = self.src.const(self.nested(definition.model), "m")
+        self.src.emit(indent, "if isinstance({0}, dict):".format(value))
+        self.emit_nested(indent + 1, function, value, key)
+
+    def emit_variable_defined_dict_field(self, definition, value, key, indent):
+        indent = self.emit_common(definition, value, key, indent, definition.allowed_type)
+        src = self.src
+        functions = src.const({ k: self.nested(m) for k, m in definition.models.items() }, "m")
+        _type = src.name("t")
+        function = src.name("m")
+        type_key = "({0} + {1!r})".format(key, "." + definition.check_field)
+        src.emit(indent, "if isinstance({0}, dict):".format(value))
+        src.emit(indent + 1, "{0} = {1}.get({2!r})".format(_type, value, definition.check_field))
+        src.emit(indent + 1, "if {0} is None:".format(_type))
+        self.emit_error(indent + 2, type_key, Field.ERROR_IS_REQUIRED, "None")
+        src.emit(indent + 1, "else:")
+        src.emit(indent + 2, "{0} = {1}.get({2})".format(function, functions, _type))
+        src.emit(indent + 2, "if {0} is None:".format(function))
+        self.emit_error(indent + 3, type_key, Field.ERROR_VALUE, _type)
+        src.emit(indent + 2, "else:")
+        self.emit_nested(indent + 3, function, value, key)
+
+    EMITTERS = {
+        Field.errors: emit_base_field,
+        TypedField.errors: emit_typed_field,
+        StringField.errors: emit_string_field,
+        NumberField.errors: emit_number_field,
+        DateTimeField.errors: emit_datetime_field,
+        ListField.errors: emit_list_field,
+        MapField.errors: emit_map_field,
+        DefinedDictField.errors: emit_defined_dict_field,
+        VariableDefinedDictField.errors: emit_variable_defined_dict_field,
+    }
+
+
+
+class _ErrorLimitReached(Exception):
+    """Raised by a limited validator when the errors reach the limit, see _LimitedValidatorCompiler
+    """
+
+
+class _LimitedValidatorCompiler(_ValidatorCompiler):
+    """Generates a validator that stops as soon as it has found limit errors.
+
+    The generated function has the signature validator(document, parent, errors, limit) and raises
+    _ErrorLimitReached when len(errors) reaches limit, from any depth of nested models, lists and maps,
+    so the time to reject a document is bounded by the number of errors wanted.
+    """
+
+    NAME = "limited validator"
+    ARGS = ("document", "parent", "errors", "limit")
+
+    def emit_limit(self, indent):
+        self.src.emit(indent, "if len(errors) >= limit:")
+        self.src.emit(indent + 1, "raise {0}".format(self.src.const(_ErrorLimitReached, "Limit")))
+
+    def emit_unknown_field(self, definition, value, key, indent):
+        field = self.src.const(definition, "f")
+        self.src.emit(indent, "for error in {0}.errors({1}, {2}):".format(field, value, key))
+        self.src.emit(indent + 1, "errors.append(error)")
+        self.emit_limit(indent + 1)
+
+    def emit_error(self, indent, key, error_type, value):
+        super().emit_error(indent, key, error_type, value)
+        self.emit_limit(indent)
+
+    def nested(self, model):
+        return model._get_limited_validator()
+
+    def emit_nested(self, indent, function, value, key):
+        self.src.emit(indent, "{0}({1}, {2}, errors, limit)".format(function, value, key))
+
+
+class _CheckerCompiler(_ValidatorCompiler):
+    """Generates a validity only function for a model or a single field.
+
+    The generated function returns False on the first error and True if there is none, in the
+    same order as the validator. No key is ever formatted and the lists and dicts are iterated
+    without their index or key, so a valid document is checked without allocating any string.
+    """
+
+    def compile(self):
+        src = self.src
+        for entry in self.model._field_table:
+            value = src.name("v")
+            src.emit(1, "{0} = document.get({1!r})".format(value, entry.key))
+            self.emit_field(entry.definition, value, None, 1)
+        src.emit(1, "return True")
+        return src.build("check", ("document", ), "<pdmodels checker {0}>".format(self.model.__name__))
+
+    def compile_field(self, definition):
+        """compile a function that checks a single value of definition
+        """
+        self.emit_field(definition, "value", None, 1)
+        self.src.emit(1, "return True")
+        return self.src.build("check", ("value", ), "<pdmodels checker {0}>".format(type(definition).__name__))
+
+    def emit_unknown_field(self, definition, value, key, indent):
+        field = self.src.const(definition, "f")
+        self.src.emit(indent, "for _ in {0}.errors({1}):".format(field, value))
+        self.src.emit(indent + 1, "return False")
+
+    def emit_error(self, indent, key, error_type, value):
+        self.src.emit(indent, "return False")
+
+    def nested(self, model):
+        return model._get_checker()
+
+    def emit_nested(self, indent, function, value, key):
+        self.src.emit(indent, "if not {0}({1}):".format(function, value))
+        self.src.emit(indent + 1, "return False")
+
+    def emit_list_loop(self, indent, value, key):
+        item = self.src.name("v")
+        self.src.emit(indent, "for {0} in {1}:".format(item, value))
+        return item, None
+
+    def emit_map_loop(self, indent, value, key):
+        item = self.src.name("v")
+        self.src.emit(indent, "for {0} in {1}.values():".format(item, value))
+        return item, None
+
+
+class _ReporterCompiler(_ValidatorCompiler):
+    """Generates a validator that reports the field path of the errors instead of their key.
+
+    The index of a list and the key of a MapField are replaced by "*", so all the errors of a
+    field share a single path no matter how many items are in the document. See validate_many
+    """
+
+    def nested(self, model):
+        return model._get_reporter()
+
+    def emit_list_loop(self, indent, value, key):
+        item = self.src.name("v")
+        self.src.emit(indent, "for {0} in {1}:".format(item, value))
+        return item, "({0} + '.*')".format(key)
+
+    def emit_map_loop(self, indent, value, key):
+        item = self.src.name("v")
+        self.src.emit(indent, "for {0} in {1}.values():".format(item, value))
+        return item, "({0} + '.*')".format(key)
+
+
+class _CleanerCompiler(object):
+    """Generates a single flat clean function for a model.
+
+    The generated function has the signature cleaner(document) and cleans the document in place
+    the same way the clean of each field would. set_default and remove_undefined are resolved
+    when the function is generated, so a model has one cleaner for each combination of them.
+    It returns True if the document was modified, False otherwise.
+
+    The fixed values, defaults, ensure_list/ensure_dict, remove_none_value and nested models
+    are resolved once, nested DefinedDict are called through their own compiled cleaner.
+    Fields with a clean method that is not known to the compiler are called through their clean,
+    they are considered modified if the value is replaced.
+
+    A document that is already clean is only read: the lists and maps are scanned for None before
+    they are rebuilt, fixed values are compared before they are set and the undefined keys are
+    looked for by the number of keys (or a keys view comparison) before any list of keys is made.
+    """
+
+    NAME = "cleaner"
+
+    def __init__(self, model, set_default, remove_undefined):
+        self.model = model
+        self.set_default = set_default
+        self.remove_undefined = remove_undefined
+        self.src = _SourceBuilder()
+        # False while emitting a list which items are already cleaned
+        self.clean_list_items = True
+
+    def compile(self):
+        src = self.src
+        src.emit(1, "modified = False")
+        for entry in self.model._field_table:
+            if _profiler is None:
+                self.emit_entry(entry)
+                continue
+            counter = src.const(_profiler.counter(self.model, entry.key, "clean"), "p")
+            clock = src.const(time.perf_counter, "clock")
+            src.emit(1, "{0}_start = {1}()".format(counter, clock))
+            self.emit_entry(entry)
+            src.emit(1, "{0}.add({1}() - {0}_start)".format(counter, clock))
+        if self.remove_undefined:
+            keys = src.const(frozenset(entry.key for entry in self.model._field_table), "k")
+            if self.set_default and all(type(entry.definition).clean in self.EMITTERS for entry in self.model._field_table):
+                # every field is in the document, it has undefined keys if it has more keys than fields
+                src.emit(1, "if len(document) != {0}:".format(len(self.model._field_table)))
+            else:
+                src.emit(1, "if not document.keys() <= {0}:".format(keys))
+            src.emit(2, "for key in [key for key in document if key not in {0}]:".format(keys))
+            src.emit(3, "del document[key]")
+            src.emit(2, "modified = True")
+        src.emit(1, "return modified")
+        return src.build("clean", ("document", ),
+                "<pdmodels {0} {1}>".format(self.NAME, self.model.__name__))
+
+    def emit_entry(self, entry):
+        """emit the cleaning of a field of the model, see FieldEntry
+        """
+        self.emit_field(entry.definition, "document", repr(entry.key), 1)
+
+    def emit_field(self, definition, container, key, indent, present=False):
+        """emit the cleaning of definition
+
+        container       the local name of the dictionary containing the value
+        key             an expression that evaluates to the key of the value
+        present         True if the key is known to be in container
+        """
+        emitter = self.EMITTERS.get(type(definition).clean)
+        if emitter is None:
+            src = self.src
+            field = src.const(definition, "f")
+            before = src.name("b")
+            missing = src.const(ChangeSet.MISSING, "missing")
+            src.emit(indent, "{0} = {1}.get({2}, {3})".format(before, container, key, missing))
+            src.emit(indent, "{0}.clean({1}, {2}, set_default={3}, remove_undefined={4})".format(
+                field, container, key, self.set_default, self.remove_undefined))
+            src.emit(indent, "if {0}.get({1}, {2}) is not {3}:".format(container, key, missing, before))
+            src.emit(indent + 1, "modified = True")
+        else:
+            emitter(self, definition, container, key, indent, present)
+
+    def default_expr(self, definition):
+        """return an expression that evaluates to definition.make_default()
+        """
+        src = self.src
+        if type(definition).make_default is not Field.make_default:
+            return "{0}()".format(src.const(definition.make_default, "d"))
+        if definition.default is None:
+            return "None"
+        if callable(definition.default):
+            return "{0}({1})".format(src.const(definition.default, "d"), src.const(definition, "f"))
+        return src.const(definition.default, "d")
+
+    def nested_cleaner(self, model):
+        """return the cleaner of a nested model
+        """
+        if model.clean_document.__func__ is not DefinedDict.clean_document.__func__:
+            # clean_document is overridden, respect it, the document is then considered modified
+            set_default, remove_undefined = self.set_default, self.remove_undefined
+            def cleaner(document):
+                model.clean_document(document, set_default=set_default, remove_undefined=remove_undefined)
+                return True
+        else:
+            cleaner = model._get_cleaner(self.set_default, self.remove_undefined)
+        return cleaner
+
+    def emit_default(self, definition, container, key, indent, present):
+        if self.set_default and not present:
+            self.src.emit(indent, "if {0} not in {1}:".format(key, container))
+            self.src.emit(indent + 1, "{0}[{1}] = {2}".format(container, key, self.default_expr(definition)))
+            self.src.emit(indent + 1, "modified = True")
+
+    def emit_base_clean(self, definition, container, key, indent, present):
+        if definition.fixed_value is not None:
+            src = self.src
+            value = src.name("v")
+            fixed = src.const(definition.fixed_value)
+            missing = src.const(ChangeSet.MISSING, "missing")
+            # the fixed value is always set, only report it if the value was not already equal to it
+            src.emit(indent, "{0} = {1}.get({2}, {3})".format(value, container, key, missing))
+            src.emit(indent, "if {0} is not {1}:".format(value, fixed))
+            src.emit(indent + 1, "{0}[{1}] = {2}".format(container, key, fixed))
+            src.emit(indent + 1, "if type({0}) is not type({1}) or {0} != {1}:".format(value, fixed))
+            src.emit(indent + 2, "modified = True")
+        else:
+            self.emit_default(definition, container, key, indent, present)
+
+    def emit_list_clean(self, definition, container, key, indent, present):
+        src = self.src
+        self.emit_base_clean(definition, container, key, indent, present)
+        value = src.name("v")
+        src.emit(indent, "{0} = {1}.get({2})".format(value, container, key))
+        if definition.ensure_list:
+            src.emit(indent, "if {0} is None:".format(value))
+            src.emit(indent + 1, "{0} = {1}[{2}] = []".format(value, container, key))
+            src.emit(indent + 1, "modified = True")
+        if definition.remove_none_value:
+            src.emit(indent, "if isinstance({0}, list) and {1}({0}):".format(value, src.const(_has_none, "has_none")))
+            src.emit(indent + 1, "{0} = {1}[{2}] = [item for item in {0} if item is not None]".format(
+                value, container, key))
+            src.emit(indent + 1, "modified = True")
+        if isinstance(definition.inner_type, DefinedDictField) and self.clean_list_items:
+            item = src.name("v")
+            src.emit(indent, "if {0}:".format(value))
+            src.emit(indent + 1, "for {0} in {1}:".format(item, value))
+            src.emit(indent + 2, "if {0} is not None and {1}({0}):".format(item,
+                src.const(self.nested_cleaner(definition.inner_type.model), "m")))
+            src.emit(indent + 3, "modified = True")
+
+    def emit_datetime_clean(self, definition, container, key, indent, present):
+        src = self.src
+        self.emit_base_clean(definition, container, key, indent, present)
+        value = src.name("v")
+        src.emit(indent, "{0} = {1}.get({2})".format(value, container, key))
+        src.emit(indent, "if isinstance({0}, int):".format(value))
+        src.emit(indent + 1, "{0}[{1}] = {2}".format(container, key,
+            _int_to_datetime_expr(src, value, definition.precision, definition.timezone)))
+        src.emit(indent + 1, "modified = True")
+
+    def emit_map_clean(self, definition, container, key, indent, present):
+        src = self.src
+        self.emit_base_clean(definition, container, key, indent, present)
+        value = src.name("v")
+        src.emit(indent, "{0} = {1}.get({2})".format(value, container, key))
+        if definition.ensure_dict:
+            src.emit(indent, "if {0} is None:".format(value))
+            src.emit(indent + 1, "{0} = {1}[{2}] = {{}}".format(value, container, key))
+            src.emit(indent + 1, "modified = True")
+        else:
+            src.emit(indent, "if {0} is not None:".format(value))
+            indent += 1
+            src.emit(indent, "pass")
+        map_key = src.name("k")
+        if definition.remove_none_value:
+            src.emit(indent, "if {0}({1}.values()):".format(src.const(_has_none, "has_none"), value))
+            src.emit(indent + 1, "for {0} in [k for k, v in {1}.items() if v is None]:".format(map_key, value))
+            src.emit(indent + 2, "del {0}[{1}]".format(value, map_key))
+            src.emit(indent + 1, "modified = True")
+        loop = len(src.lines)
+        src.emit(indent, "for {0} in {1}:".format(map_key, value))
+        self.emit_field(definition.inner_type, value, map_key, indent + 1, present=True)
+        if len(src.lines) == loop + 1:
+            # nothing to clean in the values
+            src.lines.pop()
+
+    def emit_defined_dict_clean(self, definition, container, key, indent, present):
+        src = self.src
+        self.emit_default(definition, container, key, indent, present)
+        value = src.name("v")
+        src.emit(indent, "{0} = {1}.get({2})".format(value, container, key))
+        src.emit(indent, "if {0} is not None and {1}({0}):".format(value, src.const(self.nested_cleaner(definition.model), "m")))
+        src.emit(indent + 1, "modified = True")
+
+    def emit_variable_defined_dict_clean(self, definition, container, key, indent, present):
+        src = self.src
+        self.emit_default(definition, container, key, indent, present)
+        cleaners = src.const({ k: self.nested_cleaner(m) for k, m in definition.models.items() }, "m")
+        value = src.name("v")
+        src.emit(indent, "{0} = {1}.get({2})".format(value, container, key))
+        src.emit(indent, "if {0} is not None and {1}.get({0}.get({2!r}))({0}):".format(value, cleaners, definition.check_field))
+        src.emit(indent + 1, "modified = True")
+
+    EMITTERS = {
+        Field.clean: emit_base_clean,
+        ListField.clean: emit_list_clean,
+        DateTimeField.clean: emit_datetime_clean,
+        MapField.clean: emit_map_clean,
+        DefinedDictField.clean: emit_defined_dict_clean,
+        VariableDefinedDictField.clean: emit_variable_defined_dict_clean,
+    }
+
+
+# the (owner, name) being compiled, the compilation is serialized by _compile_lock so a function
+# being compiled by another thread is waited for instead of being mistaken for a model that nests itself
+_compiling = set()
+_compile_lock = threading.RLock()
+
+def _get_compiled(owner, name, compile_function):
+    """return the function compiled for owner (a model or a field) under name,
+    compiling it with compile_function if needed.
+
+    The compiled functions are stored in owner._compiled.
+    If the function is still being compiled (a model that nest itself), a function that looks it up
+    when it is called is returned instead.
+    """
+    compiled = owner.__dict__.get("_compiled")
+    function = None if compiled is None else compiled.get(name)
+    if function is None:
+        with _compile_lock:
+            compiled = owner.__dict__.get("_compiled")
+            if compiled is None:
+                compiled = owner._compiled = {}
+            function = compiled.get(name)
+            if function is not None:
+                return function
+            if (owner, name) in _compiling:
+                return lambda *args: _get_compiled(owner, name, compile_function)(*args)
+            _compiled_owners.add(owner)
+            _compiling.add((owner, name))
+            try:
+                function = compile_function()
+            finally:
+                _compiling.discard((owner, name))
+            compiled[name] = function
+    return function
+
+def _discard_compiled():
+    """discard the compiled functions of every model and field, they are compiled again on their next use
+    """
+    with _compile_lock:
+        for owner in list(_compiled_owners):
+            owner._compiled = {}
+
+# the models and fields with compiled functions, see _discard_compiled
+_compiled_owners = weakref.WeakSet()
+
+#################################### Profiling ####################################
+class FieldCounter(object):
+    """The counters of one operation of one field of a model, see enable_profiling
+
+    calls               the number of times the field was validated, cleaned or updated
+    seconds             the cumulative time, including the nested models
+    errors              the number of errors found, including the nested models (validation only)
+    """
+    __slots__ = ("model", "key", "operation", "calls", "seconds", "errors")
+
+    def __init__(self, model, key, operation):
+        self.model = model
+        self.key = key
+        self.operation = operation
+        self.reset()
+
+    def add(self, seconds, errors=0):
+        self.calls += 1
+        self.seconds += seconds
+        self.errors += errors
+
+    def reset(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.errors = 0
+
+    def to_dict(self):
+        return {
+            "model": self.model.__name__,
+            "key": self.key,
+            "operation": self.operation,
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "errors": self.errors,
+        }
+
+
+class _Profiler(object):
+    """The FieldCounter of each model, field and operation
+    """
+
+    def __init__(self):
+        self.counters = {}
+
+    def counter(self, model, key, operation):
+        counter = self.counters.get((model, key, operation))
+        if counter is None:
+            counter = self.counters[(model, key, operation)] = FieldCounter(model, key, operation)
+        return counter
+
+
+_profiler = None
+
+def enable_profiling():
+    """start counting the calls, time and errors of each field of every model in
+    get_document_errors, is_document_valid, validate_many, clean_document and update.
+
+    The compiled functions of the models are compiled again with the counters, so profiling
+    costs nothing while it is disabled. Enabling it again keeps the current counters.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = _Profiler()
+        _discard_compiled()
+
+def disable_profiling():
+    """stop profiling and discard the counters
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler = None
+        _discard_compiled()
+
+def get_profile():
+    """returns the list of the counters (as FieldCounter.to_dict) that were called, the slowest first
+
+    returns an empty list if profiling is disabled
+    """
+    if _profiler is None:
+        return []
+    counters = [ c.to_dict() for c in _profiler.counters.values() if c.calls ]
+    counters.sort(key=lambda c: c["seconds"], reverse=True)
+    return counters
+
+def reset_profile():
+    """set all the counters to 0
+    """
+    if _profiler is not None:
+        for counter in _profiler.counters.values():
+            counter.reset()
+
+#################################### Reports ####################################
+class IndexBitmap(object):
+    """A compact set of non negative int, using a single bit for each int up to the largest one added
+    """
+
+    def __init__(self):
+        self._bits = bytearray()
+        self._count = 0
+
+    def add(self, index):
+        byte, bit = index >> 3, 1 << (index & 7)
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        if not self._bits[byte] & bit:
+            self._bits[byte] |= bit
+            self._count += 1
+
+    def __contains__(self, index):
+        byte = index >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (index & 7)))
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for byte, bits in enumerate(self._bits):
+            if bits:
+                for bit in range(8):
+                    if bits & (1 << bit):
+                        yield (byte << 3) + bit
+
+
+class ErrorSummary(object):
+    """The aggregated errors of one field path and error type
+
+    path                the path of the field, with "*" for list indices and map keys
+    error_type          one of the Field.ERROR_*
+    count               the number of times this error occurred
+    samples             the first max_samples offending values
+    documents           an IndexBitmap of the index of the documents with this error
+    """
+
+    def __init__(self, path, error_type):
+        self.path = path
+        self.error_type = error_type
+        self.count = 0
+        self.samples = []
+        self.documents = IndexBitmap()
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "error_type": self.error_type,
+            "count": self.count,
+            "samples": self.samples,
+            "documents": len(self.documents),
+        }
+
+
+class ValidationReport(object):
+    """A compact report of the errors of many documents, see DefinedDict.validate_many
+
+    total               the number of documents validated
+    invalid_documents   an IndexBitmap of the index of the invalid documents
+    errors              a dict of (path, error_type) : ErrorSummary
+    """
+
+    def __init__(self, max_samples=5):
+        self.max_samples = max_samples
+        self.total = 0
+        self.invalid_documents = IndexBitmap()
+        self.errors = {}
+
+    def add(self, index, errors):
+        """add the (path, error_type, value) errors of the document at index
+        """
+        self.invalid_documents.add(index)
+        for path, error_type, value in errors:
+            summary = self.errors.get((path, error_type))
+            if summary is None:
+                summary = self.errors[(path, error_type)] = ErrorSummary(path, error_type)
+            summary.count += 1
+            if len(summary.samples) < self.max_samples:
+                summary.samples.append(value)
+            summary.documents.add(index)
+
+    @property
+    def is_valid(self):
+        return len(self.invalid_documents) == 0
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "invalid": len(self.invalid_documents),
+            "errors": [ summary.to_dict() for summary in self.errors.values() ],
+        }
+
+#################################### Changes ####################################
+
+class ChangeSet(object):
+    """The changes made by DefinedDict.update to a document, see DefinedDict.update_with_changes
+
+    It can be passed as the touched of update, it records the old value of each path before it is
+    modified, the new values are read from the document. Paths under an already recorded path are
+    part of the change of that path and not recorded again.
+
+    document            the root document being updated
+    old                 a dict of path : the value before the update, ChangeSet.MISSING if the key was absent
+    """
+
+    MISSING = object()
+
+    def __init__(self, document):
+        self.document = document
+        self.old = {}
+
+    def add(self, path):
+        """record the current value of path, called by update before path is modified
+        """
+        if path in self.old:
+            return
+        for ind in range(1, len(path)):
+            if path[:ind] in self.old:
+                return
+        value = self.get(path)
+        if isinstance(value, dict): # DictField.update merges into the dict
+            value = dict(value)
+        self.old[path] = value
+
+    def get(self, path):
+        """returns the current value at path in the document, ChangeSet.MISSING if absent
+        """
+        value = self.document
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return ChangeSet.MISSING
+            value = value[key]
+        return value
+
+    def __iter__(self):
+        return iter(self.old)
+
+    def __len__(self):
+        return len(self.old)
+
+    def __contains__(self, path):
+        return path in self.old
+
+    def changes(self):
+        """returns a dict of path : (old, new) of the paths which value has changed
+
+        None and an absent key are considered the same.
+        """
+        result = {}
+        empty = (None, ChangeSet.MISSING)
+        for path, old in self.old.items():
+            new = self.get(path)
+            if old is new or (old in empty and new in empty):
+                continue
+            if old != new:
+                result[path] = (old, new)
+        return result
+
+    @property
+    def set(self):
+        """a dict of path : new value of the changed paths which have a value
+        """
+        return {path: new for path, (old, new) in self.changes().items()
+                if new is not None and new is not ChangeSet.MISSING}
+
+    @property
+    def unset(self):
+        """a list of the changed paths which are now None or absent
+        """
+        return [path for path, (old, new) in self.changes().items()
+                if new is None or new is ChangeSet.MISSING]
+
+    def __repr__(self):
+        return "<ChangeSet set={0} unset={1}>".format(self.set, self.unset)
+
 #################################### Documents ####################################
+def _to_schema_value(value):
+    """describe value for DefinedDict.to_schema
+    """
+    if isinstance(value, Field):
+        attrs = { k: _to_schema_value(v) for k, v in vars(value).items() if k != "_compiled" }
+        return { "$field": type(value), "attrs": attrs }
+    if isinstance(value, type) and issubclass(value, DefinedDict):
+        return value.to_schema()
+    if isinstance(value, dict):
+        return { k: _to_schema_value(v) for k, v in value.items() }
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_schema_value(v) for v in value)
+    return value
+
+
+# the attributes of a model class that are not lost when it is rebuilt from a schema
+_SCHEMA_ATTRIBUTES = { "__module__", "__qualname__", "__doc__", "__dict__", "__weakref__", "__annotations__",
+    "__firstlineno__", "__static_attributes__", "_fields", "_mixins", "_field_table", "_compiled" }
+
+
+def _import_model(module, qualname):
+    """returns the class named qualname in module, None if it can not be imported
+    """
+    if "<locals>" in qualname:
+        return None
+    try:
+        model = importlib.import_module(module)
+        for name in qualname.split("."):
+            model = getattr(model, name)
+    except (ImportError, AttributeError):
+        return None
+    if isinstance(model, type) and issubclass(model, DefinedDict):
+        return model
+    return None
+
+
+def _schema_lost_attributes(model):
+    """returns the names of the attributes of model and its bases, other than the fields and
+    mixins, that would be lost if the model is rebuilt from its schema
+    """
+    names = []
+    for base in model.__mro__:
+        if base in (DefinedDict, object) or issubclass(base, Mixin):
+            continue
+        names.extend(k for k, v in vars(base).items() if not isinstance(v, Field) and k not in _SCHEMA_ATTRIBUTES)
+    return names
+
+
+def _from_schema_value(value):
+    """rebuild a value described by _to_schema_value
+    """
+    if isinstance(value, dict):
+        if "$field" in value:
+            field = value["$field"].__new__(value["$field"])
+            field.__dict__.update({ k: _from_schema_value(v) for k, v in value["attrs"].items() })
+            return field
+        if "$model" in value:
+            model = _import_model(value["module"], value["qualname"])
+            try:
+                if model is not None and model.to_schema() == value:
+                    return model
+            except (TypeError, ValueError):
+                pass
+            fields = { key: _from_schema_value(v) for key, v in value["fields"].items() }
+            return type(value["$model"], tuple(value["mixins"]) + (DefinedDict, ), fields)
+        return { k: _from_schema_value(v) for k, v in value.items() }
+    if isinstance(value, (list, tuple)):
+        return type(value)(_from_schema_value(v) for v in value)
+    return value
+
+
+def _frozen_choices(choices):
+    """returns choices as a frozenset for O(1) membership tests, None if it has unhashable values
+    """
+    if choices is None:
+        return None
+    try:
+        return frozenset(choices)
+    except TypeError:
+        return None
+
+
+class FieldEntry(collections.namedtuple("FieldEntry", (
+        "key", "definition", "kind", "store_key", "choices", "reversed_choices", "model", "models", "labels"))):
+    """The facts about a field of a model, computed once in DefinedDictMetaClass, see DefinedDict._field_table
+
+    key                 the key of the field in the document
+    definition          the field
+    kind                one of the KIND_ values
+    store_key           the key when stored, store_field if defined else key
+    choices             the choices as a frozenset, None if there is no choices
+    reversed_choices    the reversed_choices of dict choices, None otherwise
+    model               the nested model of a KIND_MODEL, KIND_MODEL_LIST or KIND_MODEL_MAP field
+    models              the dict of type : model of a KIND_VARIABLE field
+    labels              the labels of the field as a frozenset, None if there is no labels
+    """
+
+    KIND_VALUE = "value"
+    KIND_DATETIME = "datetime"
+    KIND_DICT = "dict"
+    KIND_LIST = "list"
+    KIND_MODEL_LIST = "model_list"
+    KIND_MAP = "map"
+    KIND_MODEL_MAP = "model_map"
+    KIND_MODEL = "model"
+    KIND_VARIABLE = "variable"
+
+    @classmethod
+    def from_field(cls, key, definition):
+        inner_model = getattr(getattr(definition, "inner_type", None), "model", None)
+        if isinstance(definition, VariableDefinedDictField):
+            kind = cls.KIND_VARIABLE
+        elif isinstance(definition, DefinedDictField):
+            kind = cls.KIND_MODEL
+        elif isinstance(definition, MapField):
+            kind = cls.KIND_MAP if inner_model is None else cls.KIND_MODEL_MAP
+        elif isinstance(definition, DictField):
+            kind = cls.KIND_DICT
+        elif isinstance(definition, ListField):
+            kind = cls.KIND_LIST if inner_model is None else cls.KIND_MODEL_LIST
+        elif isinstance(definition, DateTimeField):
+            kind = cls.KIND_DATETIME
+        else:
+            kind = cls.KIND_VALUE
+        labels = getattr(definition, "labels", None)
+        if labels is not None:
+            labels = frozenset([labels] if isinstance(labels, str) else labels)
+        return cls(
+            key=key,
+            definition=definition,
+            kind=kind,
+            store_key=getattr(definition, "store_field", key),
+            choices=_frozen_choices(definition.choices),
+            reversed_choices=getattr(definition, "reversed_choices", None),
+            model=getattr(definition, "model", inner_model),
+            models=getattr(definition, "models", None) if kind == cls.KIND_VARIABLE else None,
+            labels=labels,
+        )
+
+
 class DefinedDictMetaClass(type):
     """Meta class
     """
@@ -686,77 +1991,271 @@ class DefinedDictMetaClass(type):
                 for m in base._mixins:
                     m._apply_mixin(cls, name, bases, cdict)
                     cls._mixins.append(m)
+        # the per field facts used by the engines, so they are not derived for each document
+        cls._field_table = tuple(FieldEntry.from_field(k, v) for k, v in cls._fields.items())
+        # the validator is otherwise compiled on first use
+        if cls.compile_on_create:
+            cls._get_validator()
 
 
 class DefinedDict(object, metaclass=DefinedDictMetaClass):
     """The main definition object
+
+    compile_on_create           True to compile the validator when the class is created instead of
+                                on the first validation. (default: False)
     """
 
+    compile_on_create = False
+
+    @classmethod
+    def add_field(cls, key, definition):
+        """add a field to the model after it is created, i.e. a field that nests the model itself
+
+        The field table of the model is rebuilt and the compiled functions of every model and field
+        are discarded, since the models that nest this one embed its compiled functions.
+        _fields should not be modified directly.
+        """
+        if definition.dict_key is None:
+            definition.dict_key = key
+        cls._fields[definition.dict_key] = definition
+        cls._field_table = tuple(FieldEntry.from_field(k, v) for k, v in cls._fields.items())
+        cls._compiled = {}
+        _discard_compiled()
+
+    @classmethod
+    def _get_validator(cls):
+        """return the compiled validator of this model, compiling it if needed
+
+        See _ValidatorCompiler
+        """
+        return _get_compiled(cls, "validator", cls._compile_validator)
+
+    @classmethod
+    def _compile_validator(cls):
+        if cls._yield_errors.__func__ is not DefinedDict._yield_errors.__func__:
+            # _yield_errors is overridden, respect it
+            def validator(document, parent, errors):
+                errors.extend(cls._yield_errors(document, parent=parent))
+            return validator
+        return _ValidatorCompiler(cls).compile()
+
+    @classmethod
+    def _get_checker(cls):
+        """return the compiled validity only checker of this model, compiling it if needed
+
+        See _CheckerCompiler
+        """
+        return _get_compiled(cls, "checker", cls._compile_checker)
+
+    @classmethod
+    def _compile_checker(cls):
+        if cls._yield_errors.__func__ is not DefinedDict._yield_errors.__func__:
+            # _yield_errors is overridden, respect it
+            return lambda document: next(cls._yield_errors(document), None) is None
+        if _profiler is not None:
+            # the fields are counted by the validator
+            validator = cls._get_validator()
+            def checker(document):
+                errors = []
+                validator(document, None, errors)
+                return not errors
+            return checker
+        return _CheckerCompiler(cls).compile()
+
+    @classmethod
+    def _get_reporter(cls):
+        """return the compiled reporter of this model, compiling it if needed
+
+        See _ReporterCompiler
+        """
+        return _get_compiled(cls, "reporter", cls._compile_reporter)
+
+    @classmethod
+    def _get_limited_validator(cls):
+        """return the compiled validator of this model that stops at a number of errors, compiling it if needed
+
+        See _LimitedValidatorCompiler
+        """
+        return _get_compiled(cls, "limited_validator", cls._compile_limited_validator)
+
+    @classmethod
+    def _compile_limited_validator(cls):
+        if cls._yield_errors.__func__ is not DefinedDict._yield_errors.__func__:
+            # _yield_errors is overridden, respect it
+            def validator(document, parent, errors, limit):
+                for error in cls._yield_errors(document, parent=parent):
+                    errors.append(error)
+                    if len(errors) >= limit:
+                        raise _ErrorLimitReached
+            return validator
+        return _LimitedValidatorCompiler(cls).compile()
+
+    @classmethod
+    def _compile_reporter(cls):
+        if cls._yield_errors.__func__ is not DefinedDict._yield_errors.__func__:
+            return cls._compile_validator()
+        return _ReporterCompiler(cls).compile()
+
+    @classmethod
+    def _get_cleaner(cls, set_default=True, remove_undefined=True):
+        """return the compiled cleaner of this model for these options, compiling it if needed
+
+        See _CleanerCompiler
+        """
+        set_default, remove_undefined = bool(set_default), bool(remove_undefined)
+        return _get_compiled(cls, ("cleaner", set_default, remove_undefined),
+                lambda: _CleanerCompiler(cls, set_default, remove_undefined).compile())
+
     @classmethod
     def _yield_errors(cls, document, parent=None):
         """generator to retrieve error from document, internal used
 
         See get_document_errors
         """
-        for key, definition in cls._fields.items():
-            key = definition.dict_key or key # use dict_key if present
-            key_string = key if parent is None else ".".join([parent, key])
-            value = document.get(key)
-            yield from definition.errors(value, with_key=key_string)
+        for entry in cls._field_table:
+            key_string = entry.key if parent is None else ".".join([parent, entry.key])
+            yield from entry.definition.errors(document.get(entry.key), with_key=key_string)
 
     @classmethod
-    def get_document_errors(cls, document):
+    def get_document_errors(cls, document, max_errors=None, fail_fast=False):
         """returns all the document errors
+
+        max_errors              stop validating as soon as max_errors errors are found (default: None, no limit)
+        fail_fast               True to stop at the first error, same as max_errors=1 (default: False)
+
+        With a limit, the first max_errors errors are returned, in the same order as without limit.
         """
-        return list(cls._yield_errors(document))
+        if fail_fast:
+            max_errors = 1 if max_errors is None else min(max_errors, 1)
+        errors = []
+        if max_errors is None:
+            cls._get_validator()(document, None, errors)
+        elif max_errors > 0:
+            try:
+                cls._get_limited_validator()(document, None, errors, max_errors)
+            except _ErrorLimitReached:
+                pass
+        return errors
 
     @classmethod
     def is_document_valid(cls, document):
         """return True if there is no errors, False otherwise
         """
-        try:
-            next(cls._yield_errors(document))
-            return False
-        except StopIteration:
-            return True
+        return cls._get_checker()(document)
+
+    @classmethod
+    def validate_many(cls, documents, max_samples=5):
+        """validate an iterable of documents and return a ValidationReport
+
+        documents               any iterable of documents, it is only iterated once
+        max_samples             the number of offending values kept for each field path and error type
+
+        The errors are aggregated by field path, where list indices and map keys are "*",
+        so the size of the report does not grow with the number of failing documents.
+        """
+        report = ValidationReport(max_samples=max_samples)
+        reporter = cls._get_reporter()
+        errors = []
+        for index, document in enumerate(documents):
+            reporter(document, None, errors)
+            if errors:
+                report.add(index, errors)
+                errors.clear()
+            report.total += 1
+        return report
 
     @classmethod
     def make_default(cls):
         """return a default value for this model
         """
-        return { (definition.dict_key or key) : definition.make_default() for key, definition in cls._fields.items() }
+        return { entry.key : entry.definition.make_default() for entry in cls._field_table }
 
     @classmethod
-    def clean_document(cls, document, set_default=True, remove_undefined=True):
+    def clean_document(cls, document, set_default=True, remove_undefined=True, report_modified=False):
         """clean the dictionary using the model definition
 
         document                the dictionary to clean
         set_default             True to set all keys to default value. (default: True)
         remove_undefined        True to remove all keys that are not defined in the model (default: True)
+        report_modified         True to return (document, modified) instead of the document, where modified
+                                is True if the cleaning changed the document (default: False)
+
+        A document that is already clean is not modified and nothing is allocated to clean it.
         """
         if document is None:
-            return document
-
-        # iterate all keys and recursively clean
-        for key, definition in cls._fields.items():
-            key = definition.dict_key or key
-            definition.clean(document, key, set_default=set_default, remove_undefined=remove_undefined)
-
-        # pop keys if remove_undefined is True
-        if remove_undefined:
-            for key in set(document.keys()) - set(cls._fields.keys()) : # remove all the undefined keys
-                document.pop(key)
+            return (document, False) if report_modified else document
 
+        # the compiled cleaner recursively clean all keys and pop the undefined keys
+        modified = cls._get_cleaner(set_default, remove_undefined)(document)
+        if report_modified:
+            return document, modified
         return document
 
     @classmethod
-    def update(cls, document, new_value):
+    def update(cls, document, new_value, touched=None, path=()):
         """Recursively update the dictionary
+
+        touched                 if provided, a set where the path (a tuple of keys) of each
+                                modified field is added to. See validate_paths
+        path                    the prefix of the paths added to touched
         """
+        profiler = _profiler
         for key, value in new_value.items():
             if key in cls._fields:
                 definition = cls._fields.get(key)
-                definition.update(document, key, value)
+                if profiler is None:
+                    _update_field(definition, document, key, value, touched, path)
+                else:
+                    start = time.perf_counter()
+                    _update_field(definition, document, key, value, touched, path)
+                    profiler.counter(cls, key, "update").add(time.perf_counter() - start)
+
+    @classmethod
+    def update_with_changes(cls, document, new_value):
+        """update the document like update, returns a ChangeSet of the modified paths
+
+        Only the changes need to be persisted, e.g. the ChangeSet.set and ChangeSet.unset paths.
+        """
+        changes = ChangeSet(document)
+        cls.update(document, new_value, touched=changes)
+        return changes
+
+    @classmethod
+    def validate_paths(cls, document, paths):
+        """returns the errors of the fields at paths only, in the same order as get_document_errors.
+
+        paths                   an iterable of tuple of keys, i.e. the touched of update
+
+        Each path is validated with all the fields under it, so after an update, only the touched
+        paths needs to be validated again.
+        """
+        tree = {}
+        for path in paths:
+            node = tree
+            for ind, key in enumerate(path):
+                if ind == len(path) - 1:
+                    node[key] = None
+                else:
+                    node = node.setdefault(key, {})
+                    if node is None: # a parent is already validated as a whole
+                        break
+        errors = []
+        cls._validate_tree(document, tree, None, errors)
+        return errors
+
+    @classmethod
+    def _validate_tree(cls, document, tree, parent, errors):
+        """validate the fields of document in tree, see validate_paths
+
+        tree                    a dict of key : subtree, a subtree of None means the whole field
+        """
+        for entry in cls._field_table:
+            if entry.key in tree:
+                key_string = entry.key if parent is None else ".".join([parent, entry.key])
+                value = document.get(entry.key)
+                subtree = tree[entry.key]
+                if subtree is None or not entry.definition._validate_tree(value, subtree, key_string, errors):
+                    errors.extend(entry.definition.errors(value, with_key=key_string))
 
     @classmethod
     def from_dict(cls, name, fields):
@@ -767,3 +2266,121 @@ class DefinedDict(object, metaclass=DefinedDictMetaClass):
         fields              a dictionary containinig the key: Field mappings
         """
         return type(name, (cls, ), fields)
+
+    @classmethod
+    def to_schema(cls):
+        """returns a picklable description of this model, see from_schema.
+
+        Unlike the model itself, the description can be pickled even if the model is created
+        with from_dict or inside a function, as long as the field classes, mixins, defaults and
+        choices can be pickled.
+
+        The description is a dict
+            {"$model": name, "module": module, "qualname": qualname, "mixins": [mixin, ...],
+             "fields": { dict_key: field description }}
+        where a field description is {"$field": field class, "attrs": { attribute: value }}
+        and nested fields and models in the attributes are also described.
+
+        raises ValueError if the model can not be imported by module and qualname, and defines
+        methods or attributes other than fields, since they can not be described.
+        """
+        if _import_model(cls.__module__, cls.__qualname__) is not cls:
+            lost = _schema_lost_attributes(cls)
+            if lost:
+                raise ValueError("{0} can not be described, it can not be imported and defines {1}".format(
+                    cls.__qualname__, ", ".join(sorted(set(lost)))))
+        mixins = []
+        for mixin in cls._mixins:
+            if mixin not in mixins:
+                mixins.append(mixin)
+        return {
+            "$model": cls.__name__,
+            "module": cls.__module__,
+            "qualname": cls.__qualname__,
+            "mixins": mixins,
+            "fields": { key: _to_schema_value(definition) for key, definition in cls._fields.items() },
+        }
+
+    @staticmethod
+    def from_schema(schema):
+        """returns the model described by a description created by to_schema
+
+        The model is imported by module and qualname if it has the same description, i.e. it is defined
+        at the top level of a module, otherwise a new model is created with the fields and mixins.
+        """
+        return _from_schema_value(schema)
+
+    @classmethod
+    def _read_json_lines(cls, fileobj, loads_json=False, clean=True):
+        """generator of (line, document) for each non empty line of fileobj.
+        document is None if the line is not a valid json object.
+        """
+        loads_json = loads_json and hasattr(cls, "loads_json")
+        for line in fileobj:
+            if not line.strip():
+                continue
+            try:
+                document = json.loads(line)
+            except ValueError:
+                yield line, None
+                continue
+            if not isinstance(document, dict):
+                yield line, None
+                continue
+            if loads_json:
+                cls.loads_json(document)
+            if clean:
+                cls.clean_document(document)
+            yield line, document
+
+    @classmethod
+    def iter_clean(cls, fileobj, loads_json=False):
+        """generator that reads JSON Lines from fileobj and yields each document cleaned.
+
+        fileobj                 any iterable of lines, text or bytes. i.e. an opened file
+        loads_json              True to run loads_json on each document if the model has it,
+                                i.e. JsonStorageMixin (default: False)
+
+        Lines that are not valid json objects are skipped.
+        """
+        for line, document in cls._read_json_lines(fileobj, loads_json=loads_json):
+            if document is not None:
+                yield document
+
+    @classmethod
+    def iter_validate(cls, fileobj, clean=True, loads_json=False, valid=None, invalid=None):
+        """generator that reads JSON Lines from fileobj and yields (document, errors) for each line.
+
+        fileobj                 any iterable of lines, text or bytes. i.e. an opened file
+        clean                   True to clean each document before validating it (default: True)
+        loads_json              True to run loads_json on each document if the model has it,
+                                i.e. JsonStorageMixin (default: False)
+        valid                   if provided, a text file object where the valid documents are written to
+        invalid                 if provided, a text file object where the invalid documents are written to
+
+        A line that is not a valid json object is yielded as (None, [(None, "json", line)]) and
+        written to invalid as it is. Bytes that are not valid utf-8 are replaced with U+FFFD.
+        The documents are written as JSON Lines, using dumps_json if loads_json is True.
+        Only one document is held in memory at any time.
+        """
+        dumps_json = loads_json and hasattr(cls, "dumps_json")
+        for line, document in cls._read_json_lines(fileobj, loads_json=loads_json, clean=clean):
+            if document is None:
+                errors = [(None, "json", line)]
+                if invalid is not None:
+                    if isinstance(line, bytes):
+                        line = line.decode(errors="replace")
+                    invalid.write(line if line.endswith("\n") else line + "\n")
+                yield document, errors
+                continue
+
+            errors = cls.get_document_errors(document)
+            sink = invalid if errors else valid
+            if sink is not None:
+                stored = document
+                if dumps_json:
+                    stored = copy.deepcopy(document)
+                    cls.dumps_json(stored)
+                sink.write(json.dumps(stored, default=str))
+                sink.write("\n")
+            yield document, errors
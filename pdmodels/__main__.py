@@ -0,0 +1,49 @@
+"""
+Clean and validate JSON Lines with a model
+
+    python -m pdmodels package.module.Model [input] [--valid FILE] [--invalid FILE]
+
+The valid documents are written to --valid (default: stdout), the invalid documents to --invalid
+(default: discarded). A summary is written to stderr.
+"""
+import argparse
+import importlib
+import sys
+
+def load_model(path):
+    """return the model from a dotted path, i.e. package.module.Model
+    """
+    module_name, _, name = path.rpartition(".")
+    if not module_name:
+        raise ValueError("model needs to be a dotted path, i.e. package.module.Model : {0}".format(path))
+    return getattr(importlib.import_module(module_name), name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pdmodels", description="Clean and validate JSON Lines with a model")
+    parser.add_argument("model", help="dotted path of the model, i.e. package.module.Model")
+    parser.add_argument("input", nargs="?", default="-", help="JSON Lines file to read (default: stdin)")
+    parser.add_argument("--valid", default="-", help="file to write the valid documents to (default: stdout)")
+    parser.add_argument("--invalid", default=None, help="file to write the invalid documents to (default: discard)")
+    parser.add_argument("--no-clean", dest="clean", action="store_false", help="do not clean the documents")
+    parser.add_argument("--loads-json", action="store_true", help="run loads_json/dumps_json of the model, see JsonStorageMixin")
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model)
+    fileobj = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    valid = sys.stdout if args.valid == "-" else open(args.valid, "w")
+    invalid = None if args.invalid is None else open(args.invalid, "w")
+
+    counts = { True: 0, False: 0 }
+    try:
+        for document, errors in model.iter_validate(fileobj, clean=args.clean, loads_json=args.loads_json,
+                valid=valid, invalid=invalid):
+            counts[not errors] += 1
+    finally:
+        for f in (fileobj, valid, invalid):
+            if f is not None and f not in (sys.stdin.buffer, sys.stdout):
+                f.close()
+    sys.stderr.write("{0} valid, {1} invalid\n".format(counts[True], counts[False]))
+    return 0 if counts[False] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+
+"""
+MIT License
+
+Copyright (c) [2017] [Zwodahs]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from .. import *
+from .. import _ValidatorCompiler, _get_compiled
+import asyncio
+import json
+
+
+class _AsyncValidatorCompiler(_ValidatorCompiler):
+    """Generates the validator as a generator that yields before each field check,
+    including each item of a ListField or a MapField.
+
+    The errors are the same as the validator, the yields let AsyncMixin.avalidate
+    give control back to the event loop.
+    """
+
+    def compile(self):
+        self.src.emit(1, "yield")
+        return super().compile()
+
+    def emit_field(self, definition, value, key, indent):
+        self.src.emit(indent, "yield")
+        super().emit_field(definition, value, key, indent)
+
+    def nested(self, model):
+        return _get_async_validator(model)
+
+    def emit_nested(self, indent, function, value, key):
+        self.src.emit(indent, "yield from {0}({1}, {2}, errors)".format(function, value, key))
+
+
+def _get_async_validator(model):
+    def compile_function():
+        if model._yield_errors.__func__ is not DefinedDict._yield_errors.__func__:
+            # _yield_errors is overridden, respect it
+            def validator(document, parent, errors):
+                for error in model._yield_errors(document, parent=parent):
+                    errors.append(error)
+                    yield
+            return validator
+        return _AsyncValidatorCompiler(model).compile()
+    return _get_compiled(model, "async_validator", compile_function)
+
+
+class AsyncMixin(Mixin):
+    """
+    Async mixin validates documents without blocking the event loop.
+
+    avalidate gives control back to the event loop every yield_every field checks, so a large
+    document (i.e. a ListField with many items) does not delay the other tasks.
+    aiter_validate reads JSON Lines from an asyncio.StreamReader through a bounded queue.
+    """
+
+    YIELD_EVERY = 1000
+
+    @classmethod
+    async def avalidate(cls, document, yield_every=None):
+        """returns all the document errors, same as get_document_errors
+
+        yield_every             the number of field checks between each yield to the event loop
+                                (default: YIELD_EVERY)
+        """
+        yield_every = yield_every or cls.YIELD_EVERY
+        errors = []
+        count = 0
+        for _ in _get_async_validator(cls)(document, None, errors):
+            count += 1
+            if count >= yield_every:
+                count = 0
+                await asyncio.sleep(0)
+        return errors
+
+    @classmethod
+    async def _read_stream(cls, reader, queue, clean, loads_json, yield_every):
+        """read the documents from reader, validate them and put them in queue.
+        the end of the stream is marked with None.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    document = json.loads(line)
+                except ValueError:
+                    document = None
+                if not isinstance(document, dict):
+                    await queue.put((None, [(None, "json", line)]))
+                    continue
+                if loads_json:
+                    cls.loads_json(document)
+                if clean:
+                    cls.clean_document(document)
+                await queue.put((document, await cls.avalidate(document, yield_every=yield_every)))
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    @classmethod
+    async def aiter_validate(cls, reader, clean=True, loads_json=False, queue_size=100, yield_every=None):
+        """async generator that reads JSON Lines from reader and yields (document, errors) for each line.
+
+        reader                  an asyncio.StreamReader
+        clean                   True to clean each document before validating it (default: True)
+        loads_json              True to run loads_json on each document if the model has it,
+                                i.e. JsonStorageMixin (default: False)
+        queue_size              the number of validated documents that can wait for the consumer.
+                                When the queue is full, the stream is not read until the consumer
+                                catches up. (default: 100)
+        yield_every             see avalidate
+
+        A line that is not a valid json object is yielded as (None, [(None, "json", line)])
+        """
+        loads_json = loads_json and hasattr(cls, "loads_json")
+        queue = asyncio.Queue(maxsize=queue_size)
+        task = asyncio.ensure_future(cls._read_stream(reader, queue, clean, loads_json, yield_every))
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            task.cancel()
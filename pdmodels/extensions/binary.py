@@ -0,0 +1,983 @@
+
+"""
+MIT License
+
+Copyright (c) [2017] [Zwodahs]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from .. import *
+from .. import _EPOCH, _SourceBuilder, _get_compiled
+import array
+import datetime
+import hashlib
+import itertools
+import operator
+import struct
+import sys
+
+"""
+Schema driven binary encoding of documents.
+
+The keys of the defined fields are written as their index in the model, the values of the known
+fields are written without a type tag: IntField, FloatField and DateTimeField as 8 bytes, BoolField
+as 1 byte, choices as their index in the choices, StringField as a length prefixed UTF-8 string,
+DefinedDictField, ListField and MapField recursively. A value that does not match its field (i.e. an
+invalid document) and the undefined keys are written with a type tag, so any document can be encoded.
+
+The work is done by as few calls as possible: the fixed width fields of a model are packed by one
+struct generated for the model, the lists and maps of numbers, bools, datetimes and choices are packed
+with array or bytes, and the lists of strings are encoded and decoded as a single string.
+
+The encoding starts with a header containing a fingerprint of the model, a document can only be
+decoded by a model with the same fields.
+"""
+
+_MAGIC = b"PDB2"
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_DATETIME_AWARE = struct.Struct("<qq")
+_TAGGED_INT = struct.Struct("<Bq")
+_TAGGED_FLOAT = struct.Struct("<Bd")
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_TZINFO = operator.attrgetter("tzinfo")
+_LITTLE_ENDIAN = sys.byteorder == "little"
+_MIN_INT = -(1 << 63)
+_MAX_INT = (1 << 63) - 1
+
+# the type tags of the values that are not written by their field
+_NONE, _FALSE, _TRUE, _INT_TAG, _FLOAT_TAG, _STR, _BYTES, _LIST, _TUPLE, _DICT, _DATETIME_TAG, _DATETIME_AWARE_TAG = range(12)
+
+
+def _write_varint(out, value):
+    """write a non negative int, 7 bits per byte
+    """
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    """returns the int at pos and the position after it
+    """
+    byte = data[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_str(out, value):
+    value = value.encode("utf-8", "surrogatepass")
+    _write_varint(out, len(value))
+    out += value
+
+
+def _read_str(data, pos):
+    size, pos = _read_varint(data, pos)
+    return data[pos:pos + size].decode("utf-8", "surrogatepass"), pos + size
+
+
+def _microseconds(value):
+    """the microseconds of a datetime since the epoch, naive datetime are UTC
+    """
+    return datetime_to_int(value, 1e6, TIMEZONE_UTC)
+
+
+def _write_value(out, value):
+    """write any value with its type tag
+    """
+    value_type = type(value)
+    if value is None:
+        out.append(_NONE)
+    elif value is False:
+        out.append(_FALSE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value_type is int:
+        out.append(_INT_TAG)
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1) # zigzag, any size
+    elif value_type is float:
+        out.append(_FLOAT_TAG)
+        out += _FLOAT.pack(value)
+    elif value_type is str:
+        out.append(_STR)
+        _write_str(out, value)
+    elif value_type is bytes:
+        out.append(_BYTES)
+        _write_varint(out, len(value))
+        out += value
+    elif value_type is list or value_type is tuple:
+        out.append(_LIST if value_type is list else _TUPLE)
+        _write_varint(out, len(value))
+        for item in value:
+            _write_value(out, item)
+    elif value_type is dict:
+        out.append(_DICT)
+        _write_varint(out, len(value))
+        for k, v in value.items():
+            _write_value(out, k)
+            _write_value(out, v)
+    elif value_type is datetime.datetime:
+        offset = value.utcoffset()
+        if offset is None:
+            out.append(_DATETIME_TAG)
+            out += _INT.pack(_microseconds(value))
+        else:
+            out.append(_DATETIME_AWARE_TAG)
+            out += _DATETIME_AWARE.pack(_microseconds(value), offset // datetime.timedelta(microseconds=1))
+    else:
+        raise TypeError("cannot encode {0!r} of type {1}".format(value, value_type.__name__))
+
+
+def _read_value(data, pos):
+    """returns the value written by _write_value at pos and the position after it
+    """
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _INT_TAG:
+        value, pos = _read_varint(data, pos)
+        return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+    if tag == _FLOAT_TAG:
+        return _FLOAT.unpack_from(data, pos)[0], pos + 8
+    if tag == _STR:
+        return _read_str(data, pos)
+    if tag == _BYTES:
+        size, pos = _read_varint(data, pos)
+        return bytes(data[pos:pos + size]), pos + size
+    if tag == _LIST or tag == _TUPLE:
+        size, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(size):
+            item, pos = _read_value(data, pos)
+            items.append(item)
+        return (items if tag == _LIST else tuple(items)), pos
+    if tag == _DICT:
+        size, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(size):
+            k, pos = _read_value(data, pos)
+            result[k], pos = _read_value(data, pos)
+        return result, pos
+    if tag == _DATETIME_TAG:
+        return _EPOCH + datetime.timedelta(microseconds=_INT.unpack_from(data, pos)[0]), pos + 8
+    if tag == _DATETIME_AWARE_TAG:
+        microseconds, offset = _DATETIME_AWARE.unpack_from(data, pos)
+        timezone = datetime.timezone(datetime.timedelta(microseconds=offset))
+        value = _EPOCH + datetime.timedelta(microseconds=microseconds)
+        return value.replace(tzinfo=datetime.timezone.utc).astimezone(timezone), pos + 16
+    raise DictValueError("invalid binary document: unknown type tag {0} at {1}".format(tag, pos - 1))
+
+
+class _FieldCodec(object):
+    """How the values of a field are written without a type tag.
+
+    accepts(value)                  True if value can be written by write
+    write(out, value)               write the value
+    read(data, pos)                 returns the value and the position after it
+    write_items(out, items)         write a list of values, returns False if one of them is not accepted,
+                                    the output is then truncated by the caller
+    read_items(data, pos, size)     returns the list of size values written by write_items and the
+                                    position after it
+    """
+
+    def __init__(self, accepts, write, read, write_items=None, read_items=None):
+        self.accepts = accepts
+        self.write = write
+        self.read = read
+        self.write_items = write_items or self._write_items
+        self.read_items = read_items or self._read_items
+
+    def _write_items(self, out, items):
+        accepts, write = self.accepts, self.write
+        for item in items:
+            if not accepts(item):
+                return False
+            write(out, item)
+        return True
+
+    def _read_items(self, data, pos, size):
+        read = self.read
+        items = []
+        for _ in range(size):
+            item, pos = read(data, pos)
+            items.append(item)
+        return items, pos
+
+
+def _check_size(data, end):
+    if end > len(data):
+        raise DictValueError("invalid binary document: truncated at {0}".format(len(data)))
+
+
+def _array_items(typecode, item_type):
+    """returns write_items and read_items packing the values of item_type in an array of typecode
+    """
+    def write_items(out, items):
+        if not set(map(type, items)) <= { item_type }:
+            return False
+        try:
+            packed = array.array(typecode, items)
+        except OverflowError:
+            return False
+        if not _LITTLE_ENDIAN:
+            packed.byteswap()
+        out += packed
+        return True
+
+    def read_items(data, pos, size):
+        end = pos + size * 8
+        _check_size(data, end)
+        packed = array.array(typecode)
+        packed.frombytes(data[pos:end])
+        if not _LITTLE_ENDIAN:
+            packed.byteswap()
+        return packed.tolist(), end
+
+    return write_items, read_items
+
+_write_int_items, _read_int_items = _array_items("q", int)
+_write_float_items, _read_float_items = _array_items("d", float)
+
+def _write_bool_items(out, items):
+    if not set(map(type, items)) <= { bool }:
+        return False
+    out += bytes(items)
+    return True
+
+def _read_bool_items(data, pos, size):
+    _check_size(data, pos + size)
+    return list(map((1).__eq__, data[pos:pos + size])), pos + size
+
+def _write_datetime_items(out, items):
+    if not set(map(type, items)) <= { datetime.datetime } or not set(map(_TZINFO, items)) <= { None }:
+        return False
+    return _write_int_items(out, list(map(operator.floordiv, map(operator.sub, items, itertools.repeat(_EPOCH)),
+        itertools.repeat(_MICROSECOND))))
+
+def _read_datetime_items(data, pos, size):
+    microseconds, pos = _read_int_items(data, pos, size)
+    zeros = itertools.repeat(0)
+    return list(map(_EPOCH.__add__, map(datetime.timedelta, zeros, zeros, microseconds))), pos
+
+def _write_str_items(out, items):
+    """write the strings joined by NUL if none of them contains it, else the length of each string, in
+    characters, and all the strings encoded at once
+    """
+    if not set(map(type, items)) <= { str }:
+        return False
+    if not items:
+        return True
+    text = "\x00".join(items)
+    if text.count("\x00") == len(items) - 1:
+        out.append(0)
+        _write_str(out, text)
+        return True
+    out.append(1)
+    lengths = list(map(len, items))
+    if max(lengths) > 0x7f:
+        for length in lengths:
+            _write_varint(out, length)
+    else:
+        out += bytes(lengths) # varints of a single byte
+    _write_str(out, "".join(items))
+    return True
+
+def _read_str_items(data, pos, size):
+    if not size:
+        return [], pos
+    if data[pos] == 0:
+        text, pos = _read_str(data, pos + 1)
+        items = text.split("\x00")
+        if len(items) != size:
+            raise DictValueError("invalid binary document: bad string count at {0}".format(pos))
+        return items, pos
+    pos += 1
+    _check_size(data, pos + size)
+    lengths = data[pos:pos + size]
+    if max(lengths) > 0x7f:
+        lengths = []
+        for _ in range(size):
+            length, pos = _read_varint(data, pos)
+            lengths.append(length)
+    else:
+        pos += size
+    text, pos = _read_str(data, pos)
+    offsets = list(itertools.accumulate(lengths, initial=0))
+    if offsets[-1] != len(text):
+        raise DictValueError("invalid binary document: bad string lengths at {0}".format(pos))
+    return list(map(text.__getitem__, map(slice, offsets, offsets[1:]))), pos
+
+
+def _accepts_int(value):
+    return type(value) is int and _MIN_INT <= value <= _MAX_INT
+
+def _write_int(out, value):
+    out += _INT.pack(value)
+
+def _read_int(data, pos):
+    return _INT.unpack_from(data, pos)[0], pos + 8
+
+def _accepts_float(value):
+    return type(value) is float
+
+def _write_float(out, value):
+    out += _FLOAT.pack(value)
+
+def _read_float(data, pos):
+    return _FLOAT.unpack_from(data, pos)[0], pos + 8
+
+def _accepts_bool(value):
+    return type(value) is bool
+
+def _write_bool(out, value):
+    out.append(value)
+
+def _read_bool(data, pos):
+    return data[pos] == 1, pos + 1
+
+def _accepts_datetime(value):
+    return type(value) is datetime.datetime and value.tzinfo is None
+
+def _write_datetime(out, value):
+    out += _INT.pack(_microseconds(value))
+
+def _read_datetime(data, pos):
+    return _EPOCH + datetime.timedelta(microseconds=_INT.unpack_from(data, pos)[0]), pos + 8
+
+def _accepts_str(value):
+    return type(value) is str
+
+def _accepts_dict(value):
+    return type(value) is dict
+
+_INT_CODEC = _FieldCodec(_accepts_int, _write_int, _read_int, _write_int_items, _read_int_items)
+_FLOAT_CODEC = _FieldCodec(_accepts_float, _write_float, _read_float, _write_float_items, _read_float_items)
+_BOOL_CODEC = _FieldCodec(_accepts_bool, _write_bool, _read_bool, _write_bool_items, _read_bool_items)
+_DATETIME_CODEC = _FieldCodec(_accepts_datetime, _write_datetime, _read_datetime, _write_datetime_items, _read_datetime_items)
+_STR_CODEC = _FieldCodec(_accepts_str, _write_str, _read_str, _write_str_items, _read_str_items)
+
+
+class _ChoicesCodec(_FieldCodec):
+    """The codec writing the index of the value in choices.
+
+    value_type is the type of all the choices, None if they have different types. When it is set and
+    there are at most 256 choices, the index is a single byte, packed with the fixed width fields.
+    """
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+        types = set(map(type, values))
+        self.value_type = types.pop() if len(types) == 1 else None
+        write_items = read_items = None
+        if self.value_type is not None and len(values) <= 0x100:
+            write_items, read_items = self._write_code_items, self._read_code_items
+        super().__init__(self._accepts, self._write, self._read, write_items, read_items)
+
+    def _accepts(self, value):
+        try:
+            return value in self.codes and type(value) is type(self.values[self.codes[value]])
+        except TypeError:
+            return False
+
+    def _write(self, out, value):
+        _write_varint(out, self.codes[value])
+
+    def _read(self, data, pos):
+        code, pos = _read_varint(data, pos)
+        return self.values[code], pos
+
+    def _write_code_items(self, out, items):
+        if not set(map(type, items)) <= { self.value_type } or not all(map(self.codes.__contains__, items)):
+            return False
+        out += bytes(map(self.codes.__getitem__, items))
+        return True
+
+    def _read_code_items(self, data, pos, size):
+        _check_size(data, pos + size)
+        return list(map(self.values.__getitem__, data[pos:pos + size])), pos + size
+
+
+def _choices_codec(choices):
+    """the codec writing the index of the value in choices, None if choices has no stable order
+    """
+    if not isinstance(choices, (list, tuple, dict)):
+        return None # the iteration order of a set is not stable between processes
+    values = list(choices)
+    try:
+        codes = { v: code for code, v in enumerate(values) }
+    except TypeError:
+        return None
+    if len(codes) != len(values):
+        return None
+    return _ChoicesCodec(values, codes)
+
+
+def _list_codec(inner):
+    """the codec of a list which items are written by inner.write_items if they all can be, else with their type tag
+    """
+    def write(out, value):
+        _write_varint(out, len(value))
+        flag = len(out)
+        out.append(0)
+        if not inner.write_items(out, value):
+            del out[flag:]
+            out.append(1)
+            for item in value:
+                _write_value(out, item)
+
+    def read(data, pos):
+        size, pos = _read_varint(data, pos)
+        if data[pos] == 0:
+            return inner.read_items(data, pos + 1, size)
+        pos += 1
+        items = []
+        for _ in range(size):
+            item, pos = _read_value(data, pos)
+            items.append(item)
+        return items, pos
+
+    return _FieldCodec(lambda value: type(value) is list, write, read)
+
+
+def _map_codec(inner):
+    """the codec of a dict of str, the keys are written by _STR_CODEC.write_items and the values by
+    inner.write_items if they all can be, else with their type tag
+    """
+    def write(out, value):
+        _write_varint(out, len(value))
+        flag = len(out)
+        out.append(0)
+        if not (_STR_CODEC.write_items(out, list(value)) and inner.write_items(out, list(value.values()))):
+            del out[flag:]
+            out.append(1)
+            for k, v in value.items():
+                _write_value(out, k)
+                _write_value(out, v)
+
+    def read(data, pos):
+        size, pos = _read_varint(data, pos)
+        if data[pos] == 0:
+            keys, pos = _read_str_items(data, pos + 1, size)
+            values, pos = inner.read_items(data, pos, size)
+            return dict(zip(keys, values)), pos
+        pos += 1
+        result = {}
+        for _ in range(size):
+            k, pos = _read_value(data, pos)
+            result[k], pos = _read_value(data, pos)
+        return result, pos
+
+    return _FieldCodec(_accepts_dict, write, read)
+
+
+def _model_codec(model):
+    """the codec of a nested model
+    """
+    encoder = _get_encoder(model)
+    decoder = _get_decoder(model)
+
+    def write_items(out, items):
+        if not set(map(type, items)) <= { dict }:
+            return False
+        for item in items:
+            encoder(out, item)
+        return True
+
+    return _FieldCodec(_accepts_dict, encoder, decoder, write_items)
+
+
+def _variable_codec(definition):
+    """the codec of a VariableDefinedDictField, the index of the type, in the order of the fingerprint,
+    is written before the document of its model
+    """
+    check_field = definition.check_field
+    models = definition.models
+    types = sorted(models, key=repr)
+    codes = { _type: code for code, _type in enumerate(types) }
+
+    def accepts(value):
+        try:
+            return type(value) is dict and value.get(check_field) in codes
+        except TypeError:
+            return False
+
+    encoders = [ None ] * len(types)
+    decoders = []
+
+    def write(out, value):
+        code = codes[value[check_field]]
+        _write_varint(out, code)
+        encoder = encoders[code]
+        if encoder is None:
+            encoder = encoders[code] = _get_encoder(models[types[code]])
+        encoder(out, value)
+
+    def read(data, pos):
+        code, pos = _read_varint(data, pos)
+        if not decoders:
+            decoders.extend(_get_decoder(models[_type]) for _type in types)
+        if code >= len(decoders):
+            raise DictValueError("invalid binary document: unknown {0} at {1}".format(check_field, pos))
+        return decoders[code](data, pos)
+
+    def write_items(out, items):
+        for item in items:
+            if not accepts(item):
+                return False
+            write(out, item)
+        return True
+
+    def read_items(data, pos, size):
+        if not decoders:
+            decoders.extend(_get_decoder(models[_type]) for _type in types)
+        items = []
+        for _ in range(size):
+            code = data[pos]
+            if code >= len(decoders): # also a code that is not written in a single byte
+                item, pos = read(data, pos)
+            else:
+                item, pos = decoders[code](data, pos + 1)
+            items.append(item)
+        return items, pos
+
+    return _FieldCodec(accepts, write, read, write_items, read_items)
+
+
+def _field_codec(definition):
+    """returns the _FieldCodec of definition, None if its values are always written with their type tag
+    """
+    choices = getattr(definition, "choices", None)
+    if choices is not None:
+        return _choices_codec(choices)
+    if isinstance(definition, VariableDefinedDictField):
+        return _variable_codec(definition)
+    if isinstance(definition, DefinedDictField):
+        return _model_codec(definition.model)
+    if isinstance(definition, MapField):
+        inner = _field_codec(definition.inner_type)
+        return None if inner is None else _map_codec(inner)
+    if isinstance(definition, ListField):
+        inner = _field_codec(definition.inner_type) if definition.inner_type is not None else None
+        return None if inner is None else _list_codec(inner)
+    if isinstance(definition, BoolField):
+        return _BOOL_CODEC
+    if isinstance(definition, IntField):
+        return _INT_CODEC
+    if isinstance(definition, FloatField):
+        return _FLOAT_CODEC
+    if isinstance(definition, DateTimeField):
+        return _DATETIME_CODEC
+    if isinstance(definition, StringField):
+        return _STR_CODEC
+    return None
+
+
+def _keys_encoder(model, codecs):
+    """returns encode(out, document) writing each key of document.
+
+    The document starts with a varint of the number of keys * 2, each key is written as a varint of
+    index * 2 + tagged, the index of an undefined key is the number of fields and it is followed by
+    the key. tagged is 1 if the value is written with its type tag.
+    """
+    fields = {}
+    for index, entry in enumerate(model._field_table):
+        fields[entry.key] = (index * 2, index * 2 + 1, codecs[index])
+    undefined = len(model._field_table) * 2 + 1
+
+    def encode(out, document):
+        _write_varint(out, len(document) * 2)
+        for key, value in document.items():
+            field = fields.get(key)
+            if field is None:
+                _write_varint(out, undefined)
+                _write_value(out, key)
+                _write_value(out, value)
+                continue
+            typed, tagged, codec = field
+            if value is not None and codec is not None and codec.accepts(value):
+                _write_varint(out, typed)
+                codec.write(out, value)
+            else:
+                _write_varint(out, tagged)
+                _write_value(out, value)
+
+    return encode
+
+
+def _keys_decoder(model, codecs):
+    """returns decode(data, pos, size) reading the size keys written by _keys_encoder
+    """
+    keys = [entry.key for entry in model._field_table]
+    reads = [getattr(codec, "read", None) for codec in codecs]
+    undefined = len(keys)
+
+    def decode(data, pos, size):
+        document = {}
+        for _ in range(size):
+            code, pos = _read_varint(data, pos)
+            index = code >> 1
+            if index == undefined:
+                key, pos = _read_value(data, pos)
+                document[key], pos = _read_value(data, pos)
+            elif index > undefined:
+                raise DictValueError("invalid binary document: unknown field {0} at {1}".format(index, pos))
+            elif code & 1:
+                document[keys[index]], pos = _read_value(data, pos)
+            else:
+                document[keys[index]], pos = reads[index](data, pos)
+        return document, pos
+
+    return decode
+
+
+class _BinaryCompiler(object):
+    """Generates the encoder and the decoder of a model.
+
+    A document which keys are exactly the fields of the model, in the same order (i.e. a cleaned
+    document), is written as a varint of the number of fields * 2 + 1, without the keys.
+
+    If the model has fixed width fields (int, float, bool, naive datetime and choices of a single
+    type), a byte follows: 0 if all of them hold a value of their type, which are then packed by a
+    single struct of the model, followed by the other fields; 1 if they are not, and all the fields
+    follow. Each of the fields that follow is written after a byte that is 0 if the value is written
+    by its field and 1 if it is written with its type tag. The fixed width and string values are
+    written and read inline, the others through their _FieldCodec.
+
+    Any other document is written by _keys_encoder.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.codecs = [_field_codec(entry.definition) for entry in model._field_table]
+        header = bytearray()
+        _write_varint(header, len(self.codecs) * 2 + 1)
+        self.header = bytes(header)
+        self.fixed = [ index for index, codec in enumerate(self.codecs) if self.fixed_format(codec) is not None ]
+        self.packer = struct.Struct("<" + "".join(self.fixed_format(self.codecs[index]) for index in self.fixed))
+        self.src = _SourceBuilder()
+        self.indent = 0
+
+    def emit(self, level, line):
+        self.src.emit(self.indent + level, line)
+
+    def fixed_format(self, codec):
+        """returns the struct format of the values written by codec when they are packed, None if they
+        are not fixed width
+        """
+        if codec is _INT_CODEC or codec is _DATETIME_CODEC:
+            return "q"
+        if codec is _FLOAT_CODEC:
+            return "d"
+        if codec is _BOOL_CODEC:
+            return "?"
+        if isinstance(codec, _ChoicesCodec) and codec.value_type is not None and len(codec.values) <= 0x100:
+            return "B"
+        return None
+
+    def compile_encoder(self):
+        src = self.src
+        keys = [entry.key for entry in self.model._field_table]
+        self.emit(1, "if list(document) != {0}:".format(src.const(keys, "keys")))
+        self.emit(2, "return {0}(out, document)".format(src.const(_keys_encoder(self.model, self.codecs), "encode")))
+        if not self.fixed:
+            self.emit(1, "out += {0!r}".format(self.header))
+            self.emit_fields(range(len(keys)))
+        else:
+            checks, values = [], []
+            for index in self.fixed:
+                self.emit(1, "v{0} = document[{1!r}]".format(index, keys[index]))
+                check, value = self.fixed_value(self.codecs[index], "v{0}".format(index))
+                checks.append(check)
+                values.append(value)
+            self.emit(1, "packed = None")
+            self.emit(1, "if {0}:".format(" and ".join(checks)))
+            self.emit(2, "try:")
+            self.emit(3, "packed = {0}({1})".format(src.const(self.packer.pack, "pack"), ", ".join(values)))
+            self.emit(2, "except {0}:".format(src.const(struct.error, "error")))
+            self.emit(3, "pass # an int that does not fit in 8 bytes")
+            self.emit(1, "if packed is not None:")
+            self.emit(2, "out += {0!r}".format(self.header + b"\x00"))
+            self.emit(2, "out += packed")
+            self.indent = 1
+            self.emit_fields([ index for index in range(len(keys)) if index not in self.fixed ])
+            self.indent = 0
+            self.emit(1, "else:")
+            self.emit(2, "out += {0!r}".format(self.header + b"\x01"))
+            self.indent = 1
+            self.emit_fields(range(len(keys)))
+            self.indent = 0
+        return src.build("encode", ("out", "document"), "<pdmodels binary encoder {0}>".format(self.model.__name__))
+
+    def fixed_value(self, codec, name):
+        """returns the check that the value in name is packed by codec and the expression of the packed value
+        """
+        src = self.src
+        if codec is _INT_CODEC:
+            return "type({0}) is int".format(name), name
+        if codec is _FLOAT_CODEC:
+            return "type({0}) is float".format(name), name
+        if codec is _BOOL_CODEC:
+            return "type({0}) is bool".format(name), name
+        if codec is _DATETIME_CODEC:
+            return ("type({0}) is {1} and {0}.tzinfo is None".format(name, src.const(datetime.datetime, "dt")),
+                "({0} - {1}) // {2}".format(name, src.const(_EPOCH, "epoch"), src.const(_MICROSECOND, "us")))
+        codes = src.const(codec.codes, "codes")
+        return ("type({0}) is {1} and {0} in {2}".format(name, src.const(codec.value_type, "t"), codes),
+            "{0}[{1}]".format(codes, name))
+
+    def emit_fields(self, indexes):
+        """emit the writing of the fields at indexes, each one after a byte that is 0 if it is written by its field
+        """
+        src = self.src
+        for index in indexes:
+            entry, codec = self.model._field_table[index], self.codecs[index]
+            if index in self.fixed:
+                self.emit(1, "value = v{0}".format(index))
+            else:
+                self.emit(1, "value = document[{0!r}]".format(entry.key))
+            if codec is not None:
+                self.emit(1, self.typed_check(codec, src.const(codec, "codec")))
+                self.emit_write(codec, src.const(codec, "codec"))
+                self.emit(1, "elif value is None:")
+            else:
+                self.emit(1, "if value is None:")
+            self.emit(2, "out += {0!r}".format(bytes([1, _NONE])))
+            self.emit(1, "else:")
+            self.emit(2, "out.append(1)")
+            self.emit(2, "{0}(out, value)".format(src.const(_write_value, "write")))
+
+    def typed_check(self, codec, name):
+        """returns the if statement that checks that a not None value is written by codec
+        """
+        if codec is _INT_CODEC:
+            return "if type(value) is int and {0} <= value <= {1}:".format(_MIN_INT, _MAX_INT)
+        if codec is _FLOAT_CODEC:
+            return "if type(value) is float:"
+        if codec is _BOOL_CODEC:
+            return "if type(value) is bool:"
+        if codec is _DATETIME_CODEC:
+            return "if type(value) is {0} and value.tzinfo is None:".format(self.src.const(datetime.datetime, "dt"))
+        if codec is _STR_CODEC:
+            return "if type(value) is str:"
+        return "if {0}.accepts(value):".format(name)
+
+    def emit_write(self, codec, name):
+        src = self.src
+        if codec is _INT_CODEC:
+            self.emit(2, "out += {0}(0, value)".format(src.const(_TAGGED_INT.pack, "pack")))
+        elif codec is _FLOAT_CODEC:
+            self.emit(2, "out += {0}(0, value)".format(src.const(_TAGGED_FLOAT.pack, "pack")))
+        elif codec is _BOOL_CODEC:
+            self.emit(2, "out.append(0)")
+            self.emit(2, "out.append(value)")
+        elif codec is _DATETIME_CODEC:
+            self.emit(2, "out += {0}(0, (value - {1}) // {2})".format(src.const(_TAGGED_INT.pack, "pack"),
+                src.const(_EPOCH, "epoch"), src.const(_MICROSECOND, "us")))
+        elif codec is _STR_CODEC:
+            self.emit(2, "value = value.encode('utf-8', 'surrogatepass')")
+            self.emit(2, "if len(value) < 128:")
+            self.emit(3, "out.append(0)")
+            self.emit(3, "out.append(len(value))")
+            self.emit(2, "else:")
+            self.emit(3, "out.append(0)")
+            self.emit(3, "{0}(out, len(value))".format(src.const(_write_varint, "varint")))
+            self.emit(2, "out += value")
+        else:
+            self.emit(2, "out.append(0)")
+            self.emit(2, "{0}.write(out, value)".format(name))
+
+    def compile_decoder(self):
+        src = self.src
+        keys = [entry.key for entry in self.model._field_table]
+        if len(self.header) == 1:
+            self.emit(1, "if data[pos] != {0}:".format(self.header[0]))
+        else:
+            self.emit(1, "if data[pos:pos + {0}] != {1!r}:".format(len(self.header), self.header))
+        self.emit(2, "size, start = {0}(data, pos)".format(src.const(_read_varint, "varint")))
+        self.emit(2, "if not size & 1:")
+        self.emit(3, "return {0}(data, start, size >> 1)".format(src.const(_keys_decoder(self.model, self.codecs), "decode")))
+        self.emit(2, "raise {0}('invalid binary document: bad field count at ' + str(pos))".format(src.const(DictValueError, "error")))
+        self.emit(1, "pos += {0}".format(len(self.header)))
+        if self.fixed:
+            self.emit(1, "if data[pos] == 0:")
+            self.emit(2, "{0}, = {1}(data, pos + 1)".format(", ".join("v{0}".format(i) for i in self.fixed),
+                src.const(self.packer.unpack_from, "unpack")))
+            self.emit(2, "pos += {0}".format(1 + self.packer.size))
+            items = []
+            for index, key in enumerate(keys):
+                value = self.fixed_read(self.codecs[index], "v{0}".format(index)) if index in self.fixed else "None"
+                items.append("{0!r}: {1}".format(key, value))
+            self.emit(2, "document = {{{0}}}".format(", ".join(items)))
+            self.indent = 1
+            self.emit_reads([ index for index in range(len(keys)) if index not in self.fixed ])
+            self.indent = 0
+            self.emit(2, "return document, pos")
+            self.emit(1, "pos += 1")
+        self.emit(1, "document = {}")
+        self.emit_reads(range(len(keys)))
+        self.emit(1, "return document, pos")
+        return src.build("decode", ("data", "pos"), "<pdmodels binary decoder {0}>".format(self.model.__name__))
+
+    def fixed_read(self, codec, name):
+        """returns the expression of the value packed by codec in name
+        """
+        src = self.src
+        if codec is _DATETIME_CODEC:
+            return "{0} + {1}(0, 0, {2})".format(src.const(_EPOCH, "epoch"), src.const(datetime.timedelta, "td"), name)
+        if isinstance(codec, _ChoicesCodec):
+            return "{0}[{1}]".format(src.const(codec.values, "values"), name)
+        return name
+
+    def emit_reads(self, indexes):
+        """emit the reading of the fields at indexes written by emit_fields
+        """
+        src = self.src
+        for index in indexes:
+            entry, codec = self.model._field_table[index], self.codecs[index]
+            key = repr(entry.key)
+            if codec is not None:
+                self.emit(1, "if not data[pos]:")
+                self.emit_read(codec, src.const(codec, "codec"), key)
+                self.emit(1, "elif data[pos + 1] == {0}:".format(_NONE))
+            else:
+                self.emit(1, "if data[pos + 1] == {0}:".format(_NONE))
+            self.emit(2, "document[{0}] = None".format(key))
+            self.emit(2, "pos += 2")
+            self.emit(1, "else:")
+            self.emit(2, "document[{0}], pos = {1}(data, pos + 1)".format(key, src.const(_read_value, "read")))
+
+    def emit_read(self, codec, name, key):
+        src = self.src
+        if codec is _INT_CODEC:
+            self.emit(2, "document[{0}] = {1}(data, pos + 1)[0]".format(key, src.const(_INT.unpack_from, "unpack")))
+            self.emit(2, "pos += 9")
+        elif codec is _FLOAT_CODEC:
+            self.emit(2, "document[{0}] = {1}(data, pos + 1)[0]".format(key, src.const(_FLOAT.unpack_from, "unpack")))
+            self.emit(2, "pos += 9")
+        elif codec is _BOOL_CODEC:
+            self.emit(2, "document[{0}] = data[pos + 1] == 1".format(key))
+            self.emit(2, "pos += 2")
+        elif codec is _DATETIME_CODEC:
+            self.emit(2, "document[{0}] = {1} + {2}(microseconds={3}(data, pos + 1)[0])".format(key,
+                src.const(_EPOCH, "epoch"), src.const(datetime.timedelta, "td"), src.const(_INT.unpack_from, "unpack")))
+            self.emit(2, "pos += 9")
+        elif codec is _STR_CODEC:
+            self.emit(2, "size = data[pos + 1]")
+            self.emit(2, "if size < 128:")
+            self.emit(3, "pos += 2")
+            self.emit(2, "else:")
+            self.emit(3, "size, pos = {0}(data, pos + 1)".format(src.const(_read_varint, "varint")))
+            self.emit(2, "document[{0}] = data[pos:pos + size].decode('utf-8', 'surrogatepass')".format(key))
+            self.emit(2, "pos += size")
+        else:
+            self.emit(2, "document[{0}], pos = {1}.read(data, pos + 1)".format(key, name))
+
+
+def _get_encoder(model):
+    return _get_compiled(model, "binary_encoder", lambda: _BinaryCompiler(model).compile_encoder())
+
+
+def _get_decoder(model):
+    return _get_compiled(model, "binary_decoder", lambda: _BinaryCompiler(model).compile_decoder())
+
+
+def _describe(model, seen):
+    """a description of the fields of model that changes when the encoding of its documents changes
+    """
+    if model in seen:
+        return model.__name__
+    seen = seen | { model }
+    description = []
+    for entry in model._field_table:
+        definition = entry.definition
+        fields = [type(definition).__name__, entry.key]
+        while definition is not None:
+            choices = getattr(definition, "choices", None)
+            if isinstance(choices, (list, tuple, dict)):
+                fields.append(repr(list(choices)))
+            if isinstance(definition, DefinedDictField):
+                fields.append(_describe(definition.model, seen))
+            if isinstance(definition, VariableDefinedDictField):
+                fields.append(repr(sorted((repr(k), _describe(m, seen)) for k, m in definition.models.items())))
+            definition = getattr(definition, "inner_type", None)
+            if definition is not None:
+                fields.append(type(definition).__name__)
+        description.append(fields)
+    return repr(description)
+
+
+class BinaryMixin(Mixin):
+    """
+    Binary mixin encodes documents in a compact binary form, using the fields of the model instead of
+    writing the keys. Only a model with the same fields can decode the documents.
+    """
+
+    @classmethod
+    def binary_fingerprint(cls):
+        """returns the 8 bytes fingerprint of the fields of this model, written in the header
+        """
+        return _get_compiled(cls, "binary_fingerprint",
+                lambda: hashlib.blake2b(_describe(cls, frozenset()).encode("utf-8"), digest_size=8).digest())
+
+    @classmethod
+    def dumps_binary(cls, document):
+        """returns document encoded as bytes
+        """
+        out = bytearray(_MAGIC)
+        out += cls.binary_fingerprint()
+        _get_encoder(cls)(out, document)
+        return bytes(out)
+
+    @classmethod
+    def loads_binary(cls, data):
+        """returns the document encoded in data by dumps_binary, bytes, bytearray or memoryview
+
+        raises DictValueError if data is not encoded by a model with the same fields
+        """
+        if type(data) is not bytes:
+            data = bytes(data) # slicing and decoding bytes is faster than a memoryview
+        if data[:4] != _MAGIC:
+            raise DictValueError("invalid binary document: bad header")
+        if data[4:12] != cls.binary_fingerprint():
+            raise DictValueError("invalid binary document: encoded by a different model than {0}".format(cls.__name__))
+        try:
+            document, pos = _get_decoder(cls)(data, 12)
+        except (IndexError, struct.error, UnicodeDecodeError):
+            pos = len(data) + 1
+        if pos > len(data):
+            raise DictValueError("invalid binary document: truncated")
+        if pos != len(data):
+            raise DictValueError("invalid binary document: {0} trailing bytes".format(len(data) - pos))
+        return document
@@ -0,0 +1,335 @@
+
+"""
+MIT License
+
+Copyright (c) [2017] [Zwodahs]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from .. import *
+import collections
+import copy
+import itertools
+
+"""
+Validation result cache.
+
+Documents are looked up either by version, for documents wrapped with track, or by a key built
+from the content of the defined fields of the model.
+"""
+
+# every TrackedDict/TrackedList gets a new version from this counter on creation and on each
+# mutation of itself or of a tracked value inside it, so a version identifies a content
+_versions = itertools.count()
+
+
+def _wrap(value, parent):
+    if type(value) is dict:
+        return TrackedDict(value, _parent=parent)
+    if type(value) is list:
+        return TrackedList(value, _parent=parent)
+    if isinstance(value, _Tracked):
+        value._add_parent(parent)
+    return value
+
+
+class _Tracked(object):
+    """a tracked value keeps all the containers it was put in, a shallow copy or a value moved to
+    another document is shared, and a modification must change the version of each of them.
+    """
+
+    def _add_parent(self, parent):
+        if not any(p is parent for p in self._parents):
+            self._parents.append(parent)
+
+    def _changed(self):
+        nodes = [self]
+        for node in nodes:
+            node.version = next(_versions)
+            for parent in node._parents:
+                if not any(parent is n for n in nodes):
+                    nodes.append(parent)
+
+
+class TrackedDict(_Tracked, dict):
+    """A dict that gets a new version whenever it, or a dict/list inside it, is modified.
+
+    dict and list values are wrapped into TrackedDict and TrackedList when they are set,
+    so modifications made by DefinedDict.update and clean_document are also tracked.
+    copy returns a TrackedDict that shares the values, and both get a new version when one of them is modified.
+    """
+
+    def __init__(self, *args, _parent=None, **kwargs):
+        super().__init__()
+        self._parents = [] if _parent is None else [_parent]
+        self.version = next(_versions)
+        for k, v in dict(*args, **kwargs).items():
+            dict.__setitem__(self, k, _wrap(v, self))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, _wrap(value, self))
+        self._changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed()
+
+    def pop(self, *args):
+        result = dict.pop(self, *args)
+        self._changed()
+        return result
+
+    def popitem(self):
+        result = dict.popitem(self)
+        self._changed()
+        return result
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            dict.__setitem__(self, k, _wrap(v, self))
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        dict.clear(self)
+        self._changed()
+
+    def copy(self):
+        return TrackedDict(self)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return TrackedDict(copy.deepcopy(dict(self), memo))
+
+
+class TrackedList(_Tracked, list):
+    """A list that gets a new version whenever it, or a dict/list inside it, is modified.
+    """
+
+    def __init__(self, iterable=(), _parent=None):
+        self._parents = [] if _parent is None else [_parent]
+        super().__init__(_wrap(v, self) for v in iterable)
+        self.version = next(_versions)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [ _wrap(v, self) for v in value ]
+        else:
+            value = _wrap(value, self)
+        list.__setitem__(self, index, value)
+        self._changed()
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        list.__imul__(self, n)
+        self._changed()
+        return self
+
+    def append(self, value):
+        list.append(self, _wrap(value, self))
+        self._changed()
+
+    def extend(self, values):
+        list.extend(self, [ _wrap(v, self) for v in values ])
+        self._changed()
+
+    def insert(self, index, value):
+        list.insert(self, index, _wrap(value, self))
+        self._changed()
+
+    def pop(self, *args):
+        result = list.pop(self, *args)
+        self._changed()
+        return result
+
+    def remove(self, value):
+        list.remove(self, value)
+        self._changed()
+
+    def clear(self):
+        list.clear(self)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
+
+    def copy(self):
+        return TrackedList(self)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return TrackedList(copy.deepcopy(list(self), memo))
+
+
+def track(document):
+    """returns document wrapped into a TrackedDict, including all the dicts and lists inside it
+    """
+    return TrackedDict(document)
+
+
+def _content(value):
+    """returns a hashable key for the content of value, raises TypeError if it is not possible.
+
+    the type of each value is part of the key since validation tells 1, 1.0 and True apart.
+    """
+    if isinstance(value, dict):
+        return (dict, tuple((k, _content(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return (list, tuple(_content(v) for v in value))
+    hash(value)
+    return (type(value), value)
+
+
+def _field_content(definition, value):
+    """returns the content key of a value, only keeping the defined fields of nested models
+    """
+    if isinstance(value, dict):
+        if isinstance(definition, DefinedDictField):
+            return content_key(definition.model, value)
+        if isinstance(definition, VariableDefinedDictField):
+            model = definition._get_model(value)
+            if model is not None:
+                return content_key(model, value)
+        if isinstance(definition, MapField):
+            return (dict, tuple((k, _field_content(definition.inner_type, v)) for k, v in value.items()))
+    if isinstance(value, list) and isinstance(definition, ListField) and definition.inner_type is not None:
+        return (list, tuple(_field_content(definition.inner_type, v) for v in value))
+    return _content(value)
+
+
+def content_key(model, document):
+    """returns a hashable key of the content of document that is relevant to model.
+
+    Only the defined fields are part of the key, since the undefined keys do not change the errors.
+    raises TypeError if a value is not hashable.
+    """
+    return (model, tuple(_field_content(entry.definition, document.get(entry.key)) for entry in model._field_table))
+
+
+class ValidationCache(object):
+    """A LRU cache of the errors of documents
+
+    maxsize             the maximum number of results kept
+
+    hits, misses and evictions count the lookups since creation or the last reset.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._results = collections.OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "uncacheable": self.uncacheable,
+            "size": len(self._results),
+            "maxsize": self.maxsize,
+        }
+
+    def _key(self, model, document):
+        if isinstance(document, TrackedDict):
+            return (model, document.version)
+        try:
+            return content_key(model, document)
+        except TypeError:
+            return None
+
+    def get_document_errors(self, model, document, validate):
+        """returns the errors of document, calling validate(document) on a miss
+        """
+        key = self._key(model, document)
+        if key is None:
+            self.uncacheable += 1
+            return validate(document)
+        errors = self._results.get(key)
+        if errors is not None:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return list(errors)
+        self.misses += 1
+        errors = validate(document)
+        self._results[key] = tuple(errors)
+        if len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+            self.evictions += 1
+        return errors
+
+
+class ValidationCacheMixin(Mixin):
+    """
+    Validation cache mixin caches the result of get_document_errors and is_document_valid.
+
+    Documents wrapped with track are looked up by version, which changes on every modification,
+    including those made by update and clean_document.
+    Other documents are looked up by a key built from the content of their defined fields.
+
+    All the models share ValidationCacheMixin.validation_cache unless it is overridden in the model.
+    Set it to None to disable the cache.
+
+    get_document_errors with max_errors or fail_fast bypasses the cache, since the result is
+    truncated and must not be returned for a later call without limit.
+    """
+
+    validation_cache = ValidationCache()
+
+    @classmethod
+    def get_document_errors(cls, document, max_errors=None, fail_fast=False):
+        if cls.validation_cache is None or max_errors is not None or fail_fast:
+            return super().get_document_errors(document, max_errors=max_errors, fail_fast=fail_fast)
+        return cls.validation_cache.get_document_errors(cls, document, super().get_document_errors)
+
+    @classmethod
+    def is_document_valid(cls, document):
+        if cls.validation_cache is None:
+            return super().is_document_valid(document)
+        return len(cls.get_document_errors(document)) == 0
@@ -0,0 +1,417 @@
+
+"""
+MIT License
+
+Copyright (c) [2017] [Zwodahs]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from .. import *
+from .. import _get_compiled
+import datetime
+import itertools
+import json
+import mmap
+import os
+import numpy
+
+"""
+Memory mapped columnar storage of many documents of one model.
+
+A store is a directory with a file per column and a schema.json describing them:
+
+    <index>.values      IntField as int64, FloatField as float64, BoolField as bool and DateTimeField
+                        as int64 microseconds since the epoch (UTC)
+    <index>.nulls       one bool per document, True where the value is None (or missing)
+    <index>.offsets     for the other fields, count + 1 int64 offsets into <index>.blob
+    <index>.blob        StringField as UTF-8, the other values (nested documents, lists, maps, ...) as JSON,
+                        with the DateTimeField in them as int microseconds since the epoch (UTC)
+
+where index is the position of the field in the model. The files are opened with mmap, the fixed width
+columns are NumPy views of the mapped files and the documents are only made into dicts when asked.
+"""
+
+_SCHEMA_FILE = "schema.json"
+_SCHEMA_VERSION = 2
+_CHUNK_SIZE = 65536
+
+# the type of the columns
+_INT64, _FLOAT64, _BOOL, _DATETIME, _STR, _JSON = "int64", "float64", "bool", "datetime", "str", "json"
+_DTYPES = { _INT64: numpy.int64, _FLOAT64: numpy.float64, _BOOL: numpy.bool_, _DATETIME: numpy.int64 }
+
+
+def _column_type(entry):
+    """returns the column type of a FieldEntry
+    """
+    definition = entry.definition
+    if entry.kind == FieldEntry.KIND_DATETIME:
+        return _DATETIME
+    if entry.kind != FieldEntry.KIND_VALUE:
+        return _JSON
+    if isinstance(definition, IntField):
+        return _INT64
+    if isinstance(definition, FloatField):
+        return _FLOAT64
+    if isinstance(definition, BoolField):
+        return _BOOL
+    if isinstance(definition, StringField):
+        return _STR
+    return _JSON
+
+
+def _dumps_datetime(value):
+    return datetime_to_int(value, 1e6) if isinstance(value, datetime.datetime) else value
+
+
+def _loads_datetime(value):
+    return int_to_datetime(value, 1e6, TIMEZONE_UTC) if type(value) is int else value
+
+
+def _model_codec(model, models):
+    """returns the (dumps, loads) of the documents of model, see _field_codec
+    """
+    codec = models.get(model)
+    if codec is not None:
+        return codec
+    table = []
+
+    def dumps(value):
+        if type(value) is not dict:
+            return value
+        value = dict(value)
+        for key, field_dumps, _ in table:
+            v = value.get(key)
+            if v is not None:
+                value[key] = field_dumps(v)
+        return value
+
+    def loads(value):
+        if type(value) is not dict:
+            return value
+        for key, _, field_loads in table:
+            v = value.get(key)
+            if v is not None:
+                value[key] = field_loads(v)
+        return value
+
+    # registered before the fields, so a model nesting itself uses this codec
+    models[model] = codec = (dumps, loads)
+    for entry in model._field_table:
+        field_codec = _field_codec(entry.definition, models)
+        if field_codec is not None:
+            table.append((entry.key, ) + field_codec)
+    return codec
+
+
+def _field_codec(definition, models):
+    """returns the (dumps, loads) converting a value of definition to and from the JSON types, the DateTimeField
+    anywhere in the value are stored as int microseconds since the epoch. None if the value is stored as it is.
+
+    models is the cache of the codec of the nested models
+    """
+    if isinstance(definition, DateTimeField):
+        return _dumps_datetime, _loads_datetime
+    if isinstance(definition, VariableDefinedDictField):
+        codecs = { k: _model_codec(model, models) for k, model in definition.models.items() }
+        check_field = definition.check_field
+
+        def dumps(value):
+            codec = codecs.get(value.get(check_field)) if type(value) is dict else None
+            return value if codec is None else codec[0](value)
+
+        def loads(value):
+            codec = codecs.get(value.get(check_field)) if type(value) is dict else None
+            return value if codec is None else codec[1](value)
+        return dumps, loads
+    if isinstance(definition, DefinedDictField):
+        return _model_codec(definition.model, models)
+    inner_type = getattr(definition, "inner_type", None)
+    if inner_type is None:
+        return None
+    codec = _field_codec(inner_type, models)
+    if codec is None:
+        return None
+    inner_dumps, inner_loads = codec
+    if isinstance(definition, MapField):
+        return (lambda value: { k: None if v is None else inner_dumps(v) for k, v in value.items() } if type(value) is dict else value,
+                lambda value: { k: None if v is None else inner_loads(v) for k, v in value.items() } if type(value) is dict else value)
+    if isinstance(definition, ListField):
+        return (lambda value: [ None if v is None else inner_dumps(v) for v in value ] if type(value) is list else value,
+                lambda value: [ None if v is None else inner_loads(v) for v in value ] if type(value) is list else value)
+    return None
+
+
+def _json_codec(entry):
+    """returns the (dumps, loads) of a json column, converting the values with _field_codec
+    """
+    codec = _field_codec(entry.definition, {})
+    if codec is None:
+        return json.dumps, json.loads
+    dumps, loads = codec
+    return (lambda value: json.dumps(dumps(value)), lambda data: loads(json.loads(data)))
+
+
+class _StoredColumn(object):
+    """The column of a single field, how it is written and read
+    """
+
+    def __init__(self, index, entry):
+        self.index = index
+        self.key = entry.key
+        self.type = _column_type(entry)
+        if self.type == _JSON:
+            self.dumps, self.loads = _json_codec(entry)
+
+    def describe(self):
+        return { "key": self.key, "type": self.type }
+
+    def path(self, directory, suffix):
+        return os.path.join(directory, "{0}.{1}".format(self.index, suffix))
+
+    def write_chunk(self, files, values):
+        """append the values of a chunk of documents to the open files of this column
+        """
+        nulls = numpy.fromiter((v is None for v in values), dtype=numpy.bool_, count=len(values))
+        nulls.tofile(files["nulls"])
+        if self.type in _DTYPES:
+            if self.type == _DATETIME:
+                values = [ 0 if v is None else datetime_to_int(v, 1e6) for v in values ]
+            else:
+                values = [ 0 if v is None else v for v in values ]
+            try:
+                array = numpy.array(values, dtype=_DTYPES[self.type])
+            except (TypeError, ValueError, OverflowError) as e:
+                raise DictValueError("{0} can not be stored as {1}: {2}".format(self.key, self.type, e))
+            array.tofile(files["values"])
+            return
+        if self.type == _STR:
+            encoded = [ b"" if v is None else v.encode("utf-8", "surrogatepass") for v in values ]
+        else:
+            dumps = self.dumps
+            encoded = [ b"" if v is None else dumps(v).encode("utf-8") for v in values ]
+        lengths = numpy.fromiter(map(len, encoded), dtype=numpy.int64, count=len(encoded))
+        offsets = files["end"] + numpy.cumsum(lengths)
+        offsets.tofile(files["offsets"])
+        files["end"] = int(offsets[-1]) if len(offsets) else files["end"]
+        files["blob"].write(b"".join(encoded))
+
+
+def _map_array(path, dtype, count):
+    """returns a read only NumPy view of the file at path
+    """
+    if count == 0 or os.path.getsize(path) == 0:
+        return numpy.zeros(count, dtype=dtype)
+    return numpy.memmap(path, dtype=dtype, mode="r", shape=(count, ))
+
+
+def _map_blob(path):
+    """returns the mmap of the file at path, b"" if the file is empty
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ColumnStore(object):
+    """A store written by ColumnarMixin.build_columns, opened with ColumnarMixin.open_columns
+
+    len(store) is the number of documents, store[i] makes the i-th document into a dict and iterating the
+    store makes each document into a dict. column, nulls and values read a single field of all the documents.
+    """
+
+    def __init__(self, model, directory, columns, count):
+        self.model = model
+        self.directory = directory
+        self.count = count
+        self._columns = { column.key: column for column in columns }
+        self._nulls = {}
+        self._values = {}
+        self._offsets = {}
+        self._blobs = {}
+        for column in columns:
+            self._nulls[column.key] = _map_array(column.path(directory, "nulls"), numpy.bool_, count)
+            if column.type in _DTYPES:
+                self._values[column.key] = _map_array(column.path(directory, "values"), _DTYPES[column.type], count)
+            else:
+                self._offsets[column.key] = _map_array(column.path(directory, "offsets"), numpy.int64, count + 1)
+                self._blobs[column.key] = _map_blob(column.path(directory, "blob"))
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """release the mapped files, the arrays returned by column and nulls must not be used after close
+        """
+        for blob in self._blobs.values():
+            if isinstance(blob, mmap.mmap):
+                blob.close()
+        self._blobs = {}
+        self._values = {}
+        self._offsets = {}
+        self._nulls = {}
+
+    def _get_column(self, key):
+        column = self._columns.get(key)
+        if column is None:
+            raise DictFieldError("{0} is not a field of {1}".format(key, self.model.__name__))
+        return column
+
+    def column(self, key):
+        """returns the values of a IntField, FloatField, BoolField or DateTimeField as a NumPy array, without
+        copying them. DateTimeField are datetime64[us] (UTC), the rows that are None are 0, see nulls.
+        """
+        column = self._get_column(key)
+        if column.type not in _DTYPES:
+            raise DictFieldError("{0} is not a fixed width column, use values".format(key))
+        values = self._values[key]
+        if column.type == _DATETIME:
+            return values.view("datetime64[us]")
+        return values
+
+    def nulls(self, key):
+        """returns the NumPy bool array of the rows where the value of key is None
+        """
+        self._get_column(key)
+        return self._nulls[key]
+
+    def values(self, key, start=0, stop=None):
+        """returns the list of the values of key in the rows [start, stop), as they are in the documents
+        """
+        column = self._get_column(key)
+        start, stop, _ = slice(start, stop).indices(self.count)
+        return [ self._read(column, index) for index in range(start, stop) ]
+
+    def _read(self, column, index):
+        key = column.key
+        if self._nulls[key][index]:
+            return None
+        if column.type in _DTYPES:
+            value = self._values[key][index].item()
+            if column.type == _DATETIME:
+                return int_to_datetime(value, 1e6, TIMEZONE_UTC)
+            return value
+        offsets = self._offsets[key]
+        data = self._blobs[key][int(offsets[index]):int(offsets[index + 1])]
+        if column.type == _STR:
+            return str(data, "utf-8", "surrogatepass")
+        return column.loads(data)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("document index out of range")
+        return { key: self._read(column, index) for key, column in self._columns.items() }
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+
+class ColumnarMixin(Mixin):
+    """
+    Columnar mixin stores many documents of the model in a directory of memory mapped column files,
+    for scanning the fields of a large number of documents without loading them.
+
+    Only the defined fields are stored. FloatField are stored as float64, so an int value is read back
+    as a float. DateTimeField, including the ones in nested documents, lists and maps, are stored as
+    microseconds since the epoch and read back as naive UTC.
+    """
+
+    @classmethod
+    def _stored_columns(cls):
+        return _get_compiled(cls, "stored_columns",
+                lambda: [ _StoredColumn(index, entry) for index, entry in enumerate(cls._field_table) ])
+
+    @classmethod
+    def build_columns(cls, directory, documents, validate=True):
+        """write documents to a new store in directory and returns the number of documents written
+
+        directory               the directory of the store, created if it does not exist
+        documents               any iterable of cleaned documents, it is only iterated once
+        validate                True to raise DictValueError on the first invalid document (default: True)
+
+        schema.json is written last, a directory where the build failed can not be opened.
+        """
+        columns = cls._stored_columns()
+        os.makedirs(directory, exist_ok=True)
+        schema_path = os.path.join(directory, _SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            os.remove(schema_path)
+        files = []
+        count = 0
+        try:
+            for column in columns:
+                column_files = { "nulls": open(column.path(directory, "nulls"), "wb") }
+                if column.type in _DTYPES:
+                    column_files["values"] = open(column.path(directory, "values"), "wb")
+                else:
+                    column_files["offsets"] = open(column.path(directory, "offsets"), "wb")
+                    column_files["blob"] = open(column.path(directory, "blob"), "wb")
+                    column_files["end"] = 0
+                    numpy.zeros(1, dtype=numpy.int64).tofile(column_files["offsets"])
+                files.append(column_files)
+
+            documents = iter(documents)
+            while True:
+                chunk = list(itertools.islice(documents, _CHUNK_SIZE))
+                if not chunk:
+                    break
+                if validate:
+                    for index, document in enumerate(chunk):
+                        errors = cls.get_document_errors(document)
+                        if errors:
+                            raise DictValueError("document {0} is invalid: {1!r}".format(count + index, errors))
+                for column, column_files in zip(columns, files):
+                    key = column.key
+                    column.write_chunk(column_files, [ document.get(key) for document in chunk ])
+                count += len(chunk)
+        finally:
+            for column_files in files:
+                for f in column_files.values():
+                    if not isinstance(f, int):
+                        f.close()
+
+        with open(schema_path, "w") as f:
+            json.dump({ "version": _SCHEMA_VERSION, "count": count,
+                "columns": [ column.describe() for column in columns ] }, f)
+        return count
+
+    @classmethod
+    def open_columns(cls, directory):
+        """returns the ColumnStore in directory
+
+        raises DictValueError if the store was not written by a model with the same fields
+        """
+        try:
+            with open(os.path.join(directory, _SCHEMA_FILE)) as f:
+                schema = json.load(f)
+        except FileNotFoundError:
+            raise DictValueError("{0} is not a column store".format(directory))
+        columns = cls._stored_columns()
+        if schema.get("version") != _SCHEMA_VERSION or schema.get("columns") != [ c.describe() for c in columns ]:
+            raise DictValueError("{0} was not written by a model with the same fields as {1}".format(directory, cls.__name__))
+        return ColumnStore(cls, directory, columns, schema["count"])
@@ -22,7 +22,7 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
-from ..dict_model import *
+from .. import *
 
 class LabelMixin(Mixin):
     """
@@ -51,10 +51,10 @@ class LabelMixin(Mixin):
         labels = set(labels)
         exclude = set(exclude)
 
-        for key, definition in cls._fields.items():
-            if key in document and hasattr(definition, "labels"):
-                if (len(labels & definition.labels) > 0) and len(definition.labels & exclude) == 0:
+        for entry in cls._field_table:
+            key = entry.key
+            if key in document and entry.labels is not None:
+                if (len(labels & entry.labels) > 0) and len(entry.labels & exclude) == 0:
                     document.pop(key)
-            if isinstance(definition, DefinedDictField) and document.get(key) is not None and LabelMixin in definition.model._mixins:
-                definition.model.clean_labels(document.get(key), labels, exclude=exclude)
-
+            if entry.kind == FieldEntry.KIND_MODEL and document.get(key) is not None and LabelMixin in entry.model._mixins:
+                entry.model.clean_labels(document.get(key), labels, exclude=exclude)
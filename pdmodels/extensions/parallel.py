@@ -0,0 +1,98 @@
+
+"""
+MIT License
+
+Copyright (c) [2017] [Zwodahs]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from .. import *
+import collections
+import concurrent.futures
+import itertools
+import os
+
+"""
+Parallel cleaning and validation with a process pool.
+
+The model is sent to the workers as a description (see DefinedDict.to_schema) and imported or
+rebuilt once in each worker, so models created with from_dict or inside a function can also be used.
+The documents are sent in chunks and the results are yielded in the same order as the documents.
+"""
+
+# the model rebuilt in the worker process
+_worker_model = None
+
+def _init_worker(schema):
+    global _worker_model
+    _worker_model = DefinedDict.from_schema(schema)
+
+def _clean_chunk(documents, kwargs):
+    return [ _worker_model.clean_document(document, **kwargs) for document in documents ]
+
+def _validate_chunk(documents):
+    return [ _worker_model.get_document_errors(document) for document in documents ]
+
+def _chunks(documents, chunk_size):
+    documents = iter(documents)
+    while True:
+        chunk = list(itertools.islice(documents, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _run(model, function, documents, chunk_size, max_workers, args=()):
+    """run function on each chunk of documents in a process pool and yield the results in order.
+
+    At most 2 chunks per worker are pending at any time, so documents can be a generator of
+    any length.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+            initargs=(model.to_schema(), )) as executor:
+        pending = collections.deque()
+        for chunk in _chunks(documents, chunk_size):
+            pending.append(executor.submit(function, chunk, *args))
+            if len(pending) >= max_workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def parallel_clean(model, documents, chunk_size=1000, max_workers=None, **kwargs):
+    """generator that yields each document cleaned by model.clean_document, in order.
+
+    model                   the model to clean with
+    documents               an iterable of documents
+    chunk_size              the number of documents sent to a worker at once (default: 1000)
+    max_workers             the number of processes (default: os.cpu_count())
+    **kwargs                passed to clean_document, i.e. set_default, remove_undefined
+
+    The documents are cleaned in the workers, so the yielded documents are copies.
+    """
+    return _run(model, _clean_chunk, documents, chunk_size, max_workers, args=(kwargs, ))
+
+def parallel_validate(model, documents, chunk_size=1000, max_workers=None):
+    """generator that yields model.get_document_errors of each document, in order.
+
+    model                   the model to validate with
+    documents               an iterable of documents
+    chunk_size              the number of documents sent to a worker at once (default: 1000)
+    max_workers             the number of processes (default: os.cpu_count())
+    """
+    return _run(model, _validate_chunk, documents, chunk_size, max_workers)
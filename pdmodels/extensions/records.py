@@ -0,0 +1,214 @@
+
+"""
+MIT License
+
+Copyright (c) [2017] [Zwodahs]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from .. import *
+from .. import _SourceBuilder, _get_compiled
+import collections.abc
+import keyword
+
+"""
+Records are a compact read only form of documents: the values are kept in the __slots__ of a class
+generated for the model, so there is no hash table and no key per document.
+
+A record is a Mapping, record["key"], record.get("key"), iteration, len, in and == with a dict work
+as they do with the document. The fields with a key that is an identifier (and not a name of Mapping)
+can also be read as attributes. The nested models are records of their own class, the other values
+(lists, dicts, ...) are kept as they are in the document.
+"""
+
+
+class Record(collections.abc.Mapping):
+    """The base class of the generated record classes
+
+    model               the model of the record class
+    _slots              the dict of key : slot name
+    """
+    __slots__ = ()
+    model = None
+    _slots = {}
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            raise KeyError(key)
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key, slot in self._slots.items():
+            if hasattr(self, slot):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{0} is read only".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{0} is read only".format(type(self).__name__))
+
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, dict(self.items()))
+
+    def __reduce__(self):
+        return (_to_record, (self.model, self.to_dict()))
+
+    def to_dict(self):
+        """returns the record as a document, the nested records are made into dicts as well
+        """
+        return _get_compiled(self.model, "record_to_dict", lambda: _RecordCompiler(self.model).compile_to_dict())(self)
+
+
+def _slot_name(index, key):
+    """returns the slot of the field at index, the key itself if it can be an attribute
+    """
+    if isinstance(key, str) and key.isidentifier() and not keyword.iskeyword(key) \
+            and not key.startswith("_") and not hasattr(Record, key):
+        return key
+    return "_field{0}".format(index)
+
+
+def _record_class(model):
+    """returns the record class of model
+    """
+    def make():
+        slots = { entry.key: _slot_name(index, entry.key) for index, entry in enumerate(model._field_table) }
+        return type("{0}Record".format(model.__name__), (Record, ), {
+            "__slots__": tuple(slots.values()), "__module__": model.__module__, "model": model, "_slots": slots })
+    return _get_compiled(model, "record_class", make)
+
+
+def _to_record(model, document):
+    """returns the record of document, a document of model
+    """
+    return _get_compiled(model, "to_record", lambda: _RecordCompiler(model).compile_to_record())(document)
+
+
+def _to_records(model, values):
+    return [ _to_record(model, v) if isinstance(v, dict) else v for v in values ]
+
+
+def _to_record_map(model, values):
+    return { k: _to_record(model, v) if isinstance(v, dict) else v for k, v in values.items() }
+
+
+def _to_variable_record(check_field, models, value):
+    model = models.get(value.get(check_field))
+    if model is None:
+        return value
+    return _to_record(model, value)
+
+
+def _to_dicts(values):
+    return [ v.to_dict() if isinstance(v, Record) else v for v in values ]
+
+
+def _to_dict_map(values):
+    return { k: v.to_dict() if isinstance(v, Record) else v for k, v in values.items() }
+
+
+class _RecordCompiler(object):
+    """Generates the to_record function of a model and the to_dict function of its record class
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.record_class = _record_class(model)
+
+    def compile_to_record(self):
+        src = _SourceBuilder()
+        src.emit(1, "record = {0}({1})".format(src.const(object.__new__, "new"), src.const(self.record_class, "R")))
+        src.emit(1, "found = 0")
+        for entry in self.model._field_table:
+            slot = self.record_class._slots[entry.key]
+            setter = src.const(self.record_class.__dict__[slot].__set__, "set")
+            src.emit(1, "if {0!r} in document:".format(entry.key))
+            src.emit(2, "found += 1")
+            src.emit(2, "value = document[{0!r}]".format(entry.key))
+            if entry.kind == FieldEntry.KIND_MODEL:
+                src.emit(2, "if type(value) is dict:")
+                src.emit(3, "value = {0}({1}, value)".format(src.const(_to_record, "r"), src.const(entry.model, "m")))
+            elif entry.kind == FieldEntry.KIND_MODEL_LIST:
+                src.emit(2, "if type(value) is list:")
+                src.emit(3, "value = {0}({1}, value)".format(src.const(_to_records, "r"), src.const(entry.model, "m")))
+            elif entry.kind == FieldEntry.KIND_MODEL_MAP:
+                src.emit(2, "if type(value) is dict:")
+                src.emit(3, "value = {0}({1}, value)".format(src.const(_to_record_map, "r"), src.const(entry.model, "m")))
+            elif entry.kind == FieldEntry.KIND_VARIABLE:
+                src.emit(2, "if type(value) is dict:")
+                src.emit(3, "value = {0}({1!r}, {2}, value)".format(src.const(_to_variable_record, "r"),
+                    entry.definition.check_field, src.const(entry.models, "m")))
+            src.emit(2, "{0}(record, value)".format(setter))
+        src.emit(1, "if found != len(document):")
+        src.emit(2, "undefined = [ key for key in document if key not in {0} ]".format(src.const(self.record_class._slots, "slots")))
+        src.emit(2, "raise {0}('undefined fields: {{0}}'.format(undefined))".format(src.const(DictFieldError, "E")))
+        src.emit(1, "return record")
+        return src.build("to_record", ("document", ), "<pdmodels to_record {0}>".format(self.model.__name__))
+
+    def compile_to_dict(self):
+        src = _SourceBuilder()
+        src.emit(1, "document = {}")
+        for entry in self.model._field_table:
+            slot = self.record_class._slots[entry.key]
+            src.emit(1, "try:")
+            src.emit(2, "value = record.{0}".format(slot))
+            src.emit(1, "except AttributeError:")
+            src.emit(2, "pass")
+            src.emit(1, "else:")
+            if entry.kind in (FieldEntry.KIND_MODEL, FieldEntry.KIND_VARIABLE):
+                src.emit(2, "if isinstance(value, {0}):".format(src.const(Record, "Record")))
+                src.emit(3, "value = value.to_dict()")
+            elif entry.kind == FieldEntry.KIND_MODEL_LIST:
+                src.emit(2, "if type(value) is list:")
+                src.emit(3, "value = {0}(value)".format(src.const(_to_dicts, "d")))
+            elif entry.kind == FieldEntry.KIND_MODEL_MAP:
+                src.emit(2, "if type(value) is dict:")
+                src.emit(3, "value = {0}(value)".format(src.const(_to_dict_map, "d")))
+            src.emit(2, "document[{0!r}] = value".format(entry.key))
+        src.emit(1, "return document")
+        return src.build("to_dict", ("record", ), "<pdmodels record to_dict {0}>".format(self.model.__name__))
+
+
+class RecordMixin(Mixin):
+    """
+    Record mixin converts documents to records, a compact read only Mapping with the values in __slots__,
+    to hold many documents in memory. See Record.
+    """
+
+    @classmethod
+    def record_class(cls):
+        """returns the Record class of this model
+        """
+        return _record_class(cls)
+
+    @classmethod
+    def to_record(cls, document):
+        """returns the Record of a (cleaned) document
+
+        raises DictFieldError if the document has undefined fields
+        """
+        return _to_record(cls, document)
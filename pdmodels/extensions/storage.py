@@ -22,8 +22,11 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
-from ..dict_model import *
-import arrow
+from .. import *
+from .. import _SourceBuilder, _CleanerCompiler, _get_compiled, _int_to_datetime_expr
+import collections.abc
+import copy
+import json
 
 class JsonStorageMixin(Mixin):
     """
@@ -34,52 +37,463 @@ class JsonStorageMixin(Mixin):
 
     When you have choices that is dictionary, it will also convert it to the actual values
     Essentially this do what MongoMixin do in the past, but more generic
+
+    Naive datetime are stored as UTC, stored datetime are loaded as naive local time by default,
+    set DATETIME_TIMEZONE to TIMEZONE_UTC or a tzinfo to change it, see int_to_datetime.
     """
     DATETIME_STORE_PRECISION_V1 = 1e6
+    DATETIME_TIMEZONE = TIMEZONE_LOCAL
 
     @classmethod
     def dumps_json(cls, document):
         if document is None:
             return
-        for key, definition in cls._fields.items():
+        for entry in cls._field_table:
+            key = entry.key
             value = document.get(key)
             if value is not None:
-                if isinstance(definition, DefinedDictField) and issubclass(definition.model, MongoMixin):
-                    definition.model.dumps_json(value)
-                elif isinstance(definition, ListField) and isinstance(definition.inner_type, DefinedDictField):
+                if entry.kind == FieldEntry.KIND_MODEL and issubclass(entry.model, JsonStorageMixin):
+                    entry.model.dumps_json(value)
+                elif entry.kind == FieldEntry.KIND_MODEL_LIST:
                     for v in value:
-                        definition.inner_type.model.dumps_json(v)
+                        entry.model.dumps_json(v)
                 else:
-                    if hasattr(definition, "reversed_choices") and definition.reversed_choices is not None:
-                        if isinstance(definition, ListField):
-                            document[key] = [ definition.choices.get(v) for v in value ]
+                    if entry.reversed_choices is not None:
+                        choices = entry.definition.choices
+                        if entry.kind == FieldEntry.KIND_LIST:
+                            document[key] = [ choices.get(v) for v in value ]
                         else:
-                            document[key] = definition.choices.get(value)
-                    if isinstance(definition, DateTimeField):
-                        document[key] = int(arrow.get(value).float_timestamp * cls.DATETIME_STORE_PRECISION_V1) # store all datetime microseconds
-                    if hasattr(definition, "store_field"):
-                        document[definition.store_field] = document[key]
-                        document.pop(key)
+                            document[key] = choices.get(value)
+                    if entry.kind == FieldEntry.KIND_DATETIME:
+                        document[key] = datetime_to_int(value, cls.DATETIME_STORE_PRECISION_V1) # store all datetime microseconds
+                    if entry.store_key != key:
+                        document[entry.store_key] = document.pop(key)
 
     @classmethod
     def loads_json(cls, document):
         if document is None:
             return
-        for key, definition in cls._fields.items():
-            if hasattr(definition, "store_field") and definition.store_field in document:
-                document[key] = document.pop(definition.store_field)
+        for entry in cls._field_table:
+            key = entry.key
+            if entry.store_key != key and entry.store_key in document:
+                document[key] = document.pop(entry.store_key)
             value = document.get(key)
             if value is not None:
-                if isinstance(definition, DefinedDictField) and issubclass(definition.model, MongoMixin):
-                    definition.model.loads_json(value)
-                elif isinstance(definition, ListField) and isinstance(definition.inner_type, DefinedDictField):
+                if entry.kind == FieldEntry.KIND_MODEL and issubclass(entry.model, JsonStorageMixin):
+                    entry.model.loads_json(value)
+                elif entry.kind == FieldEntry.KIND_MODEL_LIST:
                     for v in value:
-                        definition.inner_type.model.loads_json(v)
+                        entry.model.loads_json(v)
                 else:
-                    if hasattr(definition, "reversed_choices") and definition.reversed_choices is not None:
-                        if isinstance(definition, ListField):
-                            document[key] = [ definition.reversed_choices.get(v) for v in value ]
+                    if entry.reversed_choices is not None:
+                        if entry.kind == FieldEntry.KIND_LIST:
+                            document[key] = [ entry.reversed_choices.get(v) for v in value ]
                         else:
-                            document[key] = definition.reversed_choices.get(value)
-                    if isinstance(definition, DateTimeField):
-                        document[key] = int_to_datetime(document[key], cls.DATETIME_STORE_PRECISION_V1)
+                            document[key] = entry.reversed_choices.get(value)
+                    if entry.kind == FieldEntry.KIND_DATETIME:
+                        document[key] = int_to_datetime(document[key], cls.DATETIME_STORE_PRECISION_V1, cls.DATETIME_TIMEZONE)
+
+    @classmethod
+    def dumps_json_copy(cls, document):
+        """returns the stored form of document as dumps_json makes it, without modifying document
+
+        Only the dicts and lists on the path of a converted value are copied, all the other values
+        are shared with document, document itself is returned if nothing is converted.
+        """
+        dumper = cls.__dict__.get("_compiled", {}).get("json_dumper") or _json_dumper(cls)
+        return dumper(document)
+
+    @classmethod
+    def loads_json_copy(cls, document):
+        """returns the document as loads_json makes it, without modifying document
+
+        See dumps_json_copy
+        """
+        loader = cls.__dict__.get("_compiled", {}).get("json_loader") or _json_loader(cls)
+        return loader(document)
+
+    @classmethod
+    def dumps_bytes(cls, document, default=None):
+        """returns the stored form of document as JSON bytes, without modifying document
+
+        default                 passed to json.dumps, called with the values json can not encode,
+                                i.e. the datetime of models nested by a VariableDefinedDictField
+
+        The result is the same as json.dumps(dumps_json(deepcopy(document))). It is not encoded in a
+        single pass: dumps_json_copy builds the stored form, only copying the dicts and lists on the
+        path of a converted value, and json.dumps encodes it, so the encoding itself stays in C.
+        See the dumps_bytes and deepcopy_dumps_json_bytes operations of benchmarks/suite.py.
+        """
+        return json.dumps(cls.dumps_json_copy(document), default=default).encode("utf-8")
+
+    @classmethod
+    def from_json_bytes(cls, data, clean=True, validate=False):
+        """returns the document stored as JSON in data, as loads_json and clean_document would make it
+
+        data                    the UTF-8 JSON, bytes, bytearray, memoryview or str
+        clean                   True to clean the document (default: True)
+        validate                True to return (document, errors) instead of the document (default: False)
+
+        The decoded document is converted and cleaned in a single pass, the conversions of loads_json
+        are applied to each field right before it is cleaned.
+        """
+        if not isinstance(data, str):
+            data = str(data, "utf-8") # decodes any buffer without copying it to bytes first
+        document = json.loads(data)
+        if document is not None:
+            if clean:
+                _json_load_cleaner(cls, True, True)(document)
+            else:
+                cls.loads_json(document)
+        if validate:
+            return document, cls.get_document_errors(document)
+        return document
+
+    @classmethod
+    def lazy(cls, document):
+        """returns a LazyDocument, a read only view of a stored document that is loaded and cleaned
+        one field at a time, when the field is read
+
+        document                the stored document, as dumps_json makes it
+        """
+        if document is None:
+            return None
+        return LazyDocument(cls, document)
+
+
+class _JsonCopyCompiler(object):
+    """Generates a function that returns the document as dumps_json (or loads_json) makes it.
+
+    The conversions are applied in the same order as dumps_json, so the keys are in the same order,
+    but the dict of the model is only copied before the first conversion and nested models are only
+    set if they are converted. DATETIME_STORE_PRECISION_V1 and DATETIME_TIMEZONE are read when the
+    function is generated.
+    """
+
+    def __init__(self, model, loads):
+        """
+        model               the model to compile
+        loads               True for loads_json, False for dumps_json
+        """
+        self.model = model
+        self.loads = loads
+        self.src = _SourceBuilder()
+
+    def compile(self):
+        src = self.src
+        src.emit(1, "if document is None:")
+        src.emit(2, "return None")
+        src.emit(1, "current = document")
+        for entry in self.model._field_table:
+            self.emit_entry(entry)
+        src.emit(1, "return current")
+        return src.build("convert", ("document", ), "<pdmodels json {0} {1}>".format(
+            "loader" if self.loads else "dumper", self.model.__name__))
+
+    def emit_copy(self, indent):
+        self.src.emit(indent, "if current is document:")
+        self.src.emit(indent + 1, "current = dict(document)")
+
+    def emit_entry(self, entry):
+        src = self.src
+        key = repr(entry.key)
+        converter = _json_loader if self.loads else _json_dumper
+        if self.loads and entry.store_key != entry.key:
+            src.emit(1, "if {0!r} in current:".format(entry.store_key))
+            self.emit_copy(2)
+            src.emit(2, "current[{0}] = current.pop({1!r})".format(key, entry.store_key))
+        if entry.kind == FieldEntry.KIND_MODEL and issubclass(entry.model, JsonStorageMixin):
+            src.emit(1, "value = current.get({0})".format(key))
+            src.emit(1, "if value is not None:")
+            src.emit(2, "converted = {0}(value)".format(src.const(converter(entry.model), "m")))
+            src.emit(2, "if converted is not value:")
+            self.emit_copy(3)
+            src.emit(3, "current[{0}] = converted".format(key))
+        elif entry.kind == FieldEntry.KIND_MODEL_LIST:
+            src.emit(1, "value = current.get({0})".format(key))
+            src.emit(1, "if value is not None:")
+            src.emit(2, "converted = {0}({1}, value)".format(src.const(_convert_list, "l"),
+                src.const(converter(entry.model), "m")))
+            src.emit(2, "if converted is not value:")
+            self.emit_copy(3)
+            src.emit(3, "current[{0}] = converted".format(key))
+        else:
+            lines = []
+            if entry.reversed_choices is not None:
+                choices = entry.reversed_choices if self.loads else entry.definition.choices
+                choices = src.const(choices.get, "c")
+                if entry.kind == FieldEntry.KIND_LIST:
+                    lines.append("current[{0}] = [{1}(v) for v in value]".format(key, choices))
+                else:
+                    lines.append("current[{0}] = {1}(value)".format(key, choices))
+            if entry.kind == FieldEntry.KIND_DATETIME:
+                precision = src.const(self.model.DATETIME_STORE_PRECISION_V1, "p")
+                if self.loads:
+                    lines.append("current[{0}] = {1}(current[{0}], {2}, {3})".format(key,
+                        src.const(int_to_datetime, "convert"), precision, src.const(self.model.DATETIME_TIMEZONE, "z")))
+                else:
+                    lines.append("current[{0}] = {1}(value, {2})".format(key,
+                        src.const(datetime_to_int, "convert"), precision))
+            if not self.loads and entry.store_key != entry.key:
+                lines.append("current[{0!r}] = current.pop({1})".format(entry.store_key, key))
+            if lines:
+                src.emit(1, "value = current.get({0})".format(key))
+                src.emit(1, "if value is not None:")
+                self.emit_copy(2)
+                for line in lines:
+                    src.emit(2, line)
+
+
+class _JsonLoadCleanerCompiler(_CleanerCompiler):
+    """Generates a function that makes a decoded document as loads_json then clean_document would.
+
+    The conversions of loads_json of each field are emitted right before the cleaning of that field.
+    The nested models that loads_json converts are loaded and cleaned by their own generated function
+    when present, so they are not cleaned again. A nested model that is set by the cleaning (i.e. a
+    default) is cleaned only.
+    """
+
+    NAME = "json load cleaner"
+
+    def compile(self):
+        # the keys are renamed before any key is added, as loads_json does
+        for entry in self.model._field_table:
+            if entry.store_key != entry.key:
+                self.src.emit(1, "if {0!r} in document:".format(entry.store_key))
+                self.src.emit(2, "document[{0!r}] = document.pop({1!r})".format(entry.key, entry.store_key))
+        return super().compile()
+
+    def emit_entry(self, entry):
+        src = self.src
+        key = repr(entry.key)
+        if entry.kind == FieldEntry.KIND_MODEL and issubclass(entry.model, JsonStorageMixin) \
+                or entry.kind == FieldEntry.KIND_MODEL_LIST:
+            self.emit_nested_entry(entry)
+            return
+        lines = []
+        if entry.reversed_choices is not None:
+            choices = src.const(entry.reversed_choices.get, "c")
+            if entry.kind == FieldEntry.KIND_LIST:
+                lines.append("document[{0}] = [{1}(v) for v in value]".format(key, choices))
+            else:
+                lines.append("document[{0}] = {1}(value)".format(key, choices))
+        if entry.kind == FieldEntry.KIND_DATETIME:
+            lines.append("value = int(document[{0}])".format(key))
+            lines.append("document[{0}] = {1}".format(key, _int_to_datetime_expr(src, "value",
+                self.model.DATETIME_STORE_PRECISION_V1, self.model.DATETIME_TIMEZONE)))
+        if lines:
+            src.emit(1, "value = document.get({0})".format(key))
+            src.emit(1, "if value is not None:")
+            for line in lines:
+                src.emit(2, line)
+        self.emit_field(entry.definition, "document", key, 1)
+
+    def emit_nested_entry(self, entry):
+        src = self.src
+        key = repr(entry.key)
+        definition = entry.definition
+        src.emit(1, "value = document.get({0})".format(key))
+        if type(definition).clean not in self.EMITTERS or definition.fixed_value is not None:
+            # the field is cleaned as a whole, only load the nested models
+            model = src.const(entry.model, "model")
+            src.emit(1, "if value is not None:")
+            if entry.kind == FieldEntry.KIND_MODEL:
+                src.emit(2, "{0}.loads_json(value)".format(model))
+            else:
+                src.emit(2, "for item in value:")
+                src.emit(3, "{0}.loads_json(item)".format(model))
+            self.emit_field(definition, "document", key, 1)
+            return
+        load_cleaner = src.const(_json_load_cleaner(entry.model, self.set_default, self.remove_undefined), "m")
+        src.emit(1, "if value is not None:")
+        if entry.kind == FieldEntry.KIND_MODEL:
+            src.emit(2, "{0}(value)".format(load_cleaner))
+        else:
+            src.emit(2, "for item in value:")
+            src.emit(3, "if item is not None:")
+            src.emit(4, "{0}(item)".format(load_cleaner))
+            self.clean_list_items = False
+            self.emit_field(definition, "document", key, 2, present=True)
+            self.clean_list_items = True
+        src.emit(1, "else:")
+        src.emit(2, "pass")
+        self.emit_field(definition, "document", key, 2)
+
+
+def _copy_containers(value):
+    """returns a copy of the dicts and lists of value, the other values are shared
+    """
+    if type(value) is dict:
+        return { k: _copy_containers(v) for k, v in value.items() }
+    if type(value) is list:
+        return [ _copy_containers(v) for v in value ]
+    return value
+
+
+class _JsonLoadFieldCompiler(_JsonLoadCleanerCompiler):
+    """Generates a function that returns the value of one field of a stored document, as loads_json
+    then clean_document would make it, see LazyDocument.
+
+    The stored document itself is not modified, the field is loaded from a copy of its lists and dicts
+    in a new dict. A nested model that
+    is stored as a dict is returned as a LazyDocument of the nested model instead.
+    """
+
+    NAME = "json field loader"
+
+    def __init__(self, model):
+        super().__init__(model, True, True)
+
+    def compile_entry(self, entry):
+        src = self.src
+        key = repr(entry.key)
+        src.emit(1, "document = {}")
+        if entry.store_key != entry.key:
+            src.emit(1, "if {0!r} in stored:".format(entry.store_key))
+            src.emit(2, "document[{0}] = stored[{1!r}]".format(key, entry.store_key))
+            src.emit(1, "elif {0} in stored:".format(key))
+        else:
+            src.emit(1, "if {0} in stored:".format(key))
+        src.emit(2, "document[{0}] = stored[{0}]".format(key))
+        if entry.kind == FieldEntry.KIND_MODEL and issubclass(entry.model, JsonStorageMixin) \
+                and type(entry.definition).clean in self.EMITTERS and entry.definition.fixed_value is None:
+            src.emit(1, "value = document.get({0})".format(key))
+            src.emit(1, "if type(value) is dict:")
+            src.emit(2, "return {0}({1}, value)".format(src.const(LazyDocument, "Lazy"), src.const(entry.model, "model")))
+        # the field is loaded and cleaned in place, the lists and dicts of the stored document are copied
+        src.emit(1, "if {0} in document:".format(key))
+        src.emit(2, "document[{0}] = {1}(document[{0}])".format(key, src.const(_copy_containers, "copy")))
+        self.emit_entry(entry)
+        src.emit(1, "return document.get({0})".format(key))
+        return src.build("load", ("stored", ), "<pdmodels {0} {1}.{2}>".format(self.NAME, self.model.__name__, entry.key))
+
+
+class LazyDocument(collections.abc.Mapping):
+    """A read only view of a stored document, see JsonStorageMixin.lazy
+
+    Reading a key loads and cleans that field only, as from_json_bytes would, and keeps the result for
+    the next reads. The keys are the fields of the model, the undefined keys of the stored document are
+    not in the view. Nested models stored as dicts are LazyDocument as well, materialize returns the
+    whole document as a dict.
+
+    The stored document is not modified, the lists and dicts of a field are copied before it is loaded.
+    If loads_json or clean_document is overridden, the whole document is loaded with them on the first read.
+    """
+    __slots__ = ("model", "_stored", "_values")
+
+    def __init__(self, model, stored):
+        self.model = model
+        self._stored = stored
+        self._values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        loaders = _json_field_loaders(self.model)
+        if loaders is None:
+            document = _copy_containers(self._stored)
+            _load_clean(self.model, document, True, True)
+            self._values = document
+            return document[key]
+        value = self._values[key] = loaders[key](self._stored)
+        return value
+
+    def __iter__(self):
+        return iter(self.model._fields)
+
+    def __len__(self):
+        return len(self.model._fields)
+
+    def __repr__(self):
+        return "LazyDocument({0}, {1!r})".format(self.model.__name__, self._stored)
+
+    def materialize(self):
+        """returns the whole document as a dict, as from_json_bytes would decode it
+        """
+        document = {}
+        for key in self:
+            value = self[key]
+            if isinstance(value, LazyDocument):
+                value = value.materialize()
+            document[key] = value
+        return document
+
+
+def _json_field_loaders(model):
+    """returns the dict of key : the function that loads the field of a stored document, see _JsonLoadFieldCompiler
+
+    returns None if loads_json or clean_document is overridden
+    """
+    if model.loads_json.__func__ is not JsonStorageMixin.loads_json.__func__ \
+            or model.clean_document.__func__ is not DefinedDict.clean_document.__func__:
+        return None
+    return _get_compiled(model, "json_field_loaders",
+            lambda: { entry.key: _JsonLoadFieldCompiler(model).compile_entry(entry) for entry in model._field_table })
+
+
+def _load_clean(model, document, set_default, remove_undefined):
+    """loads_json then clean_document of model
+    """
+    model.loads_json(document)
+    model.clean_document(document, set_default=set_default, remove_undefined=remove_undefined)
+
+
+def _json_load_cleaner(model, set_default, remove_undefined):
+    """returns the function that loads and cleans a decoded document of model, see _JsonLoadCleanerCompiler
+    """
+    if not issubclass(model, JsonStorageMixin) \
+            or model.loads_json.__func__ is not JsonStorageMixin.loads_json.__func__ \
+            or model.clean_document.__func__ is not DefinedDict.clean_document.__func__:
+        # loads_json or clean_document is overridden, respect them
+        return lambda document: _load_clean(model, document, set_default, remove_undefined)
+    return _get_compiled(model, ("json_load_cleaner", set_default, remove_undefined),
+            lambda: _JsonLoadCleanerCompiler(model, set_default, remove_undefined).compile())
+
+
+def _convert_list(convert, values):
+    """returns the list of convert(value) for each value, values itself if they are all unchanged
+    """
+    for index, value in enumerate(values):
+        converted = convert(value)
+        if converted is not value:
+            result = values[:index]
+            result.append(converted)
+            result.extend([convert(value) for value in values[index + 1:]])
+            return result
+    return values
+
+
+def _dump_copy(model, document):
+    """the stored form of document through the dumps_json of model, on a copy
+    """
+    document = copy.deepcopy(document)
+    model.dumps_json(document)
+    return document
+
+
+def _load_copy(model, document):
+    """the document through the loads_json of model, on a copy
+    """
+    document = copy.deepcopy(document)
+    model.loads_json(document)
+    return document
+
+
+def _json_dumper(model):
+    """returns the function that returns the stored form of a document of model, see _JsonCopyCompiler
+    """
+    if not issubclass(model, JsonStorageMixin) or model.dumps_json.__func__ is not JsonStorageMixin.dumps_json.__func__:
+        # dumps_json is overridden, respect it
+        return lambda document: _dump_copy(model, document)
+    return _get_compiled(model, "json_dumper", lambda: _JsonCopyCompiler(model, loads=False).compile())
+
+
+def _json_loader(model):
+    """returns the function that returns a loaded document of model, see _JsonCopyCompiler
+    """
+    if not issubclass(model, JsonStorageMixin) or model.loads_json.__func__ is not JsonStorageMixin.loads_json.__func__:
+        # loads_json is overridden, respect it
+        return lambda document: _load_copy(model, document)
+    return _get_compiled(model, "json_loader", lambda: _JsonCopyCompiler(model, loads=True).compile())
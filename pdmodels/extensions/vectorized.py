@@ -0,0 +1,200 @@
+
+"""
+MIT License
+
+Copyright (c) [2017] [Zwodahs]
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from .. import *
+from .. import _ValidatorCompiler, _get_compiled
+import itertools
+import math
+import operator
+import numpy
+
+_NONE_TYPE = type(None)
+_VECTORIZABLE_TYPES = { int, float, bool, str }
+
+
+class _Column(object):
+    """The vectorized checks of a single field.
+
+    check returns a mask of the rows that fails any of the checks, or that holds a value of a type
+    that the vectorized checks do not handle. Those rows are checked again by get_document_errors.
+    """
+
+    def __init__(self, key, definition):
+        self.key = key
+        self.definition = definition
+        allowed_type = definition.allowed_type
+        if isinstance(allowed_type, type):
+            allowed_type = (allowed_type, )
+        self.allowed_type = tuple(allowed_type)
+        self.fast_types = set(self.allowed_type) | { _NONE_TYPE }
+        if int in self.fast_types:
+            self.fast_types.add(bool)
+        self.min = getattr(definition, "min", None)
+        self.max = getattr(definition, "max", None)
+        self.choices = None
+        if definition.choices is not None:
+            self.choices = list(definition.choices)
+
+    @classmethod
+    def is_vectorizable(cls, definition):
+        errors = type(definition).errors
+        if errors is StringField.errors:
+            if definition.regex is not None:
+                return False
+        elif errors not in (TypedField.errors, NumberField.errors):
+            return False
+        allowed_type = definition.allowed_type
+        if isinstance(allowed_type, type):
+            allowed_type = (allowed_type, )
+        return set(allowed_type) <= _VECTORIZABLE_TYPES
+
+    def check(self, values):
+        n = len(values)
+        types = set(map(type, values))
+        fail = numpy.zeros(n, dtype=bool)
+        if types <= self.fast_types:
+            ok = None
+        else:
+            ok = numpy.fromiter(map(self.fast_types.__contains__, map(type, values)), dtype=bool, count=n)
+            fail |= ~ok
+        if _NONE_TYPE in types:
+            none = numpy.fromiter(map(operator.is_, values, itertools.repeat(None)), dtype=bool, count=n)
+            if self.definition.is_required:
+                fail |= none
+            checked = ~none if ok is None else ~none & ok
+        else:
+            checked = numpy.ones(n, dtype=bool) if ok is None else ok
+
+        if self.definition.choices is None and self.min is None and self.max is None:
+            return fail
+
+        # the rows with a value of an unknown type are replaced with None, they are failing anyway
+        values = numpy.fromiter(values, dtype=object, count=n)
+        if ok is not None:
+            values = numpy.where(ok, values, None)
+        if self.choices is not None:
+            fail |= checked & ~self.in_choices(values, checked, types - { _NONE_TYPE })
+        if self.min is not None or self.max is not None:
+            fill = self.min if self.min is not None else self.max
+            values = numpy.where(checked, values, fill)
+            fail |= checked & self.out_of_range(values, types - { _NONE_TYPE })
+        return fail
+
+    def in_choices(self, values, checked, types):
+        """return the mask of the values that are in choices, the rows that are not checked are ignored.
+
+        Numbers are compared as int64 or float64 when all the values and the choices fit, other values
+        with the python objects, converting strings to a numpy dtype is slower than the lookups.
+        """
+        choices = self.choices
+        if not choices:
+            return numpy.zeros(len(values), dtype=bool)
+        values = numpy.where(checked, values, choices[0])
+        try:
+            if types <= { int, bool } and all(type(c) in (int, bool) for c in choices):
+                return numpy.isin(values.astype(numpy.int64), numpy.array(choices, dtype=numpy.int64))
+            if types <= { float } and all(type(c) in (int, bool, float) and float(c) == c for c in choices):
+                return numpy.isin(values.astype(numpy.float64), numpy.array(choices, dtype=numpy.float64))
+        except (OverflowError, ValueError):
+            # a value or a choice too large for int64 or float64, compare the python objects
+            pass
+        return numpy.fromiter(map(self.definition.choices.__contains__, values), dtype=bool, count=len(values))
+
+    def out_of_range(self, values, types):
+        """return the mask of the values that are < min or > max, mirroring NumberField.errors
+        """
+        numbers, lower, upper = values, self.min, self.max
+        try:
+            if types <= { int, bool }:
+                numbers = values.astype(numpy.int64)
+                # for int, v < b is v < ceil(b) and v > b is v > floor(b)
+                lower = math.ceil(lower) if lower is not None else None
+                upper = math.floor(upper) if upper is not None else None
+            elif types <= { float } and all(b is None or float(b) == b for b in (lower, upper)):
+                numbers = values.astype(numpy.float64)
+        except (OverflowError, ValueError):
+            # too large for int64 or an infinite bound, compare the python objects
+            numbers, lower, upper = values, self.min, self.max
+        result = numpy.zeros(len(values), dtype=bool)
+        # NaN is neither < nor > any bound, same as in NumberField.errors, without the warning
+        with numpy.errstate(invalid="ignore"):
+            if lower is not None:
+                result |= numbers < lower
+            if upper is not None:
+                result |= numbers > upper
+        return result
+
+
+class _ColumnPlan(object):
+    """The fields of a model, split into the vectorized columns and the other fields
+    """
+
+    def __init__(self, model):
+        self.columns = []
+        others = []
+        for entry in model._field_table:
+            if _Column.is_vectorizable(entry.definition):
+                self.columns.append(_Column(entry.key, entry.definition))
+            else:
+                others.append((entry.key, entry.definition))
+        self.validator = None
+        if others:
+            self.validator = _ValidatorCompiler(model, fields=others).compile()
+
+
+class VectorizedMixin(Mixin):
+    """
+    Vectorized mixin validates many flat documents at once with NumPy.
+
+    The numeric, bool and string fields (without regex) are pulled into columns and their type,
+    choices and min/max checks are evaluated as masks over all the documents.
+    Only the documents that fail a vectorized check are validated again with get_document_errors,
+    the other fields (regex, nested models, lists, ...) are validated per document.
+    """
+
+    @classmethod
+    def get_documents_errors(cls, documents):
+        """returns a list with the errors of each document, same as get_document_errors
+
+        documents               a list of documents
+        """
+        documents = list(documents)
+        plan = _get_compiled(cls, "columns", lambda: _ColumnPlan(cls))
+        fail = numpy.zeros(len(documents), dtype=bool)
+        for column in plan.columns:
+            values = [ document.get(column.key) for document in documents ]
+            fail |= column.check(values)
+
+        validator = plan.validator
+        if validator is None:
+            results = [ [] for _ in documents ]
+        else:
+            results = []
+            for document in documents:
+                errors = []
+                validator(document, None, errors)
+                results.append(errors)
+        for index in numpy.flatnonzero(fail).tolist():
+            results[index] = cls.get_document_errors(documents[index])
+        return results
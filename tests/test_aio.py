@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+
+import pdmodels
+from pdmodels.extensions.aio import AsyncMixin
+from . import test_base
+from .test_compile import Everything, DOCUMENTS
+
+
+class TestModelBaseTest(unittest.TestCase, test_base.DictMixin, test_base.MoreAssertMixin):
+    pass
+
+
+class AsyncEverything(AsyncMixin, Everything):
+    pass
+
+
+class Point(AsyncMixin, pdmodels.DefinedDict):
+
+    x = pdmodels.IntField(is_required=True)
+    y = pdmodels.IntField(min=0)
+
+
+class Shape(AsyncMixin, pdmodels.DefinedDict):
+
+    points = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Point))
+
+
+class AsyncMixinTest(TestModelBaseTest):
+
+    def test_avalidate(self):
+        for document in DOCUMENTS:
+            errors = asyncio.run(AsyncEverything.avalidate(document, yield_every=3))
+            self.assertEqual(errors, AsyncEverything.get_document_errors(document))
+
+    def test_avalidate_yields(self):
+        document = {"points": [{"x": i, "y": -1 if i == 5000 else 0} for i in range(10000)]}
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def run():
+            task = asyncio.ensure_future(ticker())
+            await asyncio.sleep(0)
+            errors = await Shape.avalidate(document, yield_every=100)
+            task.cancel()
+            return errors
+
+        self.assertEqual(asyncio.run(run()), [("points.5000.y", "value", -1)])
+        self.assertGreater(len(ticks), 100)
+
+    def test_aiter_validate(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'{"x": 1}\n\n{"y": -1, "z": 0}\nnot json\n')
+            reader.feed_eof()
+            return [ item async for item in Point.aiter_validate(reader, queue_size=1) ]
+
+        self.assertEqual(asyncio.run(run()), [
+            ({"x": 1, "y": None}, []),
+            ({"x": None, "y": -1}, [("x", "required", None), ("y", "value", -1)]),
+            (None, [(None, "json", b"not json\n")]),
+        ])
+
+    def test_aiter_validate_not_object(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'[1, 2]\n3\n"x"\n{"x": 1}\n')
+            reader.feed_eof()
+            return [ item async for item in Point.aiter_validate(reader) ]
+
+        self.assertEqual(asyncio.run(run()), [
+            (None, [(None, "json", b"[1, 2]\n")]),
+            (None, [(None, "json", b"3\n")]),
+            (None, [(None, "json", b'"x"\n')]),
+            ({"x": 1, "y": None}, []),
+        ])
+
+    def test_aiter_validate_backpressure(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            for i in range(10):
+                reader.feed_data(b'{"x": 1}\n')
+            reader.feed_eof()
+            documents = Point.aiter_validate(reader, queue_size=2)
+            await documents.__anext__()
+            for _ in range(10):
+                await asyncio.sleep(0)
+            # 1 consumed, 2 in the queue and 1 waiting to be put, the rest is not read
+            remaining = len(reader._buffer)
+            await documents.aclose()
+            return remaining
+
+        self.assertEqual(asyncio.run(run()), len(b'{"x": 1}\n') * 6)
@@ -0,0 +1,24 @@
+import json
+import unittest
+
+from benchmarks import suite
+
+
+class SuiteTest(unittest.TestCase):
+
+    def test_run(self):
+        current = suite.run(number=2, repeat=1)
+        self.assertEqual(len(current["results"]), len(suite.SCHEMAS) * len(suite.OPERATIONS))
+        for result in current["results"]:
+            self.assertGreater(result["best_us"], 0)
+            self.assertGreaterEqual(result["median_us"], result["best_us"])
+            self.assertGreaterEqual(result["peak_bytes"], 0)
+        self.assertEqual(json.loads(json.dumps(current)), current)
+
+    def test_compare(self):
+        baseline = {"results": [{"schema": "a", "operation": "x", "best_us": 10.0},
+                                {"schema": "a", "operation": "y", "best_us": 10.0}]}
+        current = {"results": [{"schema": "a", "operation": "x", "best_us": 11.0},
+                               {"schema": "a", "operation": "y", "best_us": 13.0},
+                               {"schema": "b", "operation": "x", "best_us": 99.0}]}
+        self.assertEqual(suite.compare(baseline, current, 1.2), [("a", "y", 10.0, 13.0)])
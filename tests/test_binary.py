@@ -0,0 +1,159 @@
+import datetime
+import json
+import unittest
+
+import pdmodels
+from pdmodels.extensions.binary import BinaryMixin
+from pdmodels.extensions.storage import JsonStorageMixin
+
+
+class Author(BinaryMixin, JsonStorageMixin, pdmodels.DefinedDict):
+    name = pdmodels.StringField(is_required=True)
+    born = pdmodels.DateTimeField()
+
+
+class Book(pdmodels.DefinedDict):
+    type = pdmodels.StringField(fixed_value="book")
+    pages = pdmodels.IntField()
+
+
+class Pen(pdmodels.DefinedDict):
+    type = pdmodels.StringField(fixed_value="pen")
+    color = pdmodels.StringField(choices=["red", "blue"])
+
+
+class Order(BinaryMixin, JsonStorageMixin, pdmodels.DefinedDict):
+    id = pdmodels.StringField(store_field="_id")
+    count = pdmodels.IntField()
+    price = pdmodels.FloatField()
+    paid = pdmodels.BoolField()
+    created = pdmodels.DateTimeField()
+    state = pdmodels.StringField(choices={"new": 0, "sent": 1, "done": 2})
+    level = pdmodels.IntField(choices=[1, 2, 3])
+    anything = pdmodels.Field()
+    raw = pdmodels.DictField()
+    author = pdmodels.DefinedDictField(model=Author)
+    authors = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Author))
+    tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+    untyped = pdmodels.ListField()
+    scores = pdmodels.MapField(inner_type=pdmodels.FloatField())
+    product = pdmodels.VariableDefinedDictField("type", {"book": Book, "pen": Pen})
+
+
+class Packed(BinaryMixin, pdmodels.DefinedDict):
+    ints = pdmodels.ListField(inner_type=pdmodels.IntField())
+    floats = pdmodels.ListField(inner_type=pdmodels.FloatField())
+    bools = pdmodels.ListField(inner_type=pdmodels.BoolField())
+    dates = pdmodels.ListField(inner_type=pdmodels.DateTimeField())
+    names = pdmodels.ListField(inner_type=pdmodels.StringField())
+    levels = pdmodels.ListField(inner_type=pdmodels.IntField(choices=[1, 2, 3]))
+    mixed = pdmodels.ListField(inner_type=pdmodels.Field(choices=[1, "a"]))
+    counts = pdmodels.MapField(inner_type=pdmodels.IntField())
+    labels = pdmodels.MapField(inner_type=pdmodels.StringField())
+    many = pdmodels.IntField(choices=list(range(300)))
+    products = pdmodels.ListField(inner_type=pdmodels.VariableDefinedDictField("type", {"book": Book, "pen": Pen}))
+
+
+WHEN = datetime.datetime(2017, 5, 1, 10, 30, 15, 123456)
+TOKYO = datetime.timezone(datetime.timedelta(hours=9))
+
+DOCUMENTS = [
+    {},
+    {"id": "o1", "count": 3, "price": 9.5, "paid": True, "created": WHEN, "state": "sent", "level": 2,
+     "anything": None, "raw": {"a": [1, {"b": None}]}, "author": {"name": "Ann", "born": WHEN},
+     "authors": [{"name": "Bob"}, {"name": "Cat", "born": None}], "tags": ["a", "b"], "untyped": [1, "x"],
+     "scores": {"x": 1.0, "y": -2.5}, "product": {"type": "pen", "color": "red"}},
+    {"count": 1 << 70, "price": 1, "paid": 0, "created": WHEN.replace(tzinfo=TOKYO), "state": "lost",
+     "level": True, "tags": ["a", None], "scores": {"x": 1}, "product": {"type": "car"}, "author": "x"},
+    {"undefined": {1: (1, 2)}, "count": -5, "anything": b"\x00\xff", "id": "café ☃",
+     "product": {"type": "book", "pages": 100, "extra": 1.5}, "authors": [None], "raw": None,
+     "created": datetime.datetime.min, "price": float("inf")},
+]
+
+
+PACKED_DOCUMENTS = [
+    {"ints": [], "floats": [], "bools": [], "dates": [], "names": [], "levels": [], "mixed": [], "counts": {},
+     "labels": {}, "many": 299, "products": []},
+    {"ints": [1, -2, 1 << 62], "floats": [0.5, float("inf")], "bools": [True, False], "dates": [WHEN, datetime.datetime.min],
+     "names": ["", "a", "café ☃", "\ud800", "\udc00", "x" * 200], "levels": [1, 3], "mixed": ["a", 1],
+     "counts": {"a": 1, "": -1}, "labels": {"é": "☃", "b": ""}, "many": 0,
+     "products": [{"type": "pen", "color": "blue"}, {"type": "book", "pages": 1}]},
+    {"ints": [1, 1 << 70], "floats": [1, 0.5], "bools": [1], "dates": [WHEN.replace(tzinfo=TOKYO)],
+     "names": ["a\x00b", "x" * 200, "\ud800", "\udc00"], "levels": [True, 4], "mixed": [2], "counts": {1: 1, "a": 1.5},
+     "labels": {"a": None}, "many": 300, "products": [{"type": "car"}, None]},
+    {"ints": None, "floats": [None], "names": ["\x00"], "counts": None, "undefined": 1},
+]
+
+
+class BinaryTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+        for document in DOCUMENTS:
+            with self.subTest(document=document):
+                data = Order.dumps_binary(document)
+                decoded = Order.loads_binary(data)
+                self.assertEqual(repr(decoded), repr(document))
+                self.assertEqual(repr(Order.loads_binary(memoryview(data))), repr(document))
+
+    def test_packed_roundtrip(self):
+        for document in PACKED_DOCUMENTS:
+            with self.subTest(document=document):
+                self.assertEqual(repr(Packed.loads_binary(Packed.dumps_binary(document))), repr(document))
+
+    def test_fixed_fields(self):
+        documents = [
+            {"name": "Ann", "born": WHEN},
+            {"name": "Ann", "born": None},
+            {"name": None, "born": datetime.datetime.max},
+        ]
+        for document in documents:
+            with self.subTest(document=document):
+                self.assertEqual(Author.loads_binary(Author.dumps_binary(document)), document)
+        document = Order.clean_document({"count": 1 << 63, "price": 1.5, "paid": True, "created": WHEN,
+            "state": "new", "level": 3})
+        self.assertEqual(repr(Order.loads_binary(Order.dumps_binary(document))), repr(document))
+
+    def test_truncated(self):
+        data = Packed.dumps_binary(PACKED_DOCUMENTS[1])
+        for size in range(12, len(data)):
+            with self.assertRaises(pdmodels.DictValueError):
+                Packed.loads_binary(data[:size])
+
+    def test_smaller(self):
+        document = Order.dumps_json_copy(DOCUMENTS[1])
+        self.assertLess(len(Order.dumps_binary(DOCUMENTS[1])), len(json.dumps(document)) / 2)
+
+    def test_self_nesting(self):
+        class Node(BinaryMixin, pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+        fingerprint = Node.binary_fingerprint()
+        Node.add_field("children", pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Node)))
+        self.assertNotEqual(Node.binary_fingerprint(), fingerprint)
+        document = {"name": "a", "children": [{"name": "b", "children": [{"name": "c"}]}]}
+        self.assertEqual(Node.loads_binary(Node.dumps_binary(document)), document)
+
+    def test_fingerprint(self):
+        class Same(BinaryMixin, pdmodels.DefinedDict):
+            name = pdmodels.StringField(is_required=True)
+            born = pdmodels.DateTimeField()
+
+        class Other(BinaryMixin, pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+            born = pdmodels.IntField()
+
+        data = Author.dumps_binary({"name": "Ann", "born": WHEN})
+        self.assertEqual(Same.loads_binary(data), {"name": "Ann", "born": WHEN})
+        with self.assertRaises(pdmodels.DictValueError):
+            Other.loads_binary(data)
+        with self.assertRaises(pdmodels.DictValueError):
+            Author.loads_binary(b"junk" + data[4:])
+        with self.assertRaises(pdmodels.DictValueError):
+            Author.loads_binary(data + b"\x00")
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            Order.dumps_binary({"anything": object()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import copy
+import unittest
+
+import pdmodels
+from pdmodels.extensions.cache import ValidationCache, ValidationCacheMixin, TrackedDict, TrackedList, track, content_key
+from . import test_base
+
+
+class TestModelBaseTest(unittest.TestCase, test_base.DictMixin, test_base.MoreAssertMixin):
+    pass
+
+
+class Address(pdmodels.DefinedDict):
+
+    city = pdmodels.StringField(is_required=True)
+
+
+class Person(ValidationCacheMixin, pdmodels.DefinedDict):
+
+    validation_cache = ValidationCache(maxsize=2)
+
+    name = pdmodels.StringField(is_required=True)
+    age = pdmodels.IntField(min=0)
+    address = pdmodels.DefinedDictField(model=Address)
+    tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+    scores = pdmodels.MapField(inner_type=pdmodels.IntField())
+
+
+class TrackedDictTest(TestModelBaseTest):
+
+    def test_versions(self):
+        document = track({"name": "a", "address": {"city": "x"}, "tags": ["a"]})
+        self.assertIsInstance(document["address"], TrackedDict)
+        self.assertIsInstance(document["tags"], TrackedList)
+
+        versions = [document.version]
+        mutations = [
+            lambda d: d.__setitem__("name", "b"),
+            lambda d: d["address"].__setitem__("city", "y"),
+            lambda d: d["tags"].append("b"),
+            lambda d: d["tags"].pop(),
+            lambda d: Person.update(d, {"address": {"city": "z"}, "scores": {"a": 1}}),
+            lambda d: d["scores"].__setitem__("b", 2),
+            lambda d: d.pop("age", None),
+            lambda d: Person.clean_document(d),
+        ]
+        for mutate in mutations:
+            mutate(document)
+            self.assertNotIn(document.version, versions)
+            versions.append(document.version)
+        self.assertEqual(copy.deepcopy(document), document)
+
+    def test_ior(self):
+        document = track({"name": "a"})
+        self.assertEqual(Person.get_document_errors(document), [])
+        document |= {"age": -1, "address": {"city": 1}}
+        self.assertIsInstance(document["address"], TrackedDict)
+        self.assertEqual(Person.get_document_errors(document), [("age", "value", -1), ("address.city", "type", 1)])
+        document["address"]["city"] = "x"
+        self.assertEqual(Person.get_document_errors(document), [("age", "value", -1)])
+
+    def test_copy(self):
+        for copy_function in (TrackedDict.copy, copy.copy):
+            document = track({"name": "a", "address": {"city": "x"}, "tags": ["a"]})
+            self.assertEqual(Person.get_document_errors(document), [])
+            copied = copy_function(document)
+            self.assertIsInstance(copied, TrackedDict)
+            self.assertIsNot(copied, document)
+            self.assertEqual(copied, document)
+            self.assertEqual(Person.get_document_errors(copied), [])
+            copied["address"]["city"] = 1
+            self.assertEqual(Person.get_document_errors(copied), [("address.city", "type", 1)])
+            self.assertEqual(Person.get_document_errors(document), [("address.city", "type", 1)])
+            copied["name"] = 1
+            self.assertEqual(Person.get_document_errors(copied), [("name", "type", 1), ("address.city", "type", 1)])
+            self.assertEqual(Person.get_document_errors(document), [("address.city", "type", 1)])
+
+    def test_list_copy(self):
+        for copy_function in (TrackedList.copy, copy.copy):
+            document = track({"name": "a", "tags": ["a"]})
+            tags = copy_function(document["tags"])
+            self.assertIsInstance(tags, TrackedList)
+            self.assertEqual(Person.get_document_errors(document), [])
+            tags.append(1)
+            self.assertEqual(document["tags"], ["a"])
+            self.assertEqual(Person.get_document_errors(document), [])
+
+    def test_shared_value(self):
+        first = track({"name": "a", "address": {"city": "x"}})
+        second = track({"name": "b"})
+        self.assertEqual(Person.get_document_errors(first), [])
+        second["address"] = first["address"]
+        self.assertEqual(Person.get_document_errors(second), [])
+        second["address"]["city"] = 1
+        self.assertEqual(Person.get_document_errors(first), [("address.city", "type", 1)])
+        self.assertEqual(Person.get_document_errors(second), [("address.city", "type", 1)])
+
+
+class ValidationCacheTest(TestModelBaseTest):
+
+    def setUp(self):
+        Person.validation_cache.clear()
+        Person.validation_cache.reset_stats()
+
+    def test_content_key(self):
+        self.assertEqual(content_key(Person, {"name": "a", "undefined": 1}), content_key(Person, {"name": "a"}))
+        self.assertNotEqual(content_key(Person, {"age": 1}), content_key(Person, {"age": 1.0}))
+        self.assertNotEqual(content_key(Person, {"age": 1}), content_key(Person, {"age": True}))
+        self.assertEqual(content_key(Person, {"address": {"city": "a", "x": 1}}),
+                content_key(Person, {"address": {"city": "a"}}))
+
+    def test_content_cache(self):
+        self.assertEqual(Person.get_document_errors({"age": -1}), [("name", "required", None), ("age", "value", -1)])
+        errors = Person.get_document_errors({"age": -1, "other": 1})
+        self.assertEqual(errors, [("name", "required", None), ("age", "value", -1)])
+        errors.append("modified")
+        self.assertFalse(Person.is_document_valid({"age": -1}))
+        self.assertTrue(Person.is_document_valid({"name": "a"}))
+        self.assertEqual(Person.validation_cache.stats(),
+                {"hits": 2, "misses": 2, "evictions": 0, "uncacheable": 0, "size": 2, "maxsize": 2})
+
+    def test_lru(self):
+        Person.get_document_errors({"name": "a"})
+        Person.get_document_errors({"name": "b"})
+        Person.get_document_errors({"name": "a"})
+        Person.get_document_errors({"name": "c"})
+        self.assertEqual(Person.validation_cache.evictions, 1)
+        Person.get_document_errors({"name": "a"})
+        self.assertEqual(Person.validation_cache.hits, 2)
+        Person.get_document_errors({"name": "b"})
+        self.assertEqual(Person.validation_cache.misses, 4)
+
+    def test_tracked_cache(self):
+        document = track({"name": "a", "tags": ["x"]})
+        self.assertEqual(Person.get_document_errors(document), [])
+        self.assertEqual(Person.get_document_errors(document), [])
+        self.assertEqual(Person.validation_cache.hits, 1)
+        Person.update(document, {"address": {"city": 1}})
+        self.assertEqual(Person.get_document_errors(document), [("address.city", "type", 1)])
+        document["tags"].append(2)
+        self.assertEqual(Person.get_document_errors(document), [("address.city", "type", 1), ("tags.1", "type", 2)])
+        self.assertEqual(Person.validation_cache.misses, 3)
+
+    def test_max_errors(self):
+        document = {"age": -1, "tags": [1]}
+        errors = [("name", "required", None), ("age", "value", -1), ("tags.0", "type", 1)]
+        self.assertEqual(Person.get_document_errors(document, max_errors=2), errors[:2])
+        self.assertEqual(Person.get_document_errors(document, fail_fast=True), errors[:1])
+        self.assertEqual(Person.validation_cache.stats()["size"], 0)
+        self.assertEqual(Person.get_document_errors(document), errors)
+        self.assertEqual(Person.get_document_errors(document, max_errors=1), errors[:1])
+        self.assertEqual(Person.get_document_errors(document), errors)
+        self.assertEqual(Person.validation_cache.hits, 1)
+        self.assertEqual(Person.validation_cache.misses, 1)
+
+    def test_uncacheable(self):
+        class Anything(ValidationCacheMixin, pdmodels.DefinedDict):
+            value = pdmodels.Field()
+        self.assertEqual(Anything.get_document_errors({"value": set()}), [])
+        self.assertEqual(Anything.validation_cache.uncacheable, 1)
@@ -0,0 +1,145 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+import pdmodels
+from pdmodels.extensions.storage import JsonStorageMixin
+
+try:
+    import numpy
+    from pdmodels.extensions.columnar import ColumnarMixin
+except ImportError: # numpy is not installed
+    ColumnarMixin = None
+
+
+WHEN = datetime.datetime(2017, 5, 1, 10, 30, 15, 123456)
+
+
+def make_models():
+    class Author(JsonStorageMixin, pdmodels.DefinedDict):
+        name = pdmodels.StringField(is_required=True)
+        born = pdmodels.DateTimeField()
+
+    class Sale(ColumnarMixin, pdmodels.DefinedDict):
+        id = pdmodels.StringField(is_required=True)
+        count = pdmodels.IntField(min=0)
+        price = pdmodels.FloatField()
+        paid = pdmodels.BoolField()
+        created = pdmodels.DateTimeField()
+        author = pdmodels.DefinedDictField(model=Author)
+        tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+    return Sale
+
+
+@unittest.skipIf(ColumnarMixin is None, "numpy is not installed")
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "sales")
+        self.addCleanup(self.directory.cleanup)
+
+    def documents(self):
+        return [
+            {"id": "s0", "count": 3, "price": 9.5, "paid": True, "created": WHEN,
+             "author": {"name": "Ann", "born": WHEN}, "tags": ["a", "b"]},
+            {"id": "café ☃", "count": None, "price": None, "paid": None, "created": None, "author": None, "tags": None},
+            {"id": "s2", "count": 0, "price": -1.25, "paid": False, "created": datetime.datetime(1969, 12, 31),
+             "author": {"name": "Bob", "born": None}, "tags": []},
+        ]
+
+    def test_roundtrip(self):
+        Sale = make_models()
+        documents = self.documents()
+        self.assertEqual(Sale.build_columns(self.path, iter(documents)), 3)
+        with Sale.open_columns(self.path) as store:
+            self.assertEqual(len(store), 3)
+            self.assertEqual(list(store), documents)
+            self.assertEqual(store[-1], documents[-1])
+            self.assertEqual(store.values("id", 1), ["café ☃", "s2"])
+            with self.assertRaises(IndexError):
+                store[3]
+
+    def test_columns(self):
+        Sale = make_models()
+        Sale.build_columns(self.path, self.documents())
+        with Sale.open_columns(self.path) as store:
+            count = store.column("count")
+            self.assertIsInstance(count, numpy.memmap)
+            self.assertEqual(count.dtype, numpy.int64)
+            self.assertEqual(count.tolist(), [3, 0, 0])
+            self.assertEqual(store.nulls("count").tolist(), [False, True, False])
+            self.assertEqual(float(store.column("price")[~store.nulls("price")].sum()), 8.25)
+            self.assertEqual(store.column("paid").tolist(), [True, False, False])
+            self.assertEqual(store.column("created")[0], numpy.datetime64(WHEN, "us"))
+            with self.assertRaises(pdmodels.DictFieldError):
+                store.column("id")
+            with self.assertRaises(pdmodels.DictFieldError):
+                store.nulls("unknown")
+
+    def test_chunks(self):
+        Sale = make_models()
+        documents = [ {"id": str(i), "count": i, "tags": ["x"] * (i % 3)} for i in range(70000) ]
+        Sale.build_columns(self.path, documents)
+        with Sale.open_columns(self.path) as store:
+            self.assertEqual(store.column("count").tolist(), list(range(70000)))
+            self.assertEqual(store[69999]["tags"], ["x", "x", "x"][:69999 % 3])
+            self.assertEqual(store.values("id", 65535, 65537), ["65535", "65536"])
+
+    def test_empty(self):
+        Sale = make_models()
+        self.assertEqual(Sale.build_columns(self.path, []), 0)
+        with Sale.open_columns(self.path) as store:
+            self.assertEqual(len(store), 0)
+            self.assertEqual(store.column("price").tolist(), [])
+            self.assertEqual(list(store), [])
+
+    def test_validate(self):
+        Sale = make_models()
+        with self.assertRaises(pdmodels.DictValueError):
+            Sale.build_columns(self.path, [{"id": "a"}, {"id": "b", "count": -1}])
+        with self.assertRaises(pdmodels.DictValueError):
+            Sale.open_columns(self.path)
+        with self.assertRaises(pdmodels.DictValueError):
+            Sale.build_columns(self.path, [{"id": "b", "count": "x"}], validate=False)
+
+    def test_nested_datetimes(self):
+        class Note(pdmodels.DefinedDict):
+            type = pdmodels.StringField()
+            at = pdmodels.DateTimeField()
+
+        class Tagged(JsonStorageMixin, pdmodels.DefinedDict):
+            id = pdmodels.StringField(store_field="_id")
+            state = pdmodels.StringField(choices={"new": 0, "old": 1})
+            seen = pdmodels.ListField(inner_type=pdmodels.DateTimeField())
+
+        class Event(ColumnarMixin, pdmodels.DefinedDict):
+            dates = pdmodels.ListField(inner_type=pdmodels.DateTimeField())
+            stamps = pdmodels.MapField(inner_type=pdmodels.DateTimeField())
+            note = pdmodels.DefinedDictField(model=Note)
+            notes = pdmodels.MapField(inner_type=pdmodels.DefinedDictField(model=Note))
+            tagged = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Tagged))
+            item = pdmodels.VariableDefinedDictField("type", {"note": Note})
+            extra = pdmodels.DictField()
+        Note.add_field("replies", pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Note)))
+
+        documents = [
+            {"dates": [WHEN, datetime.datetime(1969, 12, 31)], "stamps": {"a": WHEN}, "note": {"at": WHEN, "undefined": 1},
+             "notes": {"x": {"at": WHEN, "replies": [{"at": WHEN}]}}, "item": {"type": "note", "at": WHEN},
+             "tagged": [{"id": "t1", "state": "old", "seen": [WHEN]}], "extra": {"at": 1}},
+            {"dates": [], "stamps": {}, "note": None, "notes": {}, "tagged": [], "item": None, "extra": None},
+        ]
+        Event.build_columns(self.path, documents)
+        with Event.open_columns(self.path) as store:
+            self.assertEqual(list(store), documents)
+
+    def test_other_model(self):
+        Sale = make_models()
+        Sale.build_columns(self.path, self.documents())
+
+        class Other(ColumnarMixin, pdmodels.DefinedDict):
+            id = pdmodels.StringField()
+            count = pdmodels.FloatField()
+        with self.assertRaises(pdmodels.DictValueError):
+            Other.open_columns(self.path)
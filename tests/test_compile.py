@@ -0,0 +1,506 @@
+import copy
+import datetime
+import random
+import threading
+import time
+import tracemalloc
+import unittest
+
+import pdmodels
+from . import test_base
+
+
+class TestModelBaseTest(unittest.TestCase, test_base.DictMixin, test_base.MoreAssertMixin):
+    pass
+
+
+class EvenField(pdmodels.IntField):
+    """A user defined field, the compiler does not know its errors"""
+
+    def errors(self, value, with_key=None):
+        yield from super().errors(value, with_key)
+        if isinstance(value, int) and value % 2 != 0:
+            yield (with_key, pdmodels.Field.ERROR_VALUE, value)
+
+
+class Author(pdmodels.DefinedDict):
+
+    name = pdmodels.StringField(is_required=True)
+    born = pdmodels.DateTimeField()
+
+
+class Book(pdmodels.DefinedDict):
+
+    type = pdmodels.StringField(fixed_value="book")
+    isbn = pdmodels.StringField(is_required=True, regex=r"\d{4}-[A-Z]+")
+
+
+class Pen(pdmodels.DefinedDict):
+
+    type = pdmodels.StringField(fixed_value="pen")
+    color = pdmodels.StringField(choices={"red", "blue"})
+
+
+class Everything(pdmodels.DefinedDict):
+
+    anything = pdmodels.Field()
+    required = pdmodels.Field(is_required=True)
+    typed = pdmodels.TypedField(allowed_type=(str, bytes))
+    string = pdmodels.StringField(choices=["a", "b"])
+    number = pdmodels.NumberField(allowed_type=(int, float), min=-1, max=1)
+    count = pdmodels.IntField(min=0)
+    ratio = pdmodels.FloatField(max=1.0)
+    flag = pdmodels.BoolField()
+    when = pdmodels.DateTimeField(is_required=True)
+    raw = pdmodels.DictField()
+    tags = pdmodels.ListField(inner_type=pdmodels.StringField(regex="[a-z]+$"))
+    untyped_list = pdmodels.ListField()
+    matrix = pdmodels.ListField(inner_type=pdmodels.ListField(inner_type=pdmodels.IntField(max=9)))
+    scores = pdmodels.MapField(inner_type=pdmodels.FloatField(min=0.0))
+    author = pdmodels.DefinedDictField(model=Author, is_required=True)
+    authors = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Author))
+    by_name = pdmodels.MapField(inner_type=pdmodels.DefinedDictField(model=Author))
+    product = pdmodels.VariableDefinedDictField("type", {"book": Book, "pen": Pen})
+    stored = pdmodels.IntField(dict_key="_stored", is_required=True)
+    even = EvenField()
+
+
+DOCUMENTS = [
+    {},
+    {"required": 1, "when": datetime.datetime(2017, 1, 1), "author": {"name": "x"}, "_stored": 1},
+    {
+        "anything": object(),
+        "typed": 1,
+        "string": "c",
+        "number": 2,
+        "count": -1,
+        "ratio": 1.5,
+        "flag": 1,
+        "when": 1234,
+        "raw": [],
+        "tags": ["abc", "ABC", None],
+        "untyped_list": [None, 1, "a"],
+        "matrix": [[1, 10], "not a list", [None, 2.0]],
+        "scores": {"a": 1.0, "b": -1, "c": True, "d": None},
+        "author": {"born": "yesterday"},
+        "authors": [{"name": "a"}, {}, None, "nope"],
+        "by_name": {"a": {"name": 1}, "b": None, "c": 3},
+        "product": {"type": "book", "isbn": "abc"},
+        "stored": 1,
+        "even": 3,
+    },
+    {"number": 0.5, "count": True, "ratio": 1, "tags": "abc", "scores": [], "author": "x"},
+    {"product": {}},
+    {"product": {"type": "car"}},
+    {"product": {"type": "pen", "color": "black"}},
+    {"product": "pen", "even": "x"},
+]
+
+
+class CompiledValidatorTest(TestModelBaseTest):
+
+    def assertSameErrors(self, model, document):
+        expected = list(model._yield_errors(document))
+        self.assertEqual(model.get_document_errors(document), expected)
+
+    def test_equivalence(self):
+        for document in DOCUMENTS:
+            self.assertSameErrors(Everything, document)
+
+    def test_same_exceptions(self):
+        """values that break the checks of the fields break both paths the same way"""
+        for document in ({"tags": [1]}, {"count": "a"}):
+            with self.assertRaises(TypeError):
+                list(Everything._yield_errors(document))
+            with self.assertRaises(TypeError):
+                Everything.get_document_errors(document)
+
+    def test_every_field_is_tested(self):
+        """ensures that every field type in pdmodels is used in Everything"""
+        fields = { v for v in vars(pdmodels).values() if isinstance(v, type) and issubclass(v, pdmodels.Field) }
+        used = set()
+        for definition in Everything._fields.values():
+            used.update(type(definition).__mro__)
+        self.assertLen(fields - used, 0)
+
+    def test_nested_model_errors(self):
+        errors = Everything.get_document_errors(DOCUMENTS[2])
+        self.assertIn(("authors.1.name", "required", None), errors)
+        self.assertIn(("by_name.a.name", "type", 1), errors)
+        self.assertIn(("matrix.0.1", "value", 10), errors)
+        self.assertIn(("product.isbn", "value", "abc"), errors)
+
+    def test_variable_model_errors(self):
+        self.assertIn(("product.type", "required", None), Everything.get_document_errors({"product": {}}))
+        self.assertIn(("product.type", "value", "car"), Everything.get_document_errors({"product": {"type": "car"}}))
+
+    def test_overridden_yield_errors(self):
+        class Strict(pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+
+            @classmethod
+            def _yield_errors(cls, document, parent=None):
+                yield from super()._yield_errors(document, parent=parent)
+                for key in document:
+                    if key not in cls._fields:
+                        yield (key, "undefined", document[key])
+
+        self.assertEqual(Strict.get_document_errors({"age": 1}), [("age", "undefined", 1)])
+
+    def test_compile_on_create(self):
+        class Eager(pdmodels.DefinedDict):
+            compile_on_create = True
+            name = pdmodels.StringField()
+
+        class Lazy(pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+
+        self.assertIn("validator", Eager._compiled)
+        self.assertNotIn("_compiled", Lazy.__dict__)
+        Lazy.get_document_errors({})
+        self.assertIn("validator", Lazy._compiled)
+
+    def test_compile_threads(self):
+        class Owner(object):
+            pass
+        owner, started, results = Owner(), threading.Event(), []
+
+        def compile_function():
+            started.set()
+            time.sleep(0.05)
+            return lambda value: value + 1
+
+        def compile_other_thread():
+            started.wait()
+            results.append(pdmodels._get_compiled(owner, "function", compile_function)(1))
+
+        thread = threading.Thread(target=compile_other_thread)
+        thread.start()
+        function = pdmodels._get_compiled(owner, "function", compile_function)
+        thread.join()
+        self.assertEqual(results, [2])
+        self.assertIs(owner._compiled["function"], function)
+
+    def test_from_dict_subclass(self):
+        Base = pdmodels.DefinedDict.from_dict("Base", {"name": pdmodels.StringField()})
+        Base.get_document_errors({})
+        Child = Base.from_dict("Child", {"age": pdmodels.IntField()})
+        self.assertEqual(Child.get_document_errors({"name": 1, "age": "a"}),
+                [("name", "type", 1), ("age", "type", "a")])
+
+
+class Stamp(pdmodels.DefinedDict):
+
+    kind = pdmodels.StringField(fixed_value="stamp")
+    value = pdmodels.IntField(default=1)
+    tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+
+
+class Album(pdmodels.DefinedDict):
+
+    name = pdmodels.StringField(default=lambda field: "untitled")
+    kind = pdmodels.StringField(fixed_value="album")
+    created = pdmodels.DateTimeField()
+    stamps = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Stamp))
+    loose = pdmodels.ListField(ensure_list=False, remove_none_value=False)
+    by_country = pdmodels.MapField(inner_type=pdmodels.DefinedDictField(model=Stamp))
+    counts = pdmodels.MapField(inner_type=pdmodels.IntField(), ensure_dict=False, remove_none_value=False)
+    fixed = pdmodels.MapField(inner_type=pdmodels.StringField(fixed_value="x"))
+    nested = pdmodels.MapField(inner_type=pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Stamp)))
+    cover = pdmodels.DefinedDictField(model=Stamp)
+    product = pdmodels.VariableDefinedDictField("type", {"book": Book, "pen": Pen})
+    stored = pdmodels.IntField(dict_key="_stored", default=0)
+
+
+CLEAN_DOCUMENTS = [
+    {},
+    {"name": None, "kind": "book", "created": 0, "undefined": 1},
+    {
+        "stamps": [{"value": 3, "extra": 1}, None, {"tags": None}],
+        "loose": [None, 1],
+        "by_country": {"sg": {}, "my": None},
+        "counts": {"a": None, "b": 1},
+        "fixed": {"a": "y", "b": None},
+        "nested": {"a": [None, {"kind": "x"}], "b": None},
+        "cover": {"value": None},
+        "product": {"type": "pen", "isbn": "1234-A"},
+        "_stored": 5,
+        "stored": 3,
+    },
+    {"cover": None, "product": None, "counts": None, "loose": None, "stamps": None},
+]
+
+
+class CompiledCleanerTest(TestModelBaseTest):
+
+    def interpreted_clean(self, model, document, **kwargs):
+        """clean through the clean of each field"""
+        for key, definition in model._fields.items():
+            definition.clean(document, key, **kwargs)
+        if kwargs.get("remove_undefined", True):
+            for key in set(document.keys()) - set(model._fields.keys()):
+                document.pop(key)
+        return document
+
+    def test_equivalence(self):
+        for set_default in (True, False):
+            for remove_undefined in (True, False):
+                for document in CLEAN_DOCUMENTS:
+                    kwargs = { "set_default": set_default, "remove_undefined": remove_undefined }
+                    expected = self.interpreted_clean(Album, copy.deepcopy(document), **kwargs)
+                    self.assertEqual(Album.clean_document(copy.deepcopy(document), **kwargs), expected)
+
+    def test_clean(self):
+        album = Album.clean_document(copy.deepcopy(CLEAN_DOCUMENTS[2]))
+        self.assertEqual(album["name"], "untitled")
+        self.assertEqual(album["stamps"], [
+            {"kind": "stamp", "value": 3, "tags": []},
+            {"kind": "stamp", "value": 1, "tags": []},
+        ])
+        self.assertEqual(album["by_country"], {"sg": {"kind": "stamp", "value": 1, "tags": []}})
+        self.assertEqual(album["counts"], {"a": None, "b": 1})
+        self.assertEqual(album["fixed"], {"a": "x"})
+        self.assertEqual(album["nested"], {"a": [{"kind": "stamp", "value": 1, "tags": []}]})
+        self.assertEqual(album["product"], {"type": "pen", "color": None})
+        self.assertEqual(album["_stored"], 5)
+        self.assertNotIn("stored", album)
+
+    def test_datetime(self):
+        album = Album.clean_document({"created": 1432550134353845})
+        self.assertEqual(album["created"], pdmodels.int_to_datetime(1432550134353845, 1e6))
+        self.assertNotIn("created", Album.clean_document({}, set_default=False))
+
+    def test_report_modified(self):
+        for set_default in (True, False):
+            for remove_undefined in (True, False):
+                for document in CLEAN_DOCUMENTS:
+                    kwargs = { "set_default": set_default, "remove_undefined": remove_undefined }
+                    with self.subTest(document=document, **kwargs):
+                        cleaned, modified = Album.clean_document(copy.deepcopy(document), report_modified=True, **kwargs)
+                        self.assertEqual(modified, cleaned != document)
+                        again = copy.deepcopy(cleaned)
+                        self.assertEqual(Album.clean_document(again, report_modified=True, **kwargs), (cleaned, False))
+        self.assertEqual(Album.clean_document(None, report_modified=True), (None, False))
+        document = Album.clean_document({})
+        document["kind"] = "".join(["al", "bum"])
+        self.assertEqual(Album.clean_document(document, report_modified=True), (document, False))
+        self.assertIs(document["kind"], Album._fields["kind"].fixed_value)
+
+    def test_clean_without_allocation(self):
+        document = Album.clean_document({"stamps": [{"tags": ["a"]}] * 100, "by_country": {"sg": {}},
+            "counts": {"a": 1}, "fixed": {"a": "x"}, "nested": {"a": [{}]}, "product": {"type": "pen"}})
+        expected = copy.deepcopy(document)
+        stamps = document["stamps"]
+        Album.clean_document(document)
+        tracemalloc.start()
+        try:
+            for _ in range(100):
+                Album.clean_document(document)
+            current, peak = tracemalloc.get_traced_memory()
+            # only the iterators of the loops, no list, dict or key is made
+            self.assertEqual(current, 0)
+            self.assertLess(peak, 1024)
+        finally:
+            tracemalloc.stop()
+        self.assertIs(document["stamps"], stamps)
+        self.assertEqual(document, expected)
+
+    def test_clean_uncomparable_values(self):
+        class Uncomparable(object):
+            def __eq__(self, other):
+                raise ValueError("ambiguous")
+            __hash__ = object.__hash__
+
+        value = Uncomparable()
+        self.assertEqual(Stamp.clean_document({"tags": [value, None]})["tags"], [value])
+        self.assertFalse(Stamp.clean_document({"kind": "stamp", "value": 1, "tags": [value]}, report_modified=True)[1])
+
+    def test_custom_clean_modified(self):
+        class UpperField(pdmodels.StringField):
+            def clean(self, document, key, **kwargs):
+                super().clean(document, key, **kwargs)
+                if document.get(key) is not None and not document[key].isupper():
+                    document[key] = document[key].upper()
+
+        class Tag(pdmodels.DefinedDict):
+            name = UpperField()
+
+        self.assertEqual(Tag.clean_document({"name": "a", "x": 1}, report_modified=True), ({"name": "A"}, True))
+        self.assertEqual(Tag.clean_document({"name": "A"}, report_modified=True), ({"name": "A"}, False))
+        self.assertEqual(Tag.clean_document({"name": "A", "x": 1}, report_modified=True), ({"name": "A"}, True))
+
+    def test_custom_clean(self):
+        class UpperField(pdmodels.StringField):
+            def clean(self, document, key, **kwargs):
+                super().clean(document, key, **kwargs)
+                if document.get(key) is not None:
+                    document[key] = document[key].upper()
+
+        class Tag(pdmodels.DefinedDict):
+            name = UpperField()
+            aliases = pdmodels.MapField(inner_type=UpperField())
+
+        self.assertEqual(Tag.clean_document({"name": "a", "aliases": {"x": "b"}}),
+                {"name": "A", "aliases": {"x": "B"}})
+
+    def test_self_nesting(self):
+        class Node(pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+        Node.add_field("children", pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Node)))
+
+        node = Node.clean_document({"children": [{"name": "a", "children": [{"x": 1}]}]})
+        self.assertEqual(node, {"name": None, "children": [
+            {"name": "a", "children": [{"name": None, "children": []}]}]})
+        self.assertEqual(Node.get_document_errors({"children": [{"name": 1}]}), [("children.0.name", "type", 1)])
+
+
+class PrimitiveListTest(TestModelBaseTest):
+
+    class Telemetry(pdmodels.DefinedDict):
+        counts = pdmodels.ListField(inner_type=pdmodels.IntField(min=0, max=100))
+        ratios = pdmodels.ListField(inner_type=pdmodels.FloatField(min=0.0))
+        names = pdmodels.ListField(inner_type=pdmodels.StringField(regex="[a-z]+$", choices=["a", "b", "ab", "B"]))
+        flags = pdmodels.ListField(inner_type=pdmodels.BoolField(is_required=True))
+        anything = pdmodels.ListField(inner_type=pdmodels.Field(choices=[1, "a", None]))
+        whens = pdmodels.ListField(inner_type=pdmodels.DateTimeField())
+        by_key = pdmodels.MapField(inner_type=pdmodels.IntField(max=10))
+
+    NUMBERS = [None, 0, 1, -1, 50, 101, 1.5, -0.5, float("nan"), float("inf"), True, False, type("Sub", (int, ), {})(5)]
+    STRINGS = [None, "a", "b", "ab", "B", "c", "", type("Sub", (str, ), {})("a")]
+    OTHERS = [None, 1, "a", 1.5, True, datetime.datetime(2017, 1, 1), (), frozenset()]
+    VALUES = {"counts": NUMBERS, "ratios": NUMBERS, "names": STRINGS, "flags": OTHERS, "anything": OTHERS,
+              "whens": OTHERS, "by_key": NUMBERS}
+
+    def expected(self, document):
+        """the errors as the inner fields produce them one by one"""
+        errors = []
+        for key, definition in self.Telemetry._fields.items():
+            value = document.get(key)
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    errors.extend(definition.inner_type.errors(item, "{0}.{1}".format(key, index)))
+            else:
+                for k, item in value.items():
+                    errors.extend(definition.inner_type.errors(item, "{0}.{1}".format(key, k)))
+        return errors
+
+    def test_equivalence(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            document = {}
+            for key in self.Telemetry._fields:
+                pool = rng.sample(self.VALUES[key], rng.randint(1, 4))
+                values = [ rng.choice(pool) for _ in range(rng.randint(0, 6)) ]
+                document[key] = { str(i): v for i, v in enumerate(values) } if key == "by_key" else values
+            with self.subTest(document=document):
+                expected = self.expected(document)
+                self.assertEqual(repr(self.Telemetry.get_document_errors(document)), repr(expected))
+                self.assertEqual(repr(list(self.Telemetry._yield_errors(document))), repr(expected))
+                self.assertEqual(self.Telemetry.is_document_valid(document), not expected)
+
+    def test_unhashable_choices(self):
+        class Choices(pdmodels.DefinedDict):
+            b = pdmodels.ListField(inner_type=pdmodels.Field(choices=[1, 2]))
+            m = pdmodels.MapField(inner_type=pdmodels.Field(choices=[1, 2]))
+        document = {"b": [1, [1]], "m": {"x": 2, "y": {}}}
+        expected = [("b.1", "value", [1]), ("m.y", "value", {})]
+        self.assertEqual(Choices.get_document_errors(document), expected)
+        self.assertEqual(list(Choices._yield_errors(document)), expected)
+        self.assertFalse(Choices.is_document_valid(document))
+        self.assertTrue(Choices.is_document_valid({"b": [1, 2], "m": {"x": 1}}))
+
+    def test_clean_keeps_list(self):
+        document = {"counts": [1, 2, 3], "by_key": {"a": 1}}
+        counts, by_key = document["counts"], document["by_key"]
+        self.Telemetry.clean_document(document)
+        self.assertIs(document["counts"], counts)
+        self.assertIs(document["by_key"], by_key)
+        document = {"counts": [1, None, 3], "by_key": {"a": 1, "b": None}}
+        counts = document["counts"]
+        self.Telemetry.clean_document(document)
+        self.assertEqual(document["counts"], [1, 3])
+        self.assertEqual(counts, [1, None, 3])
+        self.assertEqual(document["by_key"], {"a": 1})
+
+
+class LimitedValidatorTest(TestModelBaseTest):
+
+    def test_prefix(self):
+        for document in DOCUMENTS:
+            expected = list(Everything._yield_errors(document))
+            for limit in range(len(expected) + 2):
+                self.assertEqual(Everything.get_document_errors(document, max_errors=limit), expected[:limit])
+            self.assertEqual(Everything.get_document_errors(document, fail_fast=True), expected[:1])
+            self.assertEqual(Everything.get_document_errors(document, max_errors=5, fail_fast=True), expected[:1])
+
+    def test_stops_early(self):
+        checked = []
+
+        class Counted(pdmodels.IntField):
+            def errors(self, value, with_key=None):
+                checked.append(value)
+                yield from super().errors(value, with_key)
+
+        class Item(pdmodels.DefinedDict):
+            value = Counted()
+
+        class Upload(pdmodels.DefinedDict):
+            items = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Item))
+            by_key = pdmodels.MapField(inner_type=pdmodels.DefinedDictField(model=Item))
+
+        document = {"items": [{"value": "x"}] * 100000, "by_key": {str(i): {"value": "x"} for i in range(10)}}
+        errors = Upload.get_document_errors(document, max_errors=3)
+        self.assertEqual(errors, [("items.{0}.value".format(i), "type", "x") for i in range(3)])
+        self.assertEqual(len(checked), 3)
+        del checked[:]
+        errors = Upload.get_document_errors({"by_key": document["by_key"]}, fail_fast=True)
+        self.assertEqual(errors, [("by_key.0.value", "type", "x")])
+        self.assertEqual(len(checked), 1)
+
+    def test_overridden_yield_errors(self):
+        class Strict(pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+
+            @classmethod
+            def _yield_errors(cls, document, parent=None):
+                for key in document:
+                    yield (key if parent is None else parent + "." + key, "undefined", document[key])
+
+        class Outer(pdmodels.DefinedDict):
+            inner = pdmodels.DefinedDictField(model=Strict)
+
+        self.assertEqual(Outer.get_document_errors({"inner": {"a": 1, "b": 2}}, max_errors=1),
+                [("inner.a", "undefined", 1)])
+
+
+class CompiledCheckerTest(TestModelBaseTest):
+
+    def test_equivalence(self):
+        for document in DOCUMENTS + [DOCUMENTS[1], {"product": {"type": "pen"}}]:
+            self.assertEqual(Everything.is_document_valid(document),
+                    next(Everything._yield_errors(document), None) is None)
+
+    def test_valid_document(self):
+        document = {"required": 1, "when": datetime.datetime(2017, 1, 1), "author": {"name": "x"}, "_stored": 2,
+                "authors": [{"name": str(i)} for i in range(1000)], "scores": {"a": 1.0},
+                "product": {"type": "book", "isbn": "1234-A"}}
+        self.assertTrue(Everything.is_document_valid(document))
+        document["authors"][999]["born"] = 1
+        self.assertFalse(Everything.is_document_valid(document))
+
+    def test_is_valid_value(self):
+        cases = [
+            (pdmodels.IntField(min=0), [1, -1, "a", None, True]),
+            (pdmodels.StringField(regex="a+$", is_required=True), ["aa", "ab", None]),
+            (pdmodels.ListField(inner_type=pdmodels.IntField()), [[1], [1, "a"], "a", None]),
+            (pdmodels.DefinedDictField(model=Author), [{"name": "a"}, {}, "a"]),
+            (EvenField(), [2, 3, "a"]),
+        ]
+        for definition, values in cases:
+            for value in values:
+                self.assertEqual(definition.is_valid_value(value), next(definition.errors(value, "key"), None) is None)
+
+    def test_map_is_valid_value(self):
+        definition = pdmodels.MapField(inner_type=pdmodels.IntField())
+        self.assertTrue(definition.is_valid_value({"a": 1}))
+        self.assertFalse(definition.is_valid_value({"a": "b"}))
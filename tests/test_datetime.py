@@ -0,0 +1,107 @@
+import datetime
+import os
+import time
+import unittest
+
+import pdmodels
+from pdmodels.extensions.storage import JsonStorageMixin
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+UTC = datetime.timezone.utc
+TOKYO = datetime.timezone(datetime.timedelta(hours=9))
+
+STAMPS = [0, 1, -1, 999999, 1000000, 1432550134353845, -1432550134353845, 253402200000000000, 1e15 + 1]
+
+
+class DateTimeConversionTest(unittest.TestCase):
+
+    def test_int_to_datetime_utc(self):
+        for stamp in STAMPS:
+            value = pdmodels.int_to_datetime(int(stamp), 1e6, pdmodels.TIMEZONE_UTC)
+            expected = datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=int(stamp))
+            self.assertEqual(value, expected)
+            self.assertIsNone(value.tzinfo)
+        self.assertEqual(pdmodels.int_to_datetime(1432550134353845, 1e6, pdmodels.TIMEZONE_UTC),
+                         datetime.datetime(2015, 5, 25, 10, 35, 34, 353845))
+
+    def test_int_to_datetime_local(self):
+        value = pdmodels.int_to_datetime(1432550134353845, 1e6)
+        self.assertEqual(value, datetime.datetime.fromtimestamp(1432550134).replace(microsecond=353845))
+        value = pdmodels.int_to_datetime(-1, 1e6)
+        self.assertEqual(value, datetime.datetime.fromtimestamp(-1).replace(microsecond=999999))
+
+    def test_int_to_datetime_aware(self):
+        value = pdmodels.int_to_datetime(1432550134353845, 1e6, TOKYO)
+        self.assertEqual(value, datetime.datetime(2015, 5, 25, 19, 35, 34, 353845, tzinfo=TOKYO))
+        self.assertEqual(value.utcoffset(), datetime.timedelta(hours=9))
+
+    def test_precision(self):
+        self.assertEqual(pdmodels.int_to_datetime(1432550134353, 1e3, pdmodels.TIMEZONE_UTC),
+                         datetime.datetime(2015, 5, 25, 10, 35, 34, 353000))
+        self.assertEqual(pdmodels.int_to_datetime(1432550134, 1, pdmodels.TIMEZONE_UTC),
+                         datetime.datetime(2015, 5, 25, 10, 35, 34))
+        value = datetime.datetime(2015, 5, 25, 10, 35, 34, 353845)
+        self.assertEqual(pdmodels.datetime_to_int(value, 1e3), 1432550134353)
+        self.assertEqual(pdmodels.datetime_to_int(value, 1), 1432550134)
+
+    def test_datetime_to_int(self):
+        for stamp in STAMPS:
+            value = pdmodels.int_to_datetime(int(stamp), 1e6, pdmodels.TIMEZONE_UTC)
+            self.assertEqual(pdmodels.datetime_to_int(value, 1e6), int(stamp))
+            self.assertEqual(pdmodels.datetime_to_int(value.replace(tzinfo=UTC), 1e6), int(stamp))
+            self.assertEqual(pdmodels.datetime_to_int(value.replace(tzinfo=UTC).astimezone(TOKYO), 1e6), int(stamp))
+            self.assertEqual(pdmodels.datetime_to_int(value + datetime.timedelta(hours=9), 1e6, TOKYO), int(stamp))
+        value = datetime.datetime(2015, 5, 25, 10, 35, 34, 353845)
+        self.assertEqual(pdmodels.datetime_to_int(value, 1e6, pdmodels.TIMEZONE_LOCAL),
+                         int(time.mktime(value.timetuple())) * 1000000 + 353845)
+
+    def test_batch(self):
+        stamps = [int(stamp) for stamp in STAMPS]
+        values = pdmodels.ints_to_datetimes(stamps, 1e6, pdmodels.TIMEZONE_UTC)
+        self.assertEqual(values, [pdmodels.int_to_datetime(s, 1e6, pdmodels.TIMEZONE_UTC) for s in stamps])
+        self.assertEqual(pdmodels.datetimes_to_ints(values, 1e6), stamps)
+        self.assertEqual(pdmodels.ints_to_datetimes(stamps[:3], 1e6),
+                         [pdmodels.int_to_datetime(s, 1e6) for s in stamps[:3]])
+        self.assertEqual(pdmodels.ints_to_datetimes([1432550134353], 1e3, pdmodels.TIMEZONE_UTC),
+                         [datetime.datetime(2015, 5, 25, 10, 35, 34, 353000)])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_batch_numpy(self):
+        stamps = [int(stamp) for stamp in STAMPS]
+        values = pdmodels.ints_to_datetimes(stamps, 1e6, pdmodels.TIMEZONE_UTC, use_numpy=True)
+        self.assertEqual(values, pdmodels.ints_to_datetimes(stamps, 1e6, pdmodels.TIMEZONE_UTC))
+        self.assertTrue(all(type(v) is datetime.datetime for v in values))
+        self.assertEqual(pdmodels.datetimes_to_ints(values, 1e6, use_numpy=True), stamps)
+        self.assertEqual(pdmodels.datetimes_to_ints(values[:2], 1e3, use_numpy=True), [0, 0])
+
+    def test_field_timezone(self):
+        class Event(pdmodels.DefinedDict):
+            local = pdmodels.DateTimeField()
+            utc = pdmodels.DateTimeField(timezone=pdmodels.TIMEZONE_UTC)
+
+        document = Event.clean_document({"local": 1432550134353845, "utc": 1432550134353845})
+        self.assertEqual(document["utc"], datetime.datetime(2015, 5, 25, 10, 35, 34, 353845))
+        self.assertEqual(document["local"], pdmodels.int_to_datetime(1432550134353845, 1e6))
+
+    def test_storage(self):
+        class Event(JsonStorageMixin, pdmodels.DefinedDict):
+            DATETIME_TIMEZONE = pdmodels.TIMEZONE_UTC
+            at = pdmodels.DateTimeField()
+
+        value = datetime.datetime(2015, 5, 25, 10, 35, 34, 353845)
+        document = {"at": value}
+        Event.dumps_json(document)
+        self.assertEqual(document, {"at": 1432550134353845})
+        Event.loads_json(document)
+        self.assertEqual(document, {"at": value})
+        document = {"at": value.replace(tzinfo=TOKYO)}
+        Event.dumps_json(document)
+        self.assertEqual(document, {"at": 1432550134353845 - 9 * 3600 * 1000000})
+
+
+if __name__ == '__main__':
+    unittest.main()
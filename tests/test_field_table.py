@@ -0,0 +1,115 @@
+import datetime
+import unittest
+
+import pdmodels
+from pdmodels.extensions.labels import LabelMixin
+from pdmodels.extensions.storage import JsonStorageMixin
+from .test_compile import Everything
+
+
+class FieldTableTest(unittest.TestCase):
+
+    def test_kinds(self):
+        kinds = { entry.key: entry.kind for entry in Everything._field_table }
+        self.assertEqual(kinds["anything"], pdmodels.FieldEntry.KIND_VALUE)
+        self.assertEqual(kinds["when"], pdmodels.FieldEntry.KIND_DATETIME)
+        self.assertEqual(kinds["raw"], pdmodels.FieldEntry.KIND_DICT)
+        self.assertEqual(kinds["tags"], pdmodels.FieldEntry.KIND_LIST)
+        self.assertEqual(kinds["authors"], pdmodels.FieldEntry.KIND_MODEL_LIST)
+        self.assertEqual(kinds["scores"], pdmodels.FieldEntry.KIND_MAP)
+        self.assertEqual(kinds["by_name"], pdmodels.FieldEntry.KIND_MODEL_MAP)
+        self.assertEqual(kinds["author"], pdmodels.FieldEntry.KIND_MODEL)
+        self.assertEqual(kinds["product"], pdmodels.FieldEntry.KIND_VARIABLE)
+
+    def test_entries(self):
+        entries = { entry.key: entry for entry in Everything._field_table }
+        self.assertEqual([entry.key for entry in Everything._field_table], list(Everything._fields))
+        self.assertEqual(entries["string"].choices, frozenset(["a", "b"]))
+        self.assertIsNone(entries["anything"].choices)
+        self.assertEqual(entries["_stored"].store_key, "_stored")
+        self.assertIs(entries["authors"].model, entries["author"].model)
+        self.assertEqual(set(entries["product"].models), {"book", "pen"})
+        with self.assertRaises(AttributeError):
+            entries["string"].key = "other"
+
+    def test_list_choices(self):
+        class Choice(pdmodels.DefinedDict):
+            value = pdmodels.Field(choices=[1, [2]])
+        self.assertIsNone(Choice._field_table[0].choices)
+        self.assertEqual(Choice.get_document_errors({"value": [2]}), [])
+        self.assertEqual(Choice.get_document_errors({"value": 2}), [("value", "value", 2)])
+
+        class Choice(pdmodels.DefinedDict):
+            value = pdmodels.Field(choices=["a", "b"])
+        self.assertEqual(Choice.get_document_errors({"value": ["a"]}), [("value", "value", ["a"])])
+        self.assertEqual(Choice.get_document_errors({"value": "b"}), [])
+        self.assertFalse(Choice.is_document_valid({"value": {}}))
+
+    def test_add_field(self):
+        class Node(pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+        self.assertEqual(Node.get_document_errors({"child": {"name": 1}}), [])
+        Node.add_field("child", pdmodels.DefinedDictField(model=Node))
+        self.assertEqual(Node._field_table[-1].kind, pdmodels.FieldEntry.KIND_MODEL)
+        self.assertEqual(Node.get_document_errors({"child": {"name": 1}}), [("child.name", "type", 1)])
+
+    def test_add_field_nested(self):
+        class Child(pdmodels.DefinedDict):
+            a = pdmodels.IntField()
+
+        class Parent(pdmodels.DefinedDict):
+            c = pdmodels.DefinedDictField(model=Child)
+            children = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Child))
+
+        document = {"c": {"a": 1}, "children": [{"a": 2}]}
+        self.assertEqual(Parent.get_document_errors(document), [])
+        self.assertTrue(Parent.is_document_valid(document))
+        self.assertEqual(Parent.clean_document(dict(document)), document)
+        Child.add_field("b", pdmodels.IntField(is_required=True, default=0))
+        self.assertEqual(Parent.get_document_errors(document),
+                [("c.b", "required", None), ("children.0.b", "required", None)])
+        self.assertFalse(Parent.is_document_valid(document))
+        self.assertEqual(Parent.clean_document({"c": {"a": 1}})["c"], {"a": 1, "b": 0})
+
+    def test_labels(self):
+        class Inner(LabelMixin, pdmodels.DefinedDict):
+            secret = pdmodels.StringField(labels="private")
+            name = pdmodels.StringField()
+
+        class Outer(LabelMixin, pdmodels.DefinedDict):
+            token = pdmodels.StringField(labels=["private", "internal"])
+            inner = pdmodels.DefinedDictField(model=Inner)
+
+        self.assertEqual(Outer._field_table[0].labels, frozenset(["private", "internal"]))
+        document = {"token": "t", "inner": {"secret": "s", "name": "n"}}
+        Outer.clean_labels(document, "private")
+        self.assertEqual(document, {"inner": {"name": "n"}})
+        document = {"token": "t", "inner": {"secret": "s"}}
+        Outer.clean_labels(document, "private", exclude="internal")
+        self.assertEqual(document, {"token": "t", "inner": {}})
+
+    def test_storage(self):
+        class Inner(JsonStorageMixin, pdmodels.DefinedDict):
+            DATETIME_TIMEZONE = pdmodels.TIMEZONE_UTC
+            at = pdmodels.DateTimeField()
+
+        class Stored(JsonStorageMixin, pdmodels.DefinedDict):
+            id = pdmodels.StringField(store_field="_id")
+            kind = pdmodels.StringField(choices={"a": 1, "b": 2})
+            kinds = pdmodels.ListField(choices={"a": 1, "b": 2})
+            inner = pdmodels.DefinedDictField(model=Inner)
+            inners = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Inner))
+
+        at = datetime.datetime(2017, 5, 1, 10, 30, 15, 123456)
+        document = {"id": "x", "kind": "a", "kinds": ["b", "a"], "inner": {"at": at}, "inners": [{"at": at}]}
+        Stored.dumps_json(document)
+        stamp = 1493634615123456
+        self.assertEqual(document, {"_id": "x", "kind": 1, "kinds": [2, 1], "inner": {"at": stamp},
+                                    "inners": [{"at": stamp}]})
+        Stored.loads_json(document)
+        self.assertEqual(document, {"id": "x", "kind": "a", "kinds": ["b", "a"], "inner": {"at": at},
+                                    "inners": [{"at": at}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
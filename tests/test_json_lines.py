@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import pdmodels
+from pdmodels import __main__ as cli
+from . import test_base
+
+
+class TestModelBaseTest(unittest.TestCase, test_base.DictMixin, test_base.MoreAssertMixin):
+    pass
+
+
+class Item(pdmodels.DefinedDict):
+
+    name = pdmodels.StringField(is_required=True)
+    count = pdmodels.IntField(default=0)
+
+
+LINES = b'{"name": "a", "extra": 1}\n\n{"count": 3}\nnot json\n{"name": "b", "count": 2}\n'
+
+
+class JsonLinesTest(TestModelBaseTest):
+
+    def test_iter_clean(self):
+        documents = list(Item.iter_clean(io.BytesIO(LINES)))
+        self.assertEqual(documents, [{"name": "a", "count": 0}, {"name": None, "count": 3},
+            {"name": "b", "count": 2}])
+
+    def test_iter_validate(self):
+        valid, invalid = io.StringIO(), io.StringIO()
+        results = list(Item.iter_validate(io.StringIO(LINES.decode()), valid=valid, invalid=invalid))
+        self.assertLen(results, 4)
+        self.assertEqual(results[1], ({"name": None, "count": 3}, [("name", "required", None)]))
+        self.assertEqual(results[2], (None, [(None, "json", "not json\n")]))
+        self.assertEqual([ json.loads(l) for l in valid.getvalue().splitlines() ],
+                [{"name": "a", "count": 0}, {"name": "b", "count": 2}])
+        self.assertEqual(invalid.getvalue(), '{"count": 3, "name": null}\nnot json\n')
+
+    def test_not_object(self):
+        lines = b'[1, 2]\n3\n"x"\nnull\n{"name": "a"}\n'
+        self.assertEqual(list(Item.iter_clean(io.BytesIO(lines))), [{"name": "a", "count": 0}])
+        invalid = io.StringIO()
+        results = list(Item.iter_validate(io.StringIO(lines.decode()), invalid=invalid))
+        self.assertEqual(results, [
+            (None, [(None, "json", "[1, 2]\n")]),
+            (None, [(None, "json", "3\n")]),
+            (None, [(None, "json", '"x"\n')]),
+            (None, [(None, "json", "null\n")]),
+            ({"name": "a", "count": 0}, []),
+        ])
+        self.assertEqual(invalid.getvalue(), '[1, 2]\n3\n"x"\nnull\n')
+
+    def test_invalid_utf8(self):
+        invalid = io.StringIO()
+        results = list(Item.iter_validate(io.BytesIO(b'{"name": "\xff"}\n{"name": "a"}'), invalid=invalid))
+        self.assertEqual(results, [
+            (None, [(None, "json", b'{"name": "\xff"}\n')]),
+            ({"name": "a", "count": 0}, []),
+        ])
+        self.assertEqual(invalid.getvalue(), '{"name": "\ufffd"}\n')
+
+    def test_iter_validate_without_clean(self):
+        results = list(Item.iter_validate(io.BytesIO(b'{"name": "a", "extra": 1}'), clean=False))
+        self.assertEqual(results, [({"name": "a", "extra": 1}, [])])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [ os.path.join(directory, name) for name in ("in.jsonl", "valid.jsonl", "invalid.jsonl") ]
+            with open(paths[0], "wb") as f:
+                f.write(LINES)
+            code = cli.main(["tests.test_json_lines.Item", paths[0], "--valid", paths[1], "--invalid", paths[2]])
+            self.assertEqual(code, 1)
+            with open(paths[1]) as f:
+                self.assertLen(f.readlines(), 2)
+            with open(paths[2]) as f:
+                self.assertLen(f.readlines(), 2)
+
+    def test_load_model(self):
+        self.assertIs(cli.load_model("tests.test_json_lines.Item"), Item)
+        with self.assertRaises(ValueError):
+            cli.load_model("Item")
+
+    def test_loads_json(self):
+        from pdmodels.extensions.storage import JsonStorageMixin
+
+        class Stored(JsonStorageMixin, pdmodels.DefinedDict):
+            id = pdmodels.StringField(store_field="_id")
+            kind = pdmodels.StringField(choices={"a": 1, "b": 2})
+
+        valid = io.StringIO()
+        results = list(Stored.iter_validate(io.BytesIO(b'{"_id": "x", "kind": 2}'), loads_json=True, valid=valid))
+        self.assertEqual(results, [({"id": "x", "kind": "b"}, [])])
+        self.assertEqual(json.loads(valid.getvalue()), {"_id": "x", "kind": 2})
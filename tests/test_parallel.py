@@ -0,0 +1,99 @@
+import pickle
+import unittest
+
+import pdmodels
+from pdmodels.extensions.parallel import parallel_clean, parallel_validate
+from . import test_base
+
+
+class TestModelBaseTest(unittest.TestCase, test_base.DictMixin, test_base.MoreAssertMixin):
+    pass
+
+
+def make_models():
+    Author = pdmodels.DefinedDict.from_dict("Author", {
+        "name": pdmodels.StringField(is_required=True, regex="[A-Z]"),
+    })
+    Book = pdmodels.DefinedDict.from_dict("Book", {
+        "title": pdmodels.StringField(is_required=True),
+        "pages": pdmodels.IntField(min=1, default=1),
+        "genre": pdmodels.StringField(choices={"fiction", "poetry"}),
+        "author": pdmodels.DefinedDictField(model=Author),
+        "stored": pdmodels.StringField(dict_key="_stored", labels={"private"}),
+        "tags": pdmodels.MapField(inner_type=pdmodels.ListField(inner_type=pdmodels.StringField())),
+    })
+    return Author, Book
+
+
+class Base(object):
+
+    def describe(self):
+        return "base"
+
+
+class Checked(Base, pdmodels.DefinedDict):
+
+    value = pdmodels.IntField()
+
+    @classmethod
+    def get_document_errors(cls, document, **kwargs):
+        errors = super().get_document_errors(document, **kwargs)
+        if document.get("value") == 13:
+            errors.append(("value", "unlucky", 13))
+        return errors
+
+
+class SchemaTest(TestModelBaseTest):
+
+    def test_round_trip(self):
+        Author, Book = make_models()
+        with self.assertRaises(Exception):
+            pickle.dumps(Book)
+        Rebuilt = pdmodels.DefinedDict.from_schema(pickle.loads(pickle.dumps(Book.to_schema())))
+        self.assertEqual(list(Rebuilt._fields.keys()), list(Book._fields.keys()))
+        self.assertEqual(Rebuilt._fields["_stored"].labels, {"private"})
+
+        documents = [{}, {"title": 1, "pages": 0, "genre": "x", "author": {"name": "a"}, "tags": {"a": [1]}}]
+        for document in documents:
+            self.assertEqual(Rebuilt.get_document_errors(document), Book.get_document_errors(document))
+        self.assertEqual(Rebuilt.clean_document({"x": 1}), Book.clean_document({"x": 1}))
+
+    def test_import(self):
+        schema = pickle.loads(pickle.dumps(Checked.to_schema()))
+        self.assertEqual((schema["module"], schema["qualname"]), (__name__, "Checked"))
+        self.assertIs(pdmodels.DefinedDict.from_schema(schema), Checked)
+
+    def test_not_describable(self):
+        class Local(pdmodels.DefinedDict):
+            value = pdmodels.IntField()
+
+            @classmethod
+            def clean_document(cls, document, **kwargs):
+                return document
+        with self.assertRaisesRegex(ValueError, "clean_document"):
+            Local.to_schema()
+        class Derived(Base, pdmodels.DefinedDict):
+            value = pdmodels.IntField()
+        with self.assertRaisesRegex(ValueError, "describe"):
+            Derived.to_schema()
+
+
+class ParallelTest(TestModelBaseTest):
+
+    def test_parallel_validate(self):
+        Author, Book = make_models()
+        documents = [ {"title": str(i), "pages": i % 5} for i in range(250) ]
+        results = list(parallel_validate(Book, documents, chunk_size=7, max_workers=2))
+        self.assertEqual(results, [ Book.get_document_errors(d) for d in documents ])
+
+    def test_parallel_overridden(self):
+        documents = [ {"value": i} for i in range(20) ]
+        results = list(parallel_validate(Checked, documents, chunk_size=3, max_workers=2))
+        self.assertEqual(results[13], [("value", "unlucky", 13)])
+        self.assertEqual(sum(map(len, results)), 1)
+
+    def test_parallel_clean(self):
+        Author, Book = make_models()
+        documents = ( {"title": str(i), "extra": i} for i in range(100) )
+        results = list(parallel_clean(Book, documents, chunk_size=10, max_workers=2, set_default=False))
+        self.assertEqual(results, [ {"title": str(i), "tags": {}} for i in range(100) ])
@@ -0,0 +1,70 @@
+import unittest
+
+import pdmodels
+
+
+class Author(pdmodels.DefinedDict):
+    name = pdmodels.StringField(regex="[a-z]+$")
+
+
+class Book(pdmodels.DefinedDict):
+    type = pdmodels.StringField(fixed_value="book")
+    pages = pdmodels.IntField(min=1)
+
+
+class Order(pdmodels.DefinedDict):
+    id = pdmodels.StringField(is_required=True)
+    author = pdmodels.DefinedDictField(model=Author)
+    product = pdmodels.VariableDefinedDictField("type", {"book": Book})
+    scores = pdmodels.MapField(inner_type=pdmodels.IntField())
+
+
+class ProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        pdmodels.enable_profiling()
+        self.addCleanup(pdmodels.disable_profiling)
+
+    def counters(self):
+        return { (c["model"], c["key"], c["operation"]): c for c in pdmodels.get_profile() }
+
+    def test_errors(self):
+        document = {"author": {"name": "A"}, "product": {"type": "book", "pages": 0}, "scores": {"a": 1}}
+        self.assertEqual(len(Order.get_document_errors(document)), 3)
+        self.assertFalse(Order.is_document_valid(document))
+        counters = self.counters()
+        self.assertEqual(counters[("Order", "id", "errors")]["calls"], 2)
+        self.assertEqual(counters[("Order", "id", "errors")]["errors"], 2)
+        self.assertEqual(counters[("Order", "author", "errors")]["errors"], 2)
+        self.assertEqual(counters[("Author", "name", "errors")]["errors"], 2)
+        self.assertEqual(counters[("Book", "pages", "errors")]["calls"], 2)
+        self.assertEqual(counters[("Book", "pages", "errors")]["errors"], 2)
+        self.assertEqual(counters[("Order", "scores", "errors")]["errors"], 0)
+        self.assertGreater(counters[("Order", "scores", "errors")]["seconds"], 0)
+        self.assertGreaterEqual(counters[("Order", "author", "errors")]["seconds"],
+                                counters[("Author", "name", "errors")]["seconds"] / 2)
+
+    def test_clean_and_update(self):
+        document = Order.clean_document({"author": {}, "product": {"type": "book"}})
+        Order.update(document, {"id": "o1", "author": {"name": "b"}, "undefined": 1})
+        counters = self.counters()
+        self.assertEqual(counters[("Order", "product", "clean")]["calls"], 1)
+        self.assertEqual(counters[("Book", "pages", "clean")]["calls"], 1)
+        self.assertEqual(counters[("Author", "name", "clean")]["calls"], 1)
+        self.assertEqual(counters[("Order", "id", "update")]["calls"], 1)
+        self.assertEqual(counters[("Author", "name", "update")]["calls"], 1)
+        self.assertNotIn(("Order", "undefined", "update"), counters)
+
+    def test_reset_and_disable(self):
+        Order.get_document_errors({})
+        self.assertTrue(pdmodels.get_profile())
+        pdmodels.reset_profile()
+        self.assertEqual(pdmodels.get_profile(), [])
+        validator = Order._get_validator()
+        pdmodels.disable_profiling()
+        self.assertIsNot(Order._get_validator(), validator)
+        self.assertNotIn("clock", Order._get_validator()._source)
+        Order.get_document_errors({})
+        self.assertEqual(pdmodels.get_profile(), [])
+        pdmodels.enable_profiling()
+        self.assertIn("clock", Order._get_validator()._source)
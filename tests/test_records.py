@@ -0,0 +1,102 @@
+import collections.abc
+import datetime
+import pickle
+import tracemalloc
+import unittest
+
+import pdmodels
+from pdmodels.extensions.records import Record, RecordMixin
+
+
+class Author(pdmodels.DefinedDict):
+    name = pdmodels.StringField()
+    born = pdmodels.DateTimeField()
+
+
+class Book(pdmodels.DefinedDict):
+    type = pdmodels.StringField(fixed_value="book")
+    pages = pdmodels.IntField()
+
+
+class Order(RecordMixin, pdmodels.DefinedDict):
+    id = pdmodels.StringField(store_field="_id")
+    count = pdmodels.IntField()
+    keys = pdmodels.IntField()
+    author = pdmodels.DefinedDictField(model=Author)
+    authors = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Author))
+    by_name = pdmodels.MapField(inner_type=pdmodels.DefinedDictField(model=Author))
+    product = pdmodels.VariableDefinedDictField("type", {"book": Book})
+    tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+
+
+WHEN = datetime.datetime(2017, 5, 1, 10, 30)
+
+
+def make_document(i=0):
+    return Order.clean_document({"id": "o{0}".format(i), "count": i, "keys": 2, "author": {"name": "Ann", "born": WHEN},
+        "authors": [{"name": "Bob"}], "by_name": {"c": {"name": "Cat"}}, "product": {"type": "book", "pages": i},
+        "tags": ["a", "b"]})
+
+
+class RecordTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+        document = make_document()
+        record = Order.to_record(document)
+        self.assertIsInstance(record, Order.record_class())
+        self.assertIsInstance(record, collections.abc.Mapping)
+        self.assertEqual(record.to_dict(), document)
+        self.assertEqual(type(record.to_dict()["authors"][0]), dict)
+        self.assertEqual(record, document)
+        self.assertEqual(document, record)
+        self.assertEqual(pickle.loads(pickle.dumps(record)), document)
+
+    def test_mapping(self):
+        record = Order.to_record(make_document(3))
+        self.assertEqual(record["count"], 3)
+        self.assertEqual(record.count, 3)
+        self.assertEqual(record["keys"], 2)
+        self.assertEqual(record["author"]["name"], "Ann")
+        self.assertEqual(record.author.born, WHEN)
+        self.assertIsInstance(record["authors"][0], Record)
+        self.assertIsInstance(record["by_name"]["c"], Record)
+        self.assertEqual(record["product"].pages, 3)
+        self.assertEqual(list(record), list(make_document(3)))
+        self.assertEqual(len(record), len(make_document(3)))
+        self.assertIn("tags", record)
+        self.assertNotIn("unknown", record)
+        self.assertIsNone(record.get("unknown"))
+        with self.assertRaises(KeyError):
+            record["unknown"]
+        with self.assertRaises(AttributeError):
+            record.count = 1
+        with self.assertRaises(TypeError):
+            record["count"] = 1
+
+    def test_missing_and_undefined(self):
+        record = Order.to_record({"count": 1})
+        self.assertEqual(dict(record), {"count": 1})
+        self.assertEqual(record.to_dict(), {"count": 1})
+        with self.assertRaises(KeyError):
+            record["id"]
+        with self.assertRaises(pdmodels.DictFieldError):
+            Order.to_record({"count": 1, "other": 2})
+
+    def test_self_nesting(self):
+        class Node(RecordMixin, pdmodels.DefinedDict):
+            name = pdmodels.StringField()
+        Node.add_field("children", pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Node)))
+        document = {"name": "a", "children": [{"name": "b", "children": [{"name": "c"}]}]}
+        record = Node.to_record(document)
+        self.assertEqual(record.children[0].children[0].name, "c")
+        self.assertEqual(record.to_dict(), document)
+
+    def test_memory(self):
+        def allocated(make):
+            tracemalloc.start()
+            try:
+                values = [ make(make_document(i)) for i in range(1000) ]
+                return tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+        self.assertLess(allocated(Order.to_record), allocated(lambda document: document) * 0.75)
@@ -0,0 +1,71 @@
+import unittest
+
+import pdmodels
+from . import test_base
+
+
+class TestModelBaseTest(unittest.TestCase, test_base.DictMixin, test_base.MoreAssertMixin):
+    pass
+
+
+class Line(pdmodels.DefinedDict):
+
+    sku = pdmodels.StringField(is_required=True)
+    quantity = pdmodels.IntField(min=1)
+
+
+class Order(pdmodels.DefinedDict):
+
+    id = pdmodels.StringField(is_required=True)
+    lines = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Line))
+    notes = pdmodels.MapField(inner_type=pdmodels.StringField())
+
+
+class IndexBitmapTest(TestModelBaseTest):
+
+    def test_bitmap(self):
+        bitmap = pdmodels.IndexBitmap()
+        for index in (3, 0, 17, 3, 1000):
+            bitmap.add(index)
+        self.assertLen(bitmap, 4)
+        self.assertEqual(list(bitmap), [0, 3, 17, 1000])
+        self.assertIn(17, bitmap)
+        self.assertNotIn(16, bitmap)
+        self.assertNotIn(5000, bitmap)
+
+
+class ValidateManyTest(TestModelBaseTest):
+
+    def test_validate_many(self):
+        documents = [
+            {"id": "a", "lines": [{"sku": "x", "quantity": 1}]},
+            {"lines": [{"quantity": 0}, {"sku": "y", "quantity": -1}]},
+            {"id": "c", "notes": {"a": 1, "b": "ok"}},
+            {"id": "d"},
+        ]
+        report = Order.validate_many(iter(documents), max_samples=1)
+        self.assertEqual(report.total, 4)
+        self.assertFalse(report.is_valid)
+        self.assertEqual(list(report.invalid_documents), [1, 2])
+
+        quantity = report.errors[("lines.*.quantity", "value")]
+        self.assertEqual(quantity.count, 2)
+        self.assertEqual(quantity.samples, [0])
+        self.assertEqual(list(quantity.documents), [1])
+        self.assertEqual(report.errors[("id", "required")].count, 1)
+        self.assertEqual(report.errors[("lines.*.sku", "required")].count, 1)
+        self.assertEqual(report.errors[("notes.*", "type")].samples, [1])
+        self.assertLen(report.errors, 4)
+
+    def test_report_does_not_grow(self):
+        documents = ({"lines": [{"quantity": 0}] * 10} for _ in range(1000))
+        report = Order.validate_many(documents)
+        self.assertLen(report.errors, 3)
+        self.assertEqual(report.errors[("lines.*.quantity", "value")].count, 10000)
+        self.assertLen(report.errors[("lines.*.quantity", "value")].samples, 5)
+        self.assertLen(report.invalid_documents, 1000)
+
+    def test_to_dict(self):
+        report = Order.validate_many([{}])
+        self.assertEqual(report.to_dict(), {"total": 1, "invalid": 1, "errors": [
+            {"path": "id", "error_type": "required", "count": 1, "samples": [None], "documents": 1}]})
@@ -0,0 +1,244 @@
+import copy
+import datetime
+import json
+import unittest
+
+import pdmodels
+from pdmodels.extensions.storage import JsonStorageMixin, LazyDocument
+
+
+class Plain(pdmodels.DefinedDict):
+    at = pdmodels.DateTimeField()
+
+
+class Comment(JsonStorageMixin, pdmodels.DefinedDict):
+    id = pdmodels.StringField(store_field="_id")
+    at = pdmodels.DateTimeField()
+    mood = pdmodels.StringField(choices={"happy": 1, "sad": 2})
+
+
+class Audited(JsonStorageMixin, pdmodels.DefinedDict):
+    at = pdmodels.DateTimeField()
+
+    @classmethod
+    def dumps_json(cls, document):
+        super().dumps_json(document)
+        document["audited"] = True
+
+
+class Reply(JsonStorageMixin, pdmodels.DefinedDict):
+    id = pdmodels.StringField(store_field="_id")
+    at = pdmodels.DateTimeField(default=lambda field: WHEN)
+    kind = pdmodels.StringField(fixed_value="reply")
+    likes = pdmodels.ListField(ensure_list=True)
+
+
+class Post(JsonStorageMixin, pdmodels.DefinedDict):
+    id = pdmodels.StringField(store_field="_id")
+    title = pdmodels.StringField()
+    state = pdmodels.IntField(choices={"draft": 0, "published": 1})
+    tags = pdmodels.ListField(choices={"a": "x", "b": "y"})
+    created = pdmodels.DateTimeField()
+    updated = pdmodels.DateTimeField(store_field="_updated")
+    main = pdmodels.DefinedDictField(model=Comment)
+    comments = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Comment))
+    plain = pdmodels.DefinedDictField(model=Plain)
+    audited = pdmodels.DefinedDictField(model=Audited)
+    scores = pdmodels.MapField(inner_type=pdmodels.FloatField())
+    extra = pdmodels.DictField()
+    reply = pdmodels.DefinedDictField(model=Reply)
+    replies = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Reply), remove_none_value=True)
+    fixed_replies = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Reply), fixed_value=[{}])
+
+
+WHEN = datetime.datetime(2017, 5, 1, 10, 30, 15, 123456)
+
+DOCUMENTS = [
+    {},
+    {"id": "p1", "title": "Hello", "state": "draft", "tags": ["a", "b"], "created": WHEN, "updated": WHEN,
+     "main": {"id": "c0", "at": WHEN, "mood": "sad", "other": [1]},
+     "comments": [{"id": "c1", "at": WHEN, "mood": "happy"}, {"mood": None}, {}],
+     "plain": {"at": 1}, "audited": {"at": WHEN}, "scores": {"x": 1.5}, "extra": {"a": {"b": [1, 2]}},
+     "reply": {"id": "r1", "likes": None, "undefined": 1}, "replies": [{"at": WHEN}, None, {"id": "r2"}],
+     "fixed_replies": [{"id": "r3"}]},
+    {"undefined": 1, "id": "p2", "title": "café ☃ \"quoted\"\n", "more": None, "created": None,
+     "comments": []},
+    {"id": None, "updated": WHEN.replace(tzinfo=datetime.timezone.utc), "_id": "old", "state": "published"},
+    {"title": 1.0, "scores": {"nan": float("nan"), "inf": float("inf")}, "extra": {"x": True}},
+]
+
+
+class DumpsBytesTest(unittest.TestCase):
+
+    def test_identical(self):
+        for document in DOCUMENTS:
+            with self.subTest(document=document):
+                expected = copy.deepcopy(document)
+                Post.dumps_json(expected)
+                original = copy.deepcopy(document)
+                self.assertEqual(Post.dumps_bytes(document), json.dumps(expected).encode("utf-8"))
+                self.assertEqual(repr(document), repr(original))
+
+    def test_none(self):
+        self.assertEqual(Post.dumps_bytes(None), b"null")
+
+    def test_default(self):
+        class Holder(JsonStorageMixin, pdmodels.DefinedDict):
+            value = pdmodels.Field()
+        with self.assertRaises(TypeError):
+            Holder.dumps_bytes({"value": WHEN})
+        self.assertEqual(Holder.dumps_bytes({"value": WHEN}, default=str), json.dumps({"value": str(WHEN)}).encode("utf-8"))
+
+    def test_self_nesting(self):
+        class Node(JsonStorageMixin, pdmodels.DefinedDict):
+            id = pdmodels.StringField(store_field="_id")
+        Node.add_field("children", pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Node)))
+        document = {"id": "a", "children": [{"id": "b", "children": [{"id": "c"}]}]}
+        self.assertEqual(json.loads(Node.dumps_bytes(document)),
+                         {"children": [{"children": [{"_id": "c"}], "_id": "b"}], "_id": "a"})
+
+
+class CopyOnWriteTest(unittest.TestCase):
+
+    def test_dumps_json_copy(self):
+        for document in DOCUMENTS:
+            with self.subTest(document=document):
+                expected = copy.deepcopy(document)
+                Post.dumps_json(expected)
+                original = copy.deepcopy(document)
+                self.assertEqual(repr(Post.dumps_json_copy(document)), repr(expected))
+                self.assertEqual(repr(document), repr(original))
+
+    def test_loads_json_copy(self):
+        for document in DOCUMENTS:
+            with self.subTest(document=document):
+                stored = Post.dumps_json_copy(document)
+                expected = copy.deepcopy(stored)
+                Post.loads_json(expected)
+                original = copy.deepcopy(stored)
+                self.assertEqual(repr(Post.loads_json_copy(stored)), repr(expected))
+                self.assertEqual(repr(stored), repr(original))
+
+    def test_shared(self):
+        document = {"title": "t", "scores": {"x": 1.0}, "extra": {"a": [1]},
+                    "comments": [{"mood": "happy"}, {"id": None, "other": {}}], "main": {"other": []}}
+        dumped = Post.dumps_json_copy(document)
+        self.assertIsNot(dumped, document)
+        self.assertIs(dumped["scores"], document["scores"])
+        self.assertIs(dumped["extra"], document["extra"])
+        self.assertIs(dumped["main"], document["main"])
+        self.assertIsNot(dumped["comments"], document["comments"])
+        self.assertIs(dumped["comments"][1], document["comments"][1])
+        self.assertEqual(dumped["comments"][0], {"mood": 1})
+
+    def test_unchanged(self):
+        document = {"title": "t", "comments": [{"other": 1}], "main": {}}
+        self.assertIs(Post.dumps_json_copy(document), document)
+        self.assertIs(Post.loads_json_copy(document), document)
+        self.assertIsNone(Post.dumps_json_copy(None))
+
+    def test_overridden(self):
+        document = {"audited": {"at": WHEN}}
+        dumped = Post.dumps_json_copy(document)
+        self.assertEqual(dumped, {"audited": {"at": 1493634615123456, "audited": True}})
+        self.assertEqual(document, {"audited": {"at": WHEN}})
+
+
+class FromJsonBytesTest(unittest.TestCase):
+
+    def expected(self, data, clean=True):
+        document = json.loads(data)
+        Post.loads_json(document)
+        if clean:
+            Post.clean_document(document)
+        return document
+
+    def test_same(self):
+        for document in DOCUMENTS:
+            data = Post.dumps_bytes(document)
+            for buffer in (data, bytearray(data), memoryview(data), data.decode("utf-8")):
+                with self.subTest(document=document, buffer=type(buffer)):
+                    self.assertEqual(repr(Post.from_json_bytes(buffer)), repr(self.expected(data)))
+                    self.assertEqual(repr(Post.from_json_bytes(buffer, clean=False)), repr(self.expected(data, False)))
+
+    def test_defaults(self):
+        document = Post.from_json_bytes(b'{"reply": null, "title": "t"}')
+        self.assertEqual(document["reply"], None)
+        self.assertEqual(document["replies"], [])
+        self.assertEqual(document["fixed_replies"], [{"id": None, "at": WHEN, "kind": "reply", "likes": []}])
+        self.assertEqual(document, self.expected(b'{"reply": null, "title": "t"}'))
+
+    def test_validate(self):
+        document, errors = Reply.from_json_bytes(b'{"_id": 1, "at": 1493634615123456}', validate=True)
+        self.assertEqual(errors, [("id", "type", 1)])
+        self.assertEqual(document["at"], pdmodels.int_to_datetime(1493634615123456, 1e6))
+        with self.assertRaises(ValueError):
+            Post.from_json_bytes(b"{")
+
+
+class LazyTest(unittest.TestCase):
+
+    def canonical(self, document):
+        return json.dumps(document, sort_keys=True, default=repr)
+
+    def test_same(self):
+        documents = DOCUMENTS + [{"scores": {"x": None, "y": 1.0}, "comments": [{"at": WHEN}]}]
+        for document in documents:
+            with self.subTest(document=document):
+                stored = json.loads(Post.dumps_bytes(document))
+                original = copy.deepcopy(stored)
+                expected = Post.from_json_bytes(Post.dumps_bytes(document))
+                # each lazy document loads every field from the same stored document
+                for _ in range(2):
+                    lazy = Post.lazy(stored)
+                    self.assertEqual(sorted(lazy), sorted(expected))
+                    self.assertEqual(len(lazy), len(expected))
+                    self.assertEqual(self.canonical(lazy.materialize()), self.canonical(expected))
+                self.assertEqual(self.canonical(stored), self.canonical(original))
+
+    def test_on_access(self):
+        stored = Post.dumps_json_copy({"id": "p1", "state": "published", "updated": WHEN,
+            "main": {"id": "c0", "at": WHEN, "mood": "sad"}, "undefined": 1})
+        lazy = Post.lazy(stored)
+        self.assertEqual(lazy._values, {})
+        self.assertEqual(lazy["id"], "p1")
+        self.assertEqual(lazy["updated"], WHEN)
+        self.assertEqual(lazy["state"], "published")
+        self.assertEqual(sorted(lazy._values), ["id", "state", "updated"])
+        self.assertIsNone(lazy["title"])
+        self.assertEqual(lazy["comments"], [])
+        main = lazy["main"]
+        self.assertIsInstance(main, LazyDocument)
+        self.assertIs(lazy["main"], main)
+        self.assertEqual(main["mood"], "sad")
+        self.assertEqual(main["at"], WHEN)
+        self.assertEqual(lazy["reply"], {"id": None, "at": WHEN, "kind": "reply", "likes": []})
+        self.assertNotIn("undefined", lazy)
+        self.assertIsNone(lazy.get("undefined"))
+        with self.assertRaises(KeyError):
+            lazy["_id"]
+        with self.assertRaises(TypeError):
+            lazy["id"] = 1
+        self.assertEqual(stored["_updated"], 1493634615123456)
+        self.assertIsNone(Post.lazy(None))
+
+    def test_overridden(self):
+        class Loaded(JsonStorageMixin, pdmodels.DefinedDict):
+            at = pdmodels.DateTimeField()
+            comments = pdmodels.ListField(inner_type=pdmodels.DefinedDictField(model=Comment))
+
+            @classmethod
+            def loads_json(cls, document):
+                super().loads_json(document)
+                document["at"] = document["at"].replace(year=2000)
+        stored = {"at": 1493634615123456, "comments": [{"at": 1493634615123456}]}
+        for _ in range(2):
+            lazy = Loaded.lazy(stored)
+            self.assertEqual(lazy["at"], WHEN.replace(year=2000))
+            self.assertEqual(lazy.materialize(), {"at": WHEN.replace(year=2000),
+                "comments": [{"id": None, "at": WHEN, "mood": None}]})
+        self.assertEqual(stored, {"at": 1493634615123456, "comments": [{"at": 1493634615123456}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import copy
+import unittest
+
+import pdmodels
+from .test_compile import Author, Everything
+
+
+def errors_under(errors, paths):
+    """the errors of get_document_errors under one of paths"""
+    prefixes = [".".join(path) for path in paths]
+    return [error for error in errors
+            if any(error[0] == prefix or error[0].startswith(prefix + ".") for prefix in prefixes)]
+
+
+class UpdatePathsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.document = {
+            "required": 1,
+            "count": 3,
+            "raw": {"a": 1},
+            "scores": {"x": 1.0},
+            "author": {"name": "Ann"},
+            "by_name": {"ann": {"name": "Ann"}},
+            "product": {"type": "book", "isbn": "1234-AB"},
+        }
+
+    def update(self, new_value):
+        touched = set()
+        Everything.update(self.document, new_value, touched=touched)
+        return touched
+
+    def test_touched(self):
+        touched = self.update({
+            "count": 4,
+            "ratio": 1,
+            "raw": {"b": 2},
+            "scores": {"x": 2, "y": 3.0},
+            "author": {"born": 1},
+            "by_name": {"ann": {"name": "Anne"}, "bob": {"name": "Bob"}},
+            "product": {"isbn": "bad"},
+            "unknown": 1,
+        })
+        self.assertEqual(touched, {
+            ("count", ), ("ratio", ), ("raw", ), ("scores", "x"), ("scores", "y"),
+            ("author", "born"), ("by_name", "ann", "name"), ("by_name", "bob"),
+            ("product", "isbn"),
+        })
+        self.assertEqual(self.document["ratio"], 1.0)
+        self.assertEqual(self.document["scores"], {"x": 2.0, "y": 3.0})
+
+    def test_touched_replace(self):
+        touched = self.update({"product": {"type": "pen", "color": "green"}, "tags": ["a"]})
+        self.assertEqual(touched, {("product", ), ("tags", )})
+        touched = self.update({"scores": {}, "author": None})
+        self.assertEqual(touched, set())
+
+    def test_touched_new_map(self):
+        del self.document["scores"]
+        self.assertEqual(self.update({"scores": {"x": 1.0}}), {("scores", ), ("scores", "x")})
+
+    def test_update_without_touched(self):
+        expected = copy.deepcopy(self.document)
+        Everything.update(expected, {"count": 5, "author": {"born": 1}})
+        self.update({"count": 5, "author": {"born": 1}})
+        self.assertEqual(self.document, expected)
+
+    def test_validate_paths(self):
+        updates = [
+            {"count": -1},
+            {"author": {"name": 1, "born": "x"}},
+            {"scores": {"x": -1.0, "y": 2}},
+            {"by_name": {"ann": {"name": None}, "bob": {"born": 1}}},
+            {"product": {"isbn": "bad"}},
+            {"product": {"type": "pen", "color": "green"}},
+            {"product": {"type": "other"}},
+            {"raw": {"b": 2}, "flag": 1},
+        ]
+        for new_value in updates:
+            with self.subTest(new_value=new_value):
+                self.setUp()
+                touched = self.update(new_value)
+                expected = errors_under(Everything.get_document_errors(self.document), touched)
+                self.assertEqual(Everything.validate_paths(self.document, touched), expected)
+
+    def test_validate_paths_required(self):
+        document = {"author": {"name": "Ann"}}
+        Everything.update(document, {"author": {"name": None}})
+        self.assertEqual(Everything.validate_paths(document, [("author", "name")]),
+                         [("author.name", pdmodels.Field.ERROR_IS_REQUIRED, None)])
+        self.assertEqual(Everything.validate_paths(document, [("required", ), ("count", )]),
+                         [("required", pdmodels.Field.ERROR_IS_REQUIRED, None)])
+
+    def test_validate_paths_prefix(self):
+        document = {"author": {"name": 1, "born": "x"}}
+        errors = [("author.name", pdmodels.Field.ERROR_TYPE, 1),
+                  ("author.born", pdmodels.Field.ERROR_TYPE, "x")]
+        self.assertEqual(Everything.validate_paths(document, [("author", ), ("author", "born")]), errors)
+        self.assertEqual(Everything.validate_paths(document, [("author", "born"), ("author", )]), errors)
+        self.assertEqual(Everything.validate_paths(document, [("author", "born")]), errors[1:])
+        self.assertEqual(Everything.validate_paths(document, [("stored", )]), [])
+        self.assertEqual(Everything.validate_paths(document, [("_stored", )]),
+                         [("_stored", pdmodels.Field.ERROR_IS_REQUIRED, None)])
+        self.assertEqual(Everything.validate_paths(document, []), [])
+
+    def test_validate_paths_map_order(self):
+        document = {"scores": {"a": -1.0, "b": 1.0, "c": -3.0, "d": -2.0}}
+        touched = [("scores", "d"), ("scores", "missing"), ("scores", "a"), ("scores", "c")]
+        expected = errors_under(Everything.get_document_errors(document), [("scores", )])
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(Everything.validate_paths(document, touched), expected)
+        self.assertEqual(Everything.validate_paths(document, [("scores", "d")]), expected[2:])
+
+
+class ChangeSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.document = {
+            "count": 3,
+            "raw": {"a": 1},
+            "scores": {"x": 1.0},
+            "author": {"name": "Ann"},
+            "by_name": {"ann": {"name": "Ann"}},
+            "product": {"type": "book", "isbn": "1234-AB"},
+        }
+
+    def test_changes(self):
+        changes = Everything.update_with_changes(self.document, {
+            "count": 4,
+            "flag": True,
+            "raw": {"b": 2},
+            "scores": {"x": 1.0, "y": 3},
+            "author": {"name": None},
+            "by_name": {"ann": {"born": None}, "bob": {"name": "Bob"}},
+            "product": {"isbn": "4321-BA"},
+        })
+        self.assertEqual(changes.changes(), {
+            ("count", ): (3, 4),
+            ("flag", ): (pdmodels.ChangeSet.MISSING, True),
+            ("raw", ): ({"a": 1}, {"a": 1, "b": 2}),
+            ("scores", "y"): (pdmodels.ChangeSet.MISSING, 3),
+            ("author", "name"): ("Ann", None),
+            ("by_name", "bob"): (pdmodels.ChangeSet.MISSING, {"name": "Bob"}),
+            ("product", "isbn"): ("1234-AB", "4321-BA"),
+        })
+        self.assertEqual(changes.unset, [("author", "name")])
+        self.assertEqual(set(changes.set), {("count", ), ("flag", ), ("raw", ), ("scores", "y"),
+                                            ("by_name", "bob"), ("product", "isbn")})
+        self.assertIn(("scores", "x"), changes)
+        self.assertIn(("by_name", "ann", "born"), changes)
+
+    def test_type_switch(self):
+        changes = Everything.update_with_changes(self.document, {"product": {"type": "pen", "color": "red"}})
+        self.assertEqual(changes.set, {("product", ): {"type": "pen", "color": "red"}})
+        self.assertEqual(changes.changes()[("product", )][0], {"type": "book", "isbn": "1234-AB"})
+
+    def test_new_map(self):
+        del self.document["scores"]
+        changes = Everything.update_with_changes(self.document, {"scores": {"x": 1}})
+        self.assertEqual(list(changes), [("scores", )])
+        self.assertEqual(changes.set, {("scores", ): {"x": 1.0}})
+
+    def test_validate_changes(self):
+        changes = Everything.update_with_changes(self.document, {"count": -1, "author": {"name": 1}})
+        self.assertEqual(Everything.validate_paths(self.document, changes), [
+            ("count", pdmodels.Field.ERROR_VALUE, -1),
+            ("author.name", pdmodels.Field.ERROR_TYPE, 1),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
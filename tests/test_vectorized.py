@@ -0,0 +1,92 @@
+import random
+import unittest
+import warnings
+
+import pdmodels
+from . import test_base
+
+try:
+    from pdmodels.extensions.vectorized import VectorizedMixin
+except ImportError: # numpy is not installed
+    VectorizedMixin = None
+
+
+class TestModelBaseTest(unittest.TestCase, test_base.DictMixin, test_base.MoreAssertMixin):
+    pass
+
+
+@unittest.skipIf(VectorizedMixin is None, "numpy is not installed")
+class VectorizedMixinTest(TestModelBaseTest):
+
+    def make_model(self):
+        class Reading(VectorizedMixin, pdmodels.DefinedDict):
+            sensor = pdmodels.StringField(is_required=True, choices={"a", "b"})
+            value = pdmodels.FloatField(min=-1.5, max=100)
+            count = pdmodels.IntField(min=0, max=2**70)
+            level = pdmodels.IntField(min=0.5, max=9.5)
+            code = pdmodels.IntField(choices=[1, 2, 3])
+            ok = pdmodels.BoolField(is_required=True)
+            label = pdmodels.StringField(regex="[a-z]+$")
+            tags = pdmodels.ListField(inner_type=pdmodels.StringField())
+        return Reading
+
+    def random_value(self, rng):
+        return rng.choice([None, 0, 1, -2, 3, 10, 2**80, 1.5, -1.5, 100.0, 101.0, True, False,
+            "a", "b", "c", "abc", "A", [], ["x", 1], {}])
+
+    def test_equivalence(self):
+        Reading = self.make_model()
+        rng = random.Random(42)
+        keys = ["sensor", "value", "count", "level", "code", "ok", "label", "tags"]
+        documents = []
+        for _ in range(2000):
+            document = { key: self.random_value(rng) for key in keys if rng.random() < 0.8 }
+            documents.append(document)
+
+        expected = []
+        for document in documents:
+            try:
+                expected.append(Reading.get_document_errors(document))
+            except TypeError:
+                expected.append(None)
+        documents = [ d for d, e in zip(documents, expected) if e is not None ]
+        expected = [ e for e in expected if e is not None ]
+        self.assertEqual(Reading.get_documents_errors(documents), expected)
+
+    def test_valid_documents(self):
+        Reading = self.make_model()
+        documents = [{"sensor": "a", "value": float(i % 100), "count": i, "ok": True, "tags": ["x"]}
+                for i in range(1000)]
+        documents[500]["count"] = -1
+        errors = Reading.get_documents_errors(documents)
+        self.assertEqual(errors[500], [("count", "value", -1)])
+        self.assertEqual(sum(len(e) for e in errors), 1)
+
+    def test_nan(self):
+        class Sample(VectorizedMixin, pdmodels.DefinedDict):
+            value = pdmodels.FloatField(min=0, max=1)
+            ratio = pdmodels.FloatField(choices=[0.5, 1])
+        nan = float("nan")
+        documents = [{"value": nan, "ratio": nan}, {"value": 2.0, "ratio": 0.5}, {"value": 0.5, "ratio": 1.0}]
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            errors = Sample.get_documents_errors(documents)
+        self.assertEqual(errors, [ Sample.get_document_errors(d) for d in documents ])
+        self.assertEqual(errors[1], [("value", "value", 2.0)])
+        self.assertEqual(errors[2], [])
+
+    def test_typed_choices(self):
+        class Sample(VectorizedMixin, pdmodels.DefinedDict):
+            name = pdmodels.StringField(choices={"a": 1, "b": 2})
+            count = pdmodels.IntField(choices=[1, 2**70, True])
+            size = pdmodels.IntField(choices=[1, 3])
+            ratio = pdmodels.FloatField(choices=[0.5, 2**60, float("inf")])
+        documents = [
+            {"name": "a", "count": 1, "size": 3, "ratio": 0.5},
+            {"name": "a\x00", "count": 2**70, "size": True, "ratio": float(2**60)},
+            {"name": "c", "count": 2, "size": 2, "ratio": float("inf")},
+            {"name": "b", "count": 2**80, "size": False, "ratio": 0.25},
+        ]
+        errors = Sample.get_documents_errors(documents)
+        self.assertEqual(errors, [ Sample.get_document_errors(d) for d in documents ])
+        self.assertEqual([ len(e) for e in errors ], [0, 1, 3, 3])